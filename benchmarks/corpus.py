@@ -0,0 +1,155 @@
+"""corpus: Generate synthetic MIME emails for the benchmarks.
+
+Each profile sets the size of the plain text body, the weight of the HTML
+body, the number of extra text parts, and the number and size of
+attachments. The same seed always generates the same corpus.
+
+Example:
+
+    # Generate 100 emails with large HTML bodies
+    raws = generate_corpus(100, PROFILES["html_heavy"])
+
+    # Generate 10 emails with a custom shape
+    raws = generate_corpus(10, {"text_size": 2000, "html_size": 0,
+            "extra_parts": 3, "attachments": 1, "attachment_size": 50000})
+
+"""
+
+# Imports from other packages
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import random
+
+
+# The shapes of email generated for each benchmark profile
+PROFILES = {
+    "plain_small": {"text_size": 500, "html_size": 0, "extra_parts": 0,
+            "attachments": 0, "attachment_size": 0},
+    "multipart_typical": {"text_size": 2000, "html_size": 8000, "extra_parts": 0,
+            "attachments": 0, "attachment_size": 0},
+    "html_heavy": {"text_size": 2000, "html_size": 100000, "extra_parts": 0,
+            "attachments": 0, "attachment_size": 0},
+    "many_parts": {"text_size": 1000, "html_size": 4000, "extra_parts": 20,
+            "attachments": 0, "attachment_size": 0},
+    "attachments": {"text_size": 1000, "html_size": 4000, "extra_parts": 0,
+            "attachments": 2, "attachment_size": 256000},
+}
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+        "tempor incididunt ut labore et dolore magna aliqua").split()
+
+
+def generate_corpus(count, profile, seed=0):
+    """Generate a list of synthetic emails.
+
+    Args:
+        count (int): The number of emails to generate.
+        profile (dict): The shape of each email, with the keys text_size,
+            html_size, extra_parts, attachments and attachment_size. Sizes are
+            in bytes. An email with no HTML, extra parts or attachments is
+            generated as a single plain text part.
+        seed (int): The random seed. Defaults to 0.
+
+    Returns:
+        A list of the RFC822 source of each email, as bytes.
+
+    """
+
+    rand = random.Random(seed)
+    return [generate_email(i, profile, rand) for i in range(count)]
+
+
+def generate_email(index, profile, rand):
+    """Generate a single synthetic email.
+
+    Args:
+        index (int): The number of the email, used in its sender and file names.
+        profile (dict): The shape of the email, as in generate_corpus().
+        rand (random.Random): The random number generator to use.
+
+    Returns:
+        The RFC822 source of the email, as bytes.
+
+    """
+
+    text = make_text(profile["text_size"], rand)
+    simple = not (profile["html_size"] or profile["extra_parts"]
+            or profile["attachments"])
+    if simple:
+        msg = MIMEText(text)
+    else:
+        msg = MIMEMultipart("mixed")
+        body = MIMEMultipart("alternative")
+        body.attach(MIMEText(text))
+        if profile["html_size"]:
+            body.attach(MIMEText(make_html(profile["html_size"], rand), "html"))
+        msg.attach(body)
+        for _ in range(profile["extra_parts"]):
+            msg.attach(MIMEText(make_text(200, rand)))
+        for i in range(profile["attachments"]):
+            attachment = MIMEApplication(rand.randbytes(profile["attachment_size"])
+                    if hasattr(rand, "randbytes")
+                    else bytes(rand.getrandbits(8)
+                            for _ in range(profile["attachment_size"])))
+            attachment.add_header("Content-Disposition", "attachment",
+                    filename="bench_{}_{}.bin".format(index, i))
+            msg.attach(attachment)
+
+    msg["From"] = "Sender {0} <sender{0}@example.com>".format(index)
+    msg["To"] = "example+email_listener@email.com"
+    msg["Subject"] = "Benchmark email {}".format(index)
+    return msg.as_bytes()
+
+
+def make_text(size, rand):
+    """Generate plain text of about a size, in lines of words.
+
+    Args:
+        size (int): The size in bytes.
+        rand (random.Random): The random number generator to use.
+
+    Returns:
+        The text.
+
+    """
+
+    words = []
+    length = 0
+    while length < size:
+        word = rand.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return "\n".join(lines) + "\n"
+
+
+def make_html(size, rand):
+    """Generate HTML of about a size, with paragraphs, links and a table.
+
+    Args:
+        size (int): The size in bytes.
+        rand (random.Random): The random number generator to use.
+
+    Returns:
+        The HTML.
+
+    """
+
+    parts = ["<html><body>"]
+    length = 0
+    while length < size:
+        choice = rand.random()
+        if choice < 0.6:
+            part = "<p>{}</p>".format(make_text(200, rand).strip())
+        elif choice < 0.8:
+            part = '<p><a href="https://example.com/{}">{}</a> <b>{}</b></p>'.format(
+                    rand.randrange(10000), rand.choice(WORDS), rand.choice(WORDS))
+        else:
+            rows = "".join("<tr><td>{}</td><td>{}</td></tr>".format(
+                    rand.choice(WORDS), rand.randrange(1000)) for _ in range(5))
+            part = "<table>{}</table>".format(rows)
+        parts.append(part)
+        length += len(part)
+    parts.append("</body></html>")
+    return "\n".join(parts)
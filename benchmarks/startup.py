@@ -0,0 +1,88 @@
+"""startup: Benchmark the cold start time of the package and its command line.
+
+Each case runs in a fresh interpreter, so nothing is cached in sys.modules,
+and the median of several runs is reported.
+
+Example:
+
+    # Time each case 20 times
+    $ python benchmarks/startup.py --runs 20
+
+"""
+
+# Imports from other packages
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# The code run by each case, in a fresh interpreter
+CASES = {
+    "python": "pass",
+    "import email_listener": "import email_listener",
+    "import email_listener.cli": "import email_listener.cli",
+    "email-listener --help": ("import sys; sys.argv = ['email-listener', '--help']\n"
+            "from email_listener.cli import main\n"
+            "try:\n    main()\nexcept SystemExit:\n    pass"),
+    "import email_listener.email_responder": "import email_listener.email_responder",
+    "EmailListener": "from email_listener import EmailListener",
+}
+
+
+def time_case(code, runs):
+    """Time running a piece of code in fresh interpreters.
+
+    Args:
+        code (str): The code to run.
+        runs (int): The number of times to run it.
+
+    Returns:
+        A list of the wall clock times of each run, in seconds.
+
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main(argv=None):
+    """Time every case, and print the median of each.
+
+    Args:
+        argv (list): The command line arguments. Defaults to None, which uses
+            sys.argv.
+
+    Returns:
+        None
+
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10,
+            help="the number of runs per case (default: 10)")
+    parser.add_argument("--json", action="store_true",
+            help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {name: statistics.median(time_case(code, args.runs)) * 1000
+            for name, code in CASES.items()}
+    if args.json:
+        print(json.dumps({name: round(ms, 1) for name, ms in results.items()}))
+    else:
+        for name, ms in results.items():
+            print("{:<40} {:>8.1f} ms".format(name, ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""throughput: Benchmark the throughput and peak memory of each processing stage.
+
+Each case is run against a synthetic corpus from every profile in
+corpus.PROFILES. Emails are fetched from a local FakeIMAPServer and sent to a
+local FakeSMTPServer, so no account or network is needed. Each case is timed
+over several runs without tracing, and then run once more under tracemalloc
+for its peak memory.
+
+Results can be saved as a JSON baseline, and later results compared against
+it, to catch regressions between versions.
+
+Example:
+
+    # Run every case, and save the results as a baseline
+    $ python benchmarks/throughput.py --save benchmarks/baselines/1.2.json
+
+    # Run only the parser on the HTML heavy corpus, and compare it against the
+    # baseline, failing if it's more than 20% slower
+    $ python benchmarks/throughput.py --case parse --profile html_heavy \
+            --compare benchmarks/baselines/1.2.json --tolerance 0.2
+
+"""
+
+# Imports from other packages
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Imports from this package
+from corpus import generate_corpus, make_html, make_text, PROFILES
+from email_listener.archive import ArchiveWriter
+from email_listener.email_processing import write_json_file, write_txt_file
+from email_listener.email_responder import EmailResponder
+from email_listener.fake_server import FakeIMAPServer, FakeSMTPServer
+from email_listener.jsonl_sink import JSONLSink
+from email_listener.listener import EmailListener
+from email_listener.parsing import parse_message
+from email_listener.sqlite_sink import SQLiteSink
+
+
+EMAIL = "bench@example.com"
+PASSWORD = "password"
+FOLDER = "email_listener"
+
+
+class Bench:
+    """Bench object holding the corpus and servers shared by the cases.
+
+    Attributes:
+        profile (dict): The corpus profile.
+        raws (list): The RFC822 source of each email in the corpus.
+        work_dir (str): A temporary directory for the case outputs.
+        imap (FakeIMAPServer): The IMAP server scraped from.
+        smtp (FakeSMTPServer): The SMTP server sent to.
+
+    """
+
+    def __init__(self, profile, count):
+        """Initialize a Bench instance, starting its servers.
+
+        Args:
+            profile (dict): The corpus profile.
+            count (int): The number of emails in the corpus.
+
+        Returns:
+            None
+
+        """
+
+        self.profile = profile
+        self.raws = generate_corpus(count, profile)
+        self.work_dir = tempfile.mkdtemp(prefix="el_bench_")
+        self.imap = FakeIMAPServer()
+        self.imap.add_account(EMAIL, PASSWORD)
+        self.imap.start()
+        self.smtp = FakeSMTPServer()
+        self.smtp.start()
+        self.__runs = 0
+        self.__parsed = None
+
+
+    def close(self):
+        """Stop the servers and remove the work directory.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.imap.stop()
+        self.smtp.stop()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+    def new_dir(self):
+        """Create an empty output directory for one run.
+
+        Args:
+            None
+
+        Returns:
+            The path of the directory.
+
+        """
+
+        self.__runs += 1
+        path = os.path.join(self.work_dir, "run{}".format(self.__runs))
+        os.mkdir(path)
+        return path
+
+
+    def parsed(self):
+        """Get the corpus parsed into the dictionary scrape() returns.
+
+        Args:
+            None
+
+        Returns:
+            A dictionary of the parsed emails, keyed by "<uid>_<sender>".
+
+        """
+
+        if self.__parsed is None:
+            attachment_dir = self.new_dir()
+            self.__parsed = {}
+            for uid, raw in enumerate(self.raws, 1):
+                key, val_dict = parse_message(uid, raw, attachment_dir)
+                self.__parsed[key] = val_dict
+        return self.__parsed
+
+
+    def setup_scrape(self):
+        """Deliver the corpus to a new folder, and log a listener into it.
+
+        Args:
+            None
+
+        Returns:
+            The logged in EmailListener.
+
+        """
+
+        folder = "{}{}".format(FOLDER, self.__runs)
+        self.imap.create_folder(EMAIL, folder)
+        for raw in self.raws:
+            self.imap.deliver(EMAIL, folder, raw)
+        listener = EmailListener(EMAIL, PASSWORD, folder, self.new_dir())
+        listener.login(host=self.imap.host, port=self.imap.port, use_ssl=False)
+        return listener
+
+
+def case_scrape(bench):
+    """Benchmark scraping the corpus from the IMAP server."""
+
+    listener = bench.setup_scrape()
+    try:
+        start = time.perf_counter()
+        listener.scrape()
+        return time.perf_counter() - start
+    finally:
+        listener.logout()
+
+
+def case_parse(bench):
+    """Benchmark parsing the corpus with the multipart parser."""
+
+    attachment_dir = bench.new_dir()
+    start = time.perf_counter()
+    for uid, raw in enumerate(bench.raws, 1):
+        parse_message(uid, raw, attachment_dir)
+    return time.perf_counter() - start
+
+
+def case_write_txt(bench):
+    """Benchmark writing the parsed corpus to text files."""
+
+    msgs = bench.parsed()
+    listener = EmailListener(EMAIL, PASSWORD, FOLDER, bench.new_dir())
+    start = time.perf_counter()
+    write_txt_file(listener, msgs)
+    return time.perf_counter() - start
+
+
+def case_write_json(bench):
+    """Benchmark writing the parsed corpus to JSON files."""
+
+    msgs = bench.parsed()
+    listener = EmailListener(EMAIL, PASSWORD, FOLDER, bench.new_dir())
+    start = time.perf_counter()
+    write_json_file(listener, msgs)
+    return time.perf_counter() - start
+
+
+def case_write_json_threads(bench):
+    """Benchmark writing the parsed corpus to JSON files in 4 threads."""
+
+    msgs = bench.parsed()
+    listener = EmailListener(EMAIL, PASSWORD, FOLDER, bench.new_dir())
+    start = time.perf_counter()
+    write_json_file(listener, msgs, workers=4)
+    return time.perf_counter() - start
+
+
+def case_write_jsonl(bench):
+    """Benchmark appending the parsed corpus to a JSON lines sink."""
+
+    msgs = bench.parsed()
+    listener = EmailListener(EMAIL, PASSWORD, FOLDER, bench.new_dir())
+    sink = JSONLSink(listener.attachment_dir)
+    try:
+        start = time.perf_counter()
+        sink(listener, msgs)
+        return time.perf_counter() - start
+    finally:
+        sink.close()
+
+
+def case_write_sqlite(bench):
+    """Benchmark writing the parsed corpus to an SQLite sink."""
+
+    msgs = bench.parsed()
+    listener = EmailListener(EMAIL, PASSWORD, FOLDER, bench.new_dir())
+    sink = SQLiteSink(os.path.join(listener.attachment_dir, "emails.db"))
+    try:
+        start = time.perf_counter()
+        sink(listener, msgs)
+        return time.perf_counter() - start
+    finally:
+        sink.close()
+
+
+def case_write_archive(bench):
+    """Benchmark appending the parsed corpus to a gzip archive."""
+
+    msgs = bench.parsed()
+    listener = EmailListener(EMAIL, PASSWORD, FOLDER, bench.new_dir())
+    archive = ArchiveWriter(os.path.join(listener.attachment_dir,
+            "emails.jsonl.gz"))
+    try:
+        start = time.perf_counter()
+        archive(listener, msgs)
+        return time.perf_counter() - start
+    finally:
+        archive.close()
+
+
+def case_send(bench):
+    """Benchmark sending a multipart email per corpus email to the SMTP server."""
+
+    import random
+
+    rand = random.Random(0)
+    profile = bench.profile
+    text = make_text(profile["text_size"], rand)
+    html = make_html(profile["html_size"], rand) if profile["html_size"] else None
+    attachments = []
+    attachment_dir = bench.new_dir()
+    for i in range(profile["attachments"]):
+        path = os.path.join(attachment_dir, "attachment{}.bin".format(i))
+        with open(path, "wb") as file:
+            file.write(os.urandom(profile["attachment_size"]))
+        attachments.append(path)
+
+    responder = EmailResponder(EMAIL, PASSWORD)
+    responder.login(host=bench.smtp.host, port=bench.smtp.port, use_ssl=False)
+    try:
+        start = time.perf_counter()
+        for i in range(len(bench.raws)):
+            responder.send_multipart_msg("other@example.com",
+                    "Benchmark email {}".format(i), text, html=html,
+                    attachments=attachments)
+        return time.perf_counter() - start
+    finally:
+        responder.logout()
+        bench.smtp.messages.clear()
+
+
+# The benchmark cases, each taking a Bench and returning the seconds it took
+CASES = {
+    "scrape": case_scrape,
+    "parse": case_parse,
+    "write_txt_file": case_write_txt,
+    "write_json_file": case_write_json,
+    "write_json_file_threads": case_write_json_threads,
+    "write_jsonl": case_write_jsonl,
+    "write_sqlite": case_write_sqlite,
+    "write_archive": case_write_archive,
+    "send_multipart_msg": case_send,
+}
+
+
+def run_case(func, bench, runs):
+    """Run a case several times, and once more under tracemalloc.
+
+    Args:
+        func (function): The case function.
+        bench (Bench): The corpus and servers to run it with.
+        runs (int): The number of timed runs.
+
+    Returns:
+        A dictionary of the median messages per second, the median seconds
+        per run, and the peak traced memory in bytes.
+
+    """
+
+    count = len(bench.raws)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        times = [func(bench) for _ in range(runs)]
+        tracemalloc.start()
+        try:
+            func(bench)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    seconds = statistics.median(times)
+    return {"msgs_per_sec": round(count / seconds, 1),
+            "seconds": round(seconds, 4), "peak_bytes": peak}
+
+
+def compare(results, baseline, tolerance):
+    """Compare results against a baseline.
+
+    Args:
+        results (dict): The results, keyed by "<case>/<profile>".
+        baseline (dict): The baseline results, in the same form.
+        tolerance (float): The fraction a result can be slower, or use more
+            memory, than its baseline before it counts as a regression.
+
+    Returns:
+        A list of (key, metric, baseline value, new value, change) tuples for
+        every regression.
+
+    """
+
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        speed = result["msgs_per_sec"] / base["msgs_per_sec"] - 1
+        if speed < -tolerance:
+            regressions.append((key, "msgs_per_sec", base["msgs_per_sec"],
+                    result["msgs_per_sec"], speed))
+        memory = result["peak_bytes"] / max(base["peak_bytes"], 1) - 1
+        if memory > tolerance:
+            regressions.append((key, "peak_bytes", base["peak_bytes"],
+                    result["peak_bytes"], memory))
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmarks, and save or compare the results.
+
+    Args:
+        argv (list): The command line arguments. Defaults to None, which uses
+            sys.argv.
+
+    Returns:
+        The exit code, which is 1 if a comparison found a regression.
+
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--case", action="append", choices=sorted(CASES),
+            help="a case to run (repeatable, default: all)")
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES),
+            help="a corpus profile to run (repeatable, default: all)")
+    parser.add_argument("--count", type=int, default=50,
+            help="the number of emails in each corpus (default: 50)")
+    parser.add_argument("--runs", type=int, default=3,
+            help="the number of timed runs per case (default: 3)")
+    parser.add_argument("--save", help="save the results as a JSON baseline")
+    parser.add_argument("--compare", help="a JSON baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+            help="the allowed slowdown or memory growth before a result is "
+            "a regression (default: 0.1)")
+    parser.add_argument("--json", action="store_true",
+            help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for profile_name in args.profile or PROFILES:
+        bench = Bench(PROFILES[profile_name], args.count)
+        try:
+            for case_name in args.case or CASES:
+                key = "{}/{}".format(case_name, profile_name)
+                results[key] = run_case(CASES[case_name], bench, args.runs)
+                if not args.json:
+                    print("{:<40} {:>10.1f} msgs/s {:>10.1f} KiB peak".format(key,
+                            results[key]["msgs_per_sec"],
+                            results[key]["peak_bytes"] / 1024))
+        finally:
+            bench.close()
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+
+    if args.save:
+        with open(os.path.join(ROOT, "setup.py"), "r") as file:
+            version = next((line.split("'")[1] for line in file
+                    if line.strip().startswith("version=")), None)
+        with open(args.save, "w") as file:
+            json.dump({"version": version, "python": platform.python_version(),
+                    "platform": platform.platform(), "count": args.count,
+                    "results": results}, file, indent=4)
+            file.write("\n")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for key, metric, old, new, change in regressions:
+            print("REGRESSION {} {}: {} -> {} ({:+.0%})".format(key, metric, old,
+                    new, change))
+        if regressions:
+            return 1
+        print("No regressions against {} (version {}).".format(args.compare,
+                baseline.get("version")))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""Run the email-listener command line interface with python -m email_listener."""
+
+# Imports from other packages
+import sys
+# Imports from this package
+from .cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,431 @@
+"""archive: Compressed archives of scraped emails and their raw RFC822 source.
+
+Each batch of emails is compressed as one gzip member or zstd frame, through
+one compressor, rather than a compressor per email. Every entry is a JSON
+header line, followed, for raw source, by the bytes of the source. gzip is
+always available, and zstd needs the zstandard package, installed with the
+zstd extra.
+
+Example:
+
+    # Archive each batch of parsed emails, as the process function
+    archive = ArchiveWriter("./files/emails.jsonl.zst")
+    listener.listen(60, process_func=archive)
+    archive.close()
+
+    # Or keep an archive in the attachment_dir, compressed with zstd
+    listener.listen(60, process_func=functools.partial(write_archive_file,
+            codec="zstd"))
+
+    # Archive the raw source of every scraped email as well
+    listener.raw_archive = ArchiveWriter("./files/raw.gz")
+
+    # Read the archives back, one entry at a time
+    for entry in read_archive("./files/emails.jsonl.zst"):
+        print(entry["key"], entry["data"]["Subject"])
+    for entry in read_archive("./files/raw.gz"):
+        email_message = email.message_from_bytes(entry["raw"])
+
+"""
+
+# Imports from other packages
+import atexit
+import functools
+import gzip
+import io
+import json
+import os
+import threading
+import zlib
+
+
+# The codec used for each file extension
+EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+# The bytes each gzip member or zstd frame starts with
+MAGIC = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+
+# The extension of the file holding where an archive's last flushed batch ends
+END_EXTENSION = ".end"
+
+# The sinks used by write_archive_file(), keyed by archive path
+_archives = {}
+
+
+def zstd_available():
+    """Check whether the zstandard package is installed.
+
+    Args:
+        None
+
+    Returns:
+        True if zstd archives can be written and read.
+
+    """
+
+    try:
+        import zstandard
+    except ImportError:
+        return False
+    return True
+
+
+def codec_for(path):
+    """Get the codec of an archive from its file extension.
+
+    Args:
+        path (str): The file path of the archive.
+
+    Returns:
+        "gzip" or "zstd".
+
+    """
+
+    codec = EXTENSIONS.get(os.path.splitext(path)[1])
+    if codec is None:
+        raise ValueError("archive paths must end in one of {}".format(
+                ", ".join(EXTENSIONS)))
+    return codec
+
+
+class ArchiveWriter:
+    """ArchiveWriter object for appending emails to a compressed archive.
+
+    Parsed emails are written as {"key": ..., "folder": ..., "data": ...}
+    headers. Raw source is written as a {"key": ..., "length": ...} header,
+    with any extra details such as the folder and UID, followed by the source
+    and a newline.
+
+    Everything written until flush() is called is compressed as one gzip
+    member or zstd frame, which flush() completes, so a crash only loses the
+    batch being written. A batch left incomplete by a crash is cut off the
+    archive when it is next opened, before any more batches are appended after
+    it. The listener flushes its raw_archive after each scrape, and calling
+    the writer as a process function flushes it after each batch.
+
+    Where the last flushed batch ends is kept in <path>.end, so opening the
+    archive only checks what was written after it, rather than decompressing
+    the whole archive.
+
+    Attributes:
+        path (str): The file path of the archive.
+        codec (str): "gzip" or "zstd", from the path's extension.
+        level (int): The compression level.
+
+    """
+
+    def __init__(self, path, level=None):
+        """Initialize an ArchiveWriter instance, opening the archive for appending.
+
+        Args:
+            path (str): The file path of the archive, ending in .gz for gzip
+                or .zst for zstd.
+            level (int): The compression level. Defaults to None, which uses 6
+                for gzip and 3 for zstd.
+
+        Returns:
+            None
+
+        """
+
+        self.path = path
+        self.codec = codec_for(path)
+        self.__lock = threading.Lock()
+        self.__end_path = path + END_EXTENSION
+        # Cut off any batch left incomplete by a crash
+        if os.path.exists(path):
+            end = complete_length(path, self.__flushed_end())
+            if os.path.getsize(path) > end:
+                with open(path, "rb+") as file:
+                    file.truncate(end)
+        self.__file = open(path, "ab")
+        self.__stream = None
+        if self.codec == "gzip":
+            self.level = 6 if level is None else level
+        else:
+            import zstandard
+            self.level = 3 if level is None else level
+            # One stream writer is kept, with a frame ended at each flush
+            compressor = zstandard.ZstdCompressor(level=self.level)
+            self.__zstd = compressor.stream_writer(self.__file, closefd=False)
+
+
+    def __call__(self, email_listener, msg_dict):
+        """Archive a batch of parsed emails, so the writer can be a process function.
+
+        Args:
+            email_listener (EmailListener): The EmailListener object this
+                function is used with.
+            msg_dict (dict): The dictionary of email message data returned by
+                the scraping function.
+
+        Returns:
+            A list of the keys archived.
+
+        """
+
+        keys = self.write_records(msg_dict, getattr(email_listener, "folder", None))
+        self.flush()
+        return keys
+
+
+    def write_records(self, msg_dict, folder=None):
+        """Archive parsed emails.
+
+        Args:
+            msg_dict (dict): The emails, keyed by key, as returned by scrape().
+            folder (str): The folder the emails came from. Defaults to None.
+
+        Returns:
+            A list of the keys archived.
+
+        """
+
+        with self.__lock:
+            stream = self.__member()
+            for key, val_dict in msg_dict.items():
+                stream.write(json.dumps({"key": key, "folder": folder,
+                        "data": val_dict}, separators=(",", ":")).encode("utf-8")
+                        + b"\n")
+        return list(msg_dict)
+
+
+    def write_raw(self, key, raw, **details):
+        """Archive the raw source of an email.
+
+        Args:
+            key (str): The email's key.
+            raw (bytes): The RFC822 source of the email.
+            **details (dict): Anything else to store in the entry's header,
+                such as the folder, UID and INTERNALDATE.
+
+        Returns:
+            None
+
+        """
+
+        header = dict(details, key=key, length=len(raw))
+        line = json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self.__lock:
+            stream = self.__member()
+            stream.write(line)
+            stream.write(raw)
+            stream.write(b"\n")
+
+
+    def flush(self):
+        """Complete the current gzip member or zstd frame, and flush it to the file.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            if self.__stream is None:
+                return
+            if self.codec == "gzip":
+                self.__stream.close()
+            else:
+                import zstandard
+                self.__stream.flush(zstandard.FLUSH_FRAME)
+            self.__stream = None
+            self.__file.flush()
+            # Replaced whole, so a crash never leaves part of an offset
+            temp_path = self.__end_path + ".tmp"
+            with open(temp_path, "w") as file:
+                file.write(str(self.__file.tell()))
+            os.replace(temp_path, self.__end_path)
+
+
+    def close(self):
+        """Flush and close the archive.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.flush()
+        with self.__lock:
+            if self.codec == "zstd":
+                self.__zstd.close()
+            self.__file.close()
+
+
+    def __flushed_end(self):
+        """Helper function, reads where the archive's last flushed batch ends.
+
+        Args:
+            None
+
+        Returns:
+            The offset, or 0 if it isn't recorded.
+
+        """
+
+        try:
+            with open(self.__end_path, "r") as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return 0
+
+
+    def __member(self):
+        """Helper function, gets the compressor of the current batch, starting one if needed.
+
+        Args:
+            None
+
+        Returns:
+            A writable compressed stream.
+
+        """
+
+        if self.__stream is None:
+            if self.codec == "gzip":
+                self.__stream = gzip.GzipFile(fileobj=self.__file, mode="wb",
+                        compresslevel=self.level)
+            else:
+                self.__stream = self.__zstd
+        return self.__stream
+
+
+def complete_length(path, start=0):
+    """Find where the last complete gzip member or zstd frame of an archive ends.
+
+    The archive is decompressed to find the end of each member or frame, but
+    the decompressed data isn't kept.
+
+    Args:
+        path (str): The file path of the archive.
+        start (int): The offset of a member or frame to start from, such as
+            the end of the last batch known to be complete. If it isn't the
+            start of one, such as if the archive was replaced, the whole
+            archive is checked. Defaults to 0.
+
+    Returns:
+        The length of the archive up to the end of its last complete member or
+        frame.
+
+    """
+
+    codec = codec_for(path)
+    if codec == "gzip":
+        # A wbits of 31 reads a gzip header and trailer
+        new_decompressor = functools.partial(zlib.decompressobj, 31)
+        errors = (zlib.error,)
+    else:
+        import zstandard
+        new_decompressor = zstandard.ZstdDecompressor().decompressobj
+        errors = (zstandard.ZstdError,)
+
+    magic = MAGIC[codec]
+    decompressor = None
+    with open(path, "rb") as file:
+        file.seek(start)
+        if (start > os.fstat(file.fileno()).st_size
+                or not magic.startswith(file.read(len(magic)))):
+            start = 0
+        file.seek(start)
+        end = offset = start
+        for chunk in iter(lambda: file.read(2**20), b""):
+            while chunk:
+                if decompressor is None:
+                    decompressor = new_decompressor()
+                try:
+                    decompressor.decompress(chunk)
+                except errors:
+                    # A damaged member or frame ends the archive
+                    return end
+                if not decompressor.eof:
+                    offset += len(chunk)
+                    break
+                # The member or frame ended part way through the chunk
+                offset += len(chunk) - len(decompressor.unused_data)
+                end = offset
+                chunk = decompressor.unused_data
+                decompressor = None
+    return end
+
+
+def read_archive(path):
+    """Read the entries of an archive lazily, one at a time.
+
+    A batch left incomplete or damaged by a crash ends the archive.
+
+    Args:
+        path (str): The file path of the archive.
+
+    Yields:
+        The header dictionary of each entry. Raw source entries also hold the
+        source, as bytes, under "raw".
+
+    """
+
+    if codec_for(path) == "gzip":
+        stream = gzip.open(path, "rb")
+        # gzip raises BadGzipFile, an OSError, for a damaged member header
+        errors = (EOFError, OSError, zlib.error)
+    else:
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"),
+                read_across_frames=True)
+        stream = io.BufferedReader(reader)
+        errors = (EOFError, zstandard.ZstdError)
+    with stream:
+        while True:
+            try:
+                line = stream.readline()
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "length" in entry:
+                    entry["raw"] = stream.read(entry["length"])
+                    if (len(entry["raw"]) != entry["length"]
+                            or stream.read(1) != b"\n"):
+                        return
+            except errors:
+                return
+            except ValueError:
+                # A partly written header line
+                return
+            yield entry
+
+
+def write_archive_file(email_listener, msg_dict, codec="gzip"):
+    """Append the email message data returned from scrape to a compressed archive.
+
+    An ArchiveWriter is kept for the emails.jsonl archive in each
+    attachment_dir, emails.jsonl.gz for gzip or emails.jsonl.zst for zstd.
+
+    Args:
+        email_listener (EmailListener): The EmailListener object this function
+            is used with.
+        msg_dict (dict): The dictionary of email message data returned by the
+            scraping function.
+        codec (str): "gzip" or "zstd". Defaults to "gzip".
+
+    Returns:
+        A list of the keys archived.
+
+    """
+
+    extensions = {codec: extension for extension, codec in EXTENSIONS.items()}
+    if codec not in extensions:
+        raise ValueError("codec must be one of {}".format(", ".join(extensions)))
+    path = os.path.join(email_listener.attachment_dir,
+            "emails.jsonl" + extensions[codec])
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = ArchiveWriter(path)
+        atexit.register(archive.close)
+    return archive(email_listener, msg_dict)
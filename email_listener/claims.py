@@ -0,0 +1,90 @@
+"""claims: IMAP keywords for claiming emails between several listeners.
+
+A listener claims an email by adding a keyword holding the time of the claim,
+with a conditional STORE (RFC 7162 UNCHANGEDSINCE), so only one of several
+listeners racing for the same email succeeds. A claim older than the claim
+timeout is stale, and the email can be claimed again.
+
+Example:
+
+    # Create the keyword for a claim made now
+    keyword = claim_keyword(time.time())
+
+    # Get the time a claim was made from its keyword, or None for other flags
+    claimed_at = claim_time(keyword)
+
+    # Get the UIDs a conditional STORE failed for, from its completion text
+    modified = parse_modified(b"[MODIFIED 7,9:11] Conditional STORE failed")
+
+"""
+
+# Imports from other packages
+import re
+
+
+# The start of every claim keyword
+CLAIM_PREFIX = "ELClaim_"
+
+
+def claim_keyword(timestamp):
+    """Create the keyword for a claim made at a time.
+
+    Args:
+        timestamp (float): The time of the claim, in seconds since epoch.
+
+    Returns:
+        The keyword, as a string.
+
+    """
+
+    return "{}{}".format(CLAIM_PREFIX, int(timestamp))
+
+
+def claim_time(flag):
+    """Get the time a claim was made from its keyword.
+
+    Args:
+        flag (bytes or str): A flag of an email.
+
+    Returns:
+        The time of the claim in seconds since epoch, or None if the flag
+        isn't a claim keyword.
+
+    """
+
+    if isinstance(flag, bytes):
+        flag = flag.decode("ascii", "replace")
+    if not flag.startswith(CLAIM_PREFIX):
+        return None
+    try:
+        return int(flag[len(CLAIM_PREFIX):])
+    except ValueError:
+        return None
+
+
+def parse_modified(text):
+    """Get the UIDs listed in the MODIFIED response code of a STORE completion.
+
+    Args:
+        text (bytes or str): The text sent with the STORE command's completion.
+
+    Returns:
+        A set of the UIDs which weren't changed, which is empty if there was no
+        MODIFIED response code.
+
+    """
+
+    if isinstance(text, bytes):
+        text = text.decode("ascii", "replace")
+    match = re.search(r"\[MODIFIED ([\d:,]+)\]", text, re.IGNORECASE)
+    if match is None:
+        return set()
+
+    uids = set()
+    for part in match.group(1).split(","):
+        if ":" in part:
+            start, end = sorted(int(n) for n in part.split(":"))
+            uids.update(range(start, end + 1))
+        else:
+            uids.add(int(part))
+    return uids
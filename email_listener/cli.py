@@ -0,0 +1,362 @@
+"""cli: The email-listener command line interface.
+
+Each subcommand only imports the modules it needs, so a one-shot command
+starts quickly. Any option can also be set in a JSON config file, using the
+option's name with underscores as the key. Options given on the command line
+override the config file.
+
+Example:
+
+    # Scrape the unread emails of a folder once, writing them to text files
+    $ email-listener scrape --email example@gmail.com --folder Inbox \
+            --attachment-dir ./files/
+
+    # Listen for an hour, with the account set in a config file, moving each
+    # email and processing it with a custom function
+    $ email-listener --config ./email_listener.json listen 60 \
+            --move email_listener --process mypackage.replies:send_reply
+
+    # Send an email, with the password read from the EL_APW variable
+    $ email-listener send --email example@gmail.com --to other@email.com \
+            --subject "Hello" --text "This is the body of the email."
+
+    # Write every email of an mbox archive to JSON files, parsing in 4 processes
+    $ email-listener replay ./archive.mbox --attachment-dir ./files/ \
+            --process email_listener.email_processing:write_json_file --workers 4
+
+    # Run the supervisor with a supervisor config
+    $ email-listener supervise ./supervisor.json
+
+"""
+
+# Imports from other packages
+import argparse
+import json
+import logging
+import os
+import sys
+
+
+def main(argv=None):
+    """Run the command line interface.
+
+    Args:
+        argv (list): The command line arguments. Defaults to None, which uses
+            sys.argv.
+
+    Returns:
+        The exit code.
+
+    """
+
+    # Read the config file first, so its values become the defaults
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config")
+    pre_args, _ = config_parser.parse_known_args(argv)
+    config = {}
+    if pre_args.config:
+        with open(pre_args.config, "r") as file:
+            config = json.load(file)
+
+    parser = build_parser(config)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+    return args.func(args) or 0
+
+
+def build_parser(defaults=None):
+    """Build the argument parser for every subcommand.
+
+    Args:
+        defaults (dict): Option defaults, such as those read from a config
+            file, which override the built in defaults. Defaults to None.
+
+    Returns:
+        The argparse.ArgumentParser.
+
+    """
+
+    parser = argparse.ArgumentParser(prog="email-listener",
+            description="Listen in an email folder and process incoming emails.")
+    parser.add_argument("--config", help="a JSON file of option defaults")
+    parser.add_argument("--log-level", default="info",
+            choices=["debug", "info", "warning", "error"],
+            help="the lowest level of messages to log (default: info)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    # Options shared by the subcommands that log into an account
+    account = argparse.ArgumentParser(add_help=False)
+    account.add_argument("--email", help="the email address to log in as")
+    account.add_argument("--app-password-env", default="EL_APW",
+            help="the environment variable holding the app password "
+            "(default: EL_APW), unless app_password is in the config file")
+
+    # Options shared by the subcommands that read emails
+    imap = argparse.ArgumentParser(add_help=False, parents=[account])
+    imap.add_argument("--folder", default="Inbox", help="the folder to read")
+    imap.add_argument("--attachment-dir", default=".",
+            help="where to save emails and attachments")
+    imap.add_argument("--host", default="imap.gmail.com", help="the IMAP host")
+    imap.add_argument("--port", type=int, help="the IMAP port")
+    imap.add_argument("--no-ssl", dest="use_ssl", action="store_false",
+            help="connect without TLS")
+    imap.add_argument("--no-compress", dest="compress", action="store_false",
+            help="don't negotiate COMPRESS=DEFLATE")
+    imap.add_argument("--move", help="the folder to move emails to")
+    imap.add_argument("--unread", action="store_true",
+            help="mark the emails as unread")
+    imap.add_argument("--delete", action="store_true", help="delete the emails")
+    imap.add_argument("--claim", action="store_true",
+            help="only process emails this listener claims")
+    imap.add_argument("--journal", help="a checkpoint journal file to use")
+    imap.add_argument("--process", help="the process function, as "
+            "module:function (default: write_txt_file)")
+
+    scrape = subparsers.add_parser("scrape", parents=[imap],
+            help="scrape the unread emails once")
+    scrape.add_argument("--json", action="store_true",
+            help="print the scraped emails as JSON instead of processing them")
+    scrape.set_defaults(func=run_scrape)
+
+    listen = subparsers.add_parser("listen", parents=[imap],
+            help="listen for new emails")
+    listen.add_argument("timeout", type=int, nargs="?", default=60,
+            help="the number of minutes to listen for (default: 60)")
+    listen.add_argument("--reconnect", action="store_true",
+            help="reconnect when the connection fails")
+    listen.add_argument("--standby", action="store_true",
+            help="keep a spare connection to switch to")
+    listen.add_argument("--poll", action="store_true",
+            help="poll with STATUS instead of idling")
+    listen.add_argument("--metrics-port", type=int,
+            help="serve Prometheus metrics on this local port")
+    listen.add_argument("--profile-dir",
+            help="profile the next cycles on SIGUSR2, writing the stats here")
+    listen.add_argument("--profile-cycles", type=int, default=5,
+            help="the number of cycles profiled per SIGUSR2 (default: 5)")
+    listen.set_defaults(func=run_listen)
+
+    send = subparsers.add_parser("send", parents=[account], help="send an email")
+    send.add_argument("--to", required=True, help="the recipient")
+    send.add_argument("--subject", default="", help="the subject")
+    send.add_argument("--text", help="the plain text body, or - for stdin")
+    send.add_argument("--html-file", help="a file holding the HTML body")
+    send.add_argument("--image", action="append", dest="images",
+            help="an image to embed in the HTML body (repeatable)")
+    send.add_argument("--attachment", action="append", dest="attachments",
+            help="a file to attach (repeatable)")
+    send.add_argument("--smtp-host", default="smtp.gmail.com",
+            help="the SMTP host")
+    send.add_argument("--smtp-port", type=int, default=465, help="the SMTP port")
+    send.add_argument("--smtp-no-ssl", dest="smtp_use_ssl", action="store_false",
+            help="connect to the SMTP server without SSL")
+    send.set_defaults(func=run_send)
+
+    replay = subparsers.add_parser("replay",
+            help="process emails from an mbox file, Maildir or .eml files")
+    replay.add_argument("source", help="the mbox file, Maildir directory, "
+            "directory of .eml files, or .eml file")
+    replay.add_argument("--attachment-dir", default=".",
+            help="where to save emails and attachments")
+    replay.add_argument("--process", help="the process function, as "
+            "module:function (default: write_txt_file)")
+    replay.add_argument("--workers", type=int, default=1,
+            help="the number of processes to parse in (default: 1)")
+    replay.add_argument("--batch-size", type=int, default=100,
+            help="the number of emails per process function call (default: 100)")
+    replay.set_defaults(func=run_replay)
+
+    supervise = subparsers.add_parser("supervise",
+            help="run listeners in supervised worker processes")
+    supervise.add_argument("supervisor_config",
+            help="the supervisor's JSON config file")
+    supervise.set_defaults(func=run_supervise)
+
+    for subparser in (scrape, listen, send, replay, supervise):
+        subparser.set_defaults(**(defaults or {}))
+    return parser
+
+
+def get_password(args):
+    """Get the app password from the config file or the environment.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        The app password.
+
+    """
+
+    password = getattr(args, "app_password", None)
+    if password:
+        return password
+    password = os.environ.get(args.app_password_env)
+    if not password:
+        raise SystemExit("email-listener: set the app password in ${}".format(
+                args.app_password_env))
+    return password
+
+
+def make_listener(args):
+    """Create and log in an EmailListener from the parsed arguments.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        The logged in EmailListener.
+
+    """
+
+    from .listener import EmailListener
+
+    if not args.email:
+        raise SystemExit("email-listener: --email is required")
+    listener = EmailListener(args.email, get_password(args), args.folder,
+            args.attachment_dir)
+    if args.journal:
+        from .journal import CheckpointJournal
+        listener.journal = CheckpointJournal(args.journal)
+    if getattr(args, "metrics_port", None):
+        from .metrics import ListenerMetrics
+        listener.metrics = ListenerMetrics(labels={"email": args.email,
+                "folder": args.folder})
+        listener.metrics.registry.serve(args.metrics_port)
+    listener.login(host=args.host, port=args.port, use_ssl=args.use_ssl,
+            compress=args.compress)
+    return listener
+
+
+def run_scrape(args):
+    """Scrape the unread emails once, and process or print them.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        None
+
+    """
+
+    from .supervisor import load_process_func
+
+    listener = make_listener(args)
+    try:
+        msgs = listener.scrape(move=args.move, unread=args.unread,
+                delete=args.delete, claim=args.claim)
+        if args.json:
+            json.dump(msgs, sys.stdout, indent=4)
+            print()
+        else:
+            load_process_func(args.process)(listener, msgs)
+        listener.acknowledge()
+    finally:
+        listener.logout()
+
+
+def run_listen(args):
+    """Listen for new emails until the timeout.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        None
+
+    """
+
+    from .supervisor import load_process_func
+
+    listener = make_listener(args)
+    if args.profile_dir:
+        import signal
+        listener.profile_on_signal(signal.SIGUSR2, args.profile_cycles,
+                args.profile_dir)
+    try:
+        listener.listen(args.timeout, process_func=load_process_func(args.process),
+                move=args.move, unread=args.unread, delete=args.delete,
+                claim=args.claim, reconnect=args.reconnect,
+                standby=args.standby, poll=args.poll)
+    finally:
+        listener.logout()
+
+
+def run_send(args):
+    """Send an email.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        None
+
+    """
+
+    from .email_responder import EmailResponder
+
+    if not args.email:
+        raise SystemExit("email-listener: --email is required")
+    text = args.text
+    if text == "-":
+        text = sys.stdin.read()
+    html = None
+    if args.html_file:
+        with open(args.html_file, "r") as file:
+            html = file.read()
+
+    responder = EmailResponder(args.email, get_password(args))
+    responder.login(host=args.smtp_host, port=args.smtp_port,
+            use_ssl=args.smtp_use_ssl)
+    try:
+        if html is None and not args.images and not args.attachments:
+            responder.send_singlepart_msg(args.to, args.subject, text or "")
+        else:
+            responder.send_multipart_msg(args.to, args.subject, text or "",
+                    html=html, images=args.images, attachments=args.attachments)
+    finally:
+        responder.logout()
+
+
+def run_replay(args):
+    """Process the emails of an mbox file, Maildir directory or .eml files.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        None
+
+    """
+
+    from .listener import EmailListener
+    from .supervisor import load_process_func
+
+    listener = EmailListener(getattr(args, "email", None), None,
+            getattr(args, "folder", None), args.attachment_dir)
+    count = listener.replay(args.source, process_func=load_process_func(args.process),
+            workers=args.workers, batch_size=args.batch_size)
+    print("Replayed {} emails.".format(count))
+
+
+def run_supervise(args):
+    """Run the supervisor.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        None
+
+    """
+
+    from .supervisor import load_config, Supervisor
+
+    Supervisor(load_config(args.supervisor_config)).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
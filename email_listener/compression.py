@@ -0,0 +1,395 @@
+"""compression: IMAP COMPRESS=DEFLATE (RFC 4978) support and transfer counters.
+
+Example:
+
+    # Log in with an IMAPClient connection
+    server = IMAPClient('imap.gmail.com')
+    server.login("example@email.com", "badpassword")
+
+    # Compress the connection if the server supports it, counting the bytes
+    # sent and received and the time spent doing so. If the server doesn't
+    # support it, the connection is left as it is, and nothing is counted.
+    stats = TransferStats()
+    enable_compression(server, stats)
+
+    # After using the connection, see how much was saved
+    print(stats.as_dict())
+
+"""
+
+# Imports from other packages
+import imaplib
+import threading
+import time
+import zlib
+# Imports from this package
+from .imap_adapter import IMAPInternals
+
+
+# Add the COMPRESS command to imaplib, the same way IMAPClient adds others
+if "COMPRESS" not in imaplib.Commands:
+    imaplib.Commands["COMPRESS"] = ("AUTH", "SELECTED")
+
+
+class TransferStats:
+    """TransferStats object for counting the bytes and time spent on transfers.
+
+    The counters are updated through add(), which holds a lock, so every
+    connection of a listener can share them, whichever thread it is used in.
+
+    Attributes:
+        wire_bytes_received (int): Bytes received from the socket.
+        bytes_received (int): Bytes received after decompression.
+        wire_bytes_sent (int): Bytes sent over the socket.
+        bytes_sent (int): Bytes sent before compression.
+        receive_time (float): Seconds spent waiting on the socket for data.
+        send_time (float): Seconds spent sending data over the socket.
+
+    """
+
+    def __init__(self):
+        """Initialize a TransferStats instance, with every counter at zero.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.wire_bytes_received = 0
+        self.bytes_received = 0
+        self.wire_bytes_sent = 0
+        self.bytes_sent = 0
+        self.receive_time = 0.0
+        self.send_time = 0.0
+        self.__lock = threading.Lock()
+
+
+    def add(self, wire_bytes_received=0, bytes_received=0, wire_bytes_sent=0,
+            bytes_sent=0, receive_time=0.0, send_time=0.0):
+        """Add to the counters, so connections in several threads can share them.
+
+        Args:
+            wire_bytes_received (int): Bytes received from the socket.
+                Defaults to 0.
+            bytes_received (int): Bytes received after decompression.
+                Defaults to 0.
+            wire_bytes_sent (int): Bytes sent over the socket. Defaults to 0.
+            bytes_sent (int): Bytes sent before compression. Defaults to 0.
+            receive_time (float): Seconds spent waiting for data. Defaults
+                to 0.
+            send_time (float): Seconds spent sending data. Defaults to 0.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.wire_bytes_received += wire_bytes_received
+            self.bytes_received += bytes_received
+            self.wire_bytes_sent += wire_bytes_sent
+            self.bytes_sent += bytes_sent
+            self.receive_time += receive_time
+            self.send_time += send_time
+
+
+    def as_dict(self):
+        """Get the counters, along with the compression ratio in each direction.
+
+        Args:
+            None
+
+        Returns:
+            A dictionary of each counter. The ratios are the uncompressed size
+            divided by the size on the wire, or None if nothing was transferred.
+
+        """
+
+        with self.__lock:
+            return {
+                "wire_bytes_received": self.wire_bytes_received,
+                "bytes_received": self.bytes_received,
+                "wire_bytes_sent": self.wire_bytes_sent,
+                "bytes_sent": self.bytes_sent,
+                "receive_time": self.receive_time,
+                "send_time": self.send_time,
+                "receive_ratio": (self.bytes_received / self.wire_bytes_received
+                        if self.wire_bytes_received else None),
+                "send_ratio": (self.bytes_sent / self.wire_bytes_sent
+                        if self.wire_bytes_sent else None),
+            }
+
+
+def enable_compression(server, stats=None):
+    """Negotiate COMPRESS=DEFLATE on a connection, if the server advertises it.
+
+    Once compression is enabled, the connection's socket is wrapped so that it
+    deflates and inflates transfers, and counts them in stats. A connection
+    the server won't compress, or that IMAPClient's internals can't be used
+    to compress, is left using imaplib's own socket and file.
+
+    Args:
+        server (IMAPClient): The logged in connection to compress.
+        stats (TransferStats): The counters to update. Defaults to None, which
+            creates new counters.
+
+    Returns:
+        A tuple of whether compression was enabled and the TransferStats object.
+
+    """
+
+    if stats is None:
+        stats = TransferStats()
+    if b"COMPRESS=DEFLATE" not in server.capabilities():
+        return False, stats
+    try:
+        internals = IMAPInternals(server)
+    except AttributeError:
+        # IMAPClient's internals can't be used to send COMPRESS
+        return False, stats
+    typ, data = internals.simple_command("COMPRESS", "DEFLATE")
+    if typ != "OK":
+        return False, stats
+
+    # Swap the socket and file imaplib reads from for compressing versions.
+    # The server doesn't send anything compressed until it has been sent a
+    # compressed command, so imaplib's read buffer holds nothing to carry over.
+    internals.swap_socket(DeflateSocket(internals.sock, stats))
+    return True, stats
+
+
+class DeflateSocket:
+    """Socket wrapper that deflates sent data, and counts transfers.
+
+    Any attribute not defined here, like fileno() and setblocking(), is passed
+    through to the wrapped socket, so the wrapper can still be polled.
+
+    Attributes:
+        sock (socket.socket): The wrapped socket.
+        stats (TransferStats): The counters to update.
+        compress (bool): Whether data is deflated on the wire.
+
+    """
+
+    def __init__(self, sock, stats, compress=True):
+        """Initialize a DeflateSocket instance.
+
+        Args:
+            sock (socket.socket): The socket to wrap.
+            stats (TransferStats): The counters to update.
+            compress (bool): Whether data is deflated on the wire. Defaults to
+                True.
+
+        Returns:
+            None
+
+        """
+
+        self.sock = sock
+        self.stats = stats
+        self.compress = compress
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                zlib.DEFLATED, -15) if compress else None
+        self._decompressor = zlib.decompressobj(-15) if compress else None
+
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+    def sendall(self, data):
+        """Compress and send data over the socket.
+
+        Args:
+            data (bytes): The data to send.
+
+        Returns:
+            None
+
+        """
+
+        size = len(data)
+        if self._compressor is not None:
+            data = (self._compressor.compress(data)
+                    + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        start = time.perf_counter()
+        self.sock.sendall(data)
+        self.stats.add(bytes_sent=size, wire_bytes_sent=len(data),
+                send_time=time.perf_counter() - start)
+
+
+    def recv(self, bufsize):
+        """Receive and decompress data from the socket.
+
+        Args:
+            bufsize (int): The maximum number of bytes to read off the socket.
+
+        Returns:
+            The decompressed data, which may be empty if the compressed data
+            received didn't produce any output yet. None is only returned at
+            EOF.
+
+        """
+
+        start = time.perf_counter()
+        try:
+            data = self.sock.recv(bufsize)
+        except BaseException:
+            self.stats.add(receive_time=time.perf_counter() - start)
+            raise
+        receive_time = time.perf_counter() - start
+        if not data:
+            self.stats.add(receive_time=receive_time)
+            return None
+        wire_size = len(data)
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        self.stats.add(wire_bytes_received=wire_size, bytes_received=len(data),
+                receive_time=receive_time)
+        return data
+
+
+    def makefile(self):
+        """Create a file object for imaplib to read responses from.
+
+        Args:
+            None
+
+        Returns:
+            A DeflateFile reading from this socket.
+
+        """
+
+        return DeflateFile(self)
+
+
+class DeflateFile:
+    """Minimal buffered reader over a DeflateSocket, as used by imaplib.
+
+    Unlike io.BufferedReader, a partial line is kept in the buffer if the
+    socket has no more data, rather than being returned, so non-blocking reads
+    like IMAPClient.idle_check() never see half a response. Data is appended
+    to a bytearray, and consumed by moving a read offset, so reading a large
+    literal takes time in proportion to its size.
+
+    Attributes:
+        sock (DeflateSocket): The socket to read from.
+
+    """
+
+    def __init__(self, sock):
+        """Initialize a DeflateFile instance.
+
+        Args:
+            sock (DeflateSocket): The socket to read from.
+
+        Returns:
+            None
+
+        """
+
+        self.sock = sock
+        self._buffer = bytearray()
+        self._offset = 0
+
+
+    def __fill(self):
+        """Helper function, reads more decompressed data into the buffer.
+
+        Args:
+            None
+
+        Returns:
+            Whether the end of the stream was reached.
+
+        """
+
+        data = self.sock.recv(65536)
+        if data is None:
+            return True
+        # Drop the consumed data once it is most of the buffer, so the cost
+        # of moving the rest is spread over the data consumed
+        if self._offset > len(self._buffer) // 2:
+            del self._buffer[:self._offset]
+            self._offset = 0
+        self._buffer += data
+        return False
+
+
+    def __take(self, end):
+        """Helper function, consumes the buffered data up to an index.
+
+        Args:
+            end (int): The index in the buffer to consume up to.
+
+        Returns:
+            The data consumed, as bytes.
+
+        """
+
+        data = bytes(self._buffer[self._offset:end])
+        self._offset = end
+        return data
+
+
+    def readline(self, limit=-1):
+        """Read a line, including its line ending.
+
+        Args:
+            limit (int): The maximum number of bytes to return. Defaults to -1,
+                which doesn't limit the line length.
+
+        Returns:
+            The line, or the rest of the data at the end of the stream.
+
+        """
+
+        # Only search the data added since the last search. Filling may drop
+        # the consumed data, so how far was searched is kept past the offset.
+        searched = 0
+        while True:
+            end = self._buffer.find(b"\n", self._offset + searched) + 1
+            searched = len(self._buffer) - self._offset
+            if end == 0 and 0 <= limit <= searched:
+                end = self._offset + limit
+            if end:
+                if 0 <= limit < end - self._offset:
+                    end = self._offset + limit
+                return self.__take(end)
+            if self.__fill():
+                return self.__take(len(self._buffer))
+
+
+    def read(self, size):
+        """Read exactly size bytes, or less at the end of the stream.
+
+        Args:
+            size (int): The number of bytes to read.
+
+        Returns:
+            The data read.
+
+        """
+
+        while len(self._buffer) - self._offset < size:
+            if self.__fill():
+                break
+        return self.__take(min(self._offset + size, len(self._buffer)))
+
+
+    def close(self):
+        """Close the file, discarding anything buffered.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self._buffer = bytearray()
+        self._offset = 0
@@ -0,0 +1,92 @@
+"""connection: TLS session caching for fast IMAP reconnects.
+
+Example:
+
+    # Wrap an SSL context so that its TLS session can be resumed
+    context = SessionCachingContext(ssl.create_default_context())
+
+    # Connect and log in, then save the session for the next connection,
+    # using server_socket() from the imap_adapter module
+    server = IMAPClient('imap.gmail.com', ssl_context=context)
+    server.login("example@email.com", "badpassword")
+    context.save_session(server_socket(server))
+
+    # Reconnecting resumes the saved session, skipping the full handshake
+    server = IMAPClient('imap.gmail.com', ssl_context=context)
+
+"""
+
+# Imports from other packages
+import ssl
+
+
+class SessionCachingContext:
+    """SSL context wrapper which resumes the last saved TLS session.
+
+    Any attribute not defined here is passed through to the wrapped context,
+    so the wrapper can be given to IMAPClient in place of an SSLContext.
+
+    Attributes:
+        context (ssl.SSLContext): The wrapped SSL context.
+        session (ssl.SSLSession): The TLS session to resume, or None if no
+            session has been saved yet.
+
+    """
+
+    def __init__(self, context=None):
+        """Initialize a SessionCachingContext instance.
+
+        Args:
+            context (ssl.SSLContext): The SSL context to wrap. Defaults to None,
+                which creates a default context that verifies certificates.
+
+        Returns:
+            None
+
+        """
+
+        if context is None:
+            context = ssl.create_default_context()
+        self.context = context
+        self.session = None
+
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        """Wrap a socket, resuming the saved TLS session if there is one.
+
+        Args:
+            sock (socket.socket): The connected socket to wrap.
+            *args, **kwargs: Passed on to SSLContext.wrap_socket().
+
+        Returns:
+            The wrapped ssl.SSLSocket. If the server won't resume the session,
+            a full handshake is done instead.
+
+        """
+
+        if self.session is not None and "session" not in kwargs:
+            kwargs["session"] = self.session
+        return self.context.wrap_socket(sock, *args, **kwargs)
+
+
+    def save_session(self, sock):
+        """Save the TLS session of a socket so the next connection can resume it.
+
+        TLS 1.3 servers send session tickets after the handshake, so this
+        should be called once a response has been read, such as after login.
+
+        Args:
+            sock (ssl.SSLSocket): The socket to save the session of.
+
+        Returns:
+            None
+
+        """
+
+        session = getattr(sock, "session", None)
+        if session is not None:
+            self.session = session
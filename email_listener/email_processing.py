@@ -13,16 +13,256 @@ Example:
     timeout = 5
     el.listen(timeout, process_func=write_txt_file)
 
+    # Keep the keys already written in a manifest, so a large attachment_dir
+    # isn't scanned when the listener starts
+    load_key_index(attachment_dir, ".json", manifest="/path/to/json.manifest")
+    el.listen(timeout, process_func=write_json_file)
+
+    # Write each batch of emails in 8 threads, such as on network storage
+    executor = ThreadPoolExecutor(max_workers=8)
+    el.listen(timeout, process_func=functools.partial(write_json_file,
+            executor=executor))
+
 """
 
 # Imports from other packages
 import json
 import os
-# Imports from this package
-from email_listener.email_responder import EmailResponder
+import threading
+
+
+# The key indexes used by the writers, keyed by directory and file extension
+_indexes = {}
+
+
+class WriteError(Exception):
+    """WriteError raised when some emails of a concurrent write fail.
+
+    Attributes:
+        file_list (list): The file paths of the files that were written, in
+            the order of the emails.
+        errors (dict): The exception raised for each email that failed, keyed
+            by the email's key.
+
+    """
+
+    def __init__(self, file_list, errors):
+        """Initialize a WriteError instance.
+
+        Args:
+            file_list (list): The file paths of the files that were written.
+            errors (dict): The exception raised for each email that failed.
+
+        Returns:
+            None
+
+        """
+
+        super().__init__("{} of the emails failed to be written: {}".format(
+                len(errors), ", ".join(errors)))
+        self.file_list = file_list
+        self.errors = errors
+
+
+class KeyIndex:
+    """KeyIndex object for tracking which emails have been written to a directory.
+
+    The keys are loaded once, from a manifest file if there is one, or else
+    from a scan of the directory, and are added to as files are written. So
+    a new key costs nothing per file, however big the directory is, and a key
+    already written costs one stat, so a file deleted by something else is
+    written again. Files are created with O_EXCL, so a file written by
+    something else since the index was loaded is still never overwritten. A key is only added to
+    the manifest once commit() is called after its file is written, so an
+    email that failed to be written is tried again after a restart.
+
+    Attributes:
+        directory (str): The folder the files are written to.
+        extension (str): The file extension of the files, such as ".txt".
+        manifest (str): The file path of the manifest, holding a key per line,
+            or None to not keep one.
+        keys (set): The keys of the files written.
+
+    """
+
+    def __init__(self, directory, extension, manifest=None):
+        """Initialize a KeyIndex instance, loading the keys already written.
+
+        Args:
+            directory (str): The folder the files are written to.
+            extension (str): The file extension of the files.
+            manifest (str): The file path of the manifest. If it doesn't
+                exist, it is created from a scan of the directory. Defaults to
+                None, which scans the directory without keeping a manifest.
+
+        Returns:
+            None
+
+        """
+
+        self.directory = directory
+        self.extension = extension
+        self.manifest = manifest
+        self.keys = set()
+        self.__lock = threading.Lock()
+        self.__manifest_file = None
+
+        if manifest is not None and os.path.exists(manifest):
+            with open(manifest, "r", encoding="utf-8") as file:
+                self.keys.update(line.rstrip("\n") for line in file if line.strip())
+        else:
+            self.keys.update(self.__scan())
+            if manifest is not None:
+                with open(manifest, "w", encoding="utf-8") as file:
+                    file.writelines(key + "\n" for key in self.keys)
+        if manifest is not None:
+            self.__manifest_file = open(manifest, "a", encoding="utf-8")
+
+
+    def create(self, key):
+        """Create the file for a key, unless its file already exists.
+
+        The key is held in memory until commit() or discard() is called. A key
+        already written is only skipped if its file still exists.
+
+        Args:
+            key (str): The email's key.
+
+        Returns:
+            The file, opened for writing text, or None if it already exists.
+
+        """
+
+        file_path = os.path.join(self.directory, key + self.extension)
+        with self.__lock:
+            written = key in self.keys
+            self.keys.add(key)
+        if written and os.path.exists(file_path):
+            return None
+        try:
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            # Written by something other than this index
+            return None
+        except OSError:
+            self.discard(key)
+            raise
+        return os.fdopen(fd, "w")
+
+
+    def commit(self, key):
+        """Add a key to the manifest, once its file has been written.
+
+        Args:
+            key (str): The email's key.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            if self.__manifest_file is not None:
+                self.__manifest_file.write(key + "\n")
+                self.__manifest_file.flush()
+
+
+    def discard(self, key):
+        """Remove a key, such as after its file failed to be written.
+
+        Args:
+            key (str): The email's key.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.keys.discard(key)
+
+
+    def close(self):
+        """Close the manifest, if there is one.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        if self.__manifest_file is not None:
+            self.__manifest_file.close()
+            self.__manifest_file = None
+
+
+    def __scan(self):
+        """Helper function, lists the keys of the files in the directory.
+
+        Args:
+            None
+
+        Returns:
+            A list of the keys.
 
+        """
 
-def write_txt_file(email_listener, msg_dict):
+        try:
+            entries = os.scandir(self.directory)
+        except FileNotFoundError:
+            return []
+        with entries:
+            return [entry.name[:-len(self.extension)] for entry in entries
+                    if entry.name.endswith(self.extension)]
+
+
+def load_key_index(directory, extension, manifest=None):
+    """Load the key index the writers use for a directory and file extension.
+
+    Any index already loaded for them is replaced, such as to start keeping a
+    manifest, or to notice files deleted by something else.
+
+    Args:
+        directory (str): The folder the files are written to.
+        extension (str): The file extension, ".txt" for write_txt_file or
+            ".json" for write_json_file.
+        manifest (str): The file path of a manifest of the keys written.
+            Defaults to None, which scans the directory without keeping one.
+
+    Returns:
+        The KeyIndex.
+
+    """
+
+    old = _indexes.get((directory, extension))
+    if old is not None:
+        old.close()
+    index = _indexes[(directory, extension)] = KeyIndex(directory, extension,
+            manifest)
+    return index
+
+
+def __key_index(directory, extension):
+    """Get the key index for a directory and file extension, loading it if needed.
+
+    Args:
+        directory (str): The folder the files are written to.
+        extension (str): The file extension of the files.
+
+    Returns:
+        The KeyIndex.
+
+    """
+
+    index = _indexes.get((directory, extension))
+    if index is None:
+        index = load_key_index(directory, extension)
+    return index
+
+
+def write_txt_file(email_listener, msg_dict, executor=None, workers=1):
     """Write the email message data returned from scrape to text files.
 
     Args:
@@ -30,31 +270,20 @@ def write_txt_file(email_listener, msg_dict):
             is used with.
         msg_dict (dict): The dictionary of email message data returned by the
             scraping function.
+        executor (Executor): A thread pool to convert and write the emails in
+            concurrently, such as a ThreadPoolExecutor kept between calls.
+            Defaults to None.
+        workers (int): The number of threads to write in, if no executor is
+            given. Defaults to 1, which writes each email in turn.
 
     Returns:
-        A list of file paths of files that were created and written to.
+        A list of file paths of files that were created and written to, in the
+        order of msg_dict.
 
     """
 
-    # List of files to be returned
-    file_list = []
-    # For each key, create a file and ensure it doesn't exist
-    for key in msg_dict.keys():
-        file_path = os.path.join(email_listener.attachment_dir, "{}.txt".format(key))
-        if os.path.exists(file_path):
-            print("File has already been created.")
-            continue
-
-        # Open the file
-        file = open(file_path, "w+")
-        # Conver the message data to a string, and write it to the file
-        msg_string = __msg_to_str(msg_dict[key])
-        file.write(msg_string)
-        file.close()
-        # Add the file name to the return list
-        file_list.append(file_path)
-
-    return file_list
+    return __write_files(email_listener, msg_dict, ".txt", __msg_to_str,
+            executor, workers)
 
 
 def __msg_to_str(msg):
@@ -116,6 +345,8 @@ def send_basic_reply(email_listener, msg_dict):
     # Write the email messages to files for use later
     file_list = write_txt_file(email_listener, msg_dict)
 
+    # Imported here, so scraping without replying doesn't load smtplib and ssl
+    from email_listener.email_responder import EmailResponder
     er = EmailResponder(email_listener.email, email_listener.app_password)
     er.login()
 
@@ -136,7 +367,7 @@ def send_basic_reply(email_listener, msg_dict):
     return file_list
 
 
-def write_json_file(email_listener, msg_dict):
+def write_json_file(email_listener, msg_dict, executor=None, workers=1):
     """Write the email message data returned from scrape to json files.
 
     Args:
@@ -144,31 +375,125 @@ def write_json_file(email_listener, msg_dict):
             is used with.
         msg_dict (dict): The dictionary of email message data returned by the
             scraping function.
+        executor (Executor): A thread pool to convert and write the emails in
+            concurrently, such as a ThreadPoolExecutor kept between calls.
+            Defaults to None.
+        workers (int): The number of threads to write in, if no executor is
+            given. Defaults to 1, which writes each email in turn.
 
     Returns:
-        A list of file paths of files that were created and written to.
+        A list of file paths of files that were created and written to, in the
+        order of msg_dict.
 
     """
 
-    # List of files to be returned
-    file_list = []
-    # For each key, create a file and ensure it doesn't exist
-    for key in msg_dict.keys():
-        file_path = os.path.join(email_listener.attachment_dir, "{}.json".format(key))
-        if os.path.exists(file_path):
-            print("File has already been created.")
-            continue
-
-        # Convert the returned dict to json
-        json_obj = json.dumps(msg_dict[key], indent = 4)
-
-        # Open the file
-        file = open(file_path, "w+")
-        # Write the json object to the file
-        file.write(json_obj)
-        file.close()
-        # Add the file name to the return list
-        file_list.append(file_path)
+    return __write_files(email_listener, msg_dict, ".json", __msg_to_json,
+            executor, workers)
 
+
+def __msg_to_json(msg):
+    """Convert a dictionary containing message data to json.
+
+    Args:
+        msg (dict): The dictionary containing the message data.
+
+    Returns:
+        A json string of the message.
+
+    """
+
+    return json.dumps(msg, indent = 4)
+
+
+def __write_files(email_listener, msg_dict, extension, convert, executor, workers):
+    """Helper function, writes each email to a file, in turn or concurrently.
+
+    When written concurrently, every email is written even if some fail, and
+    then a WriteError is raised holding the error of each one that failed.
+
+    Args:
+        email_listener (EmailListener): The EmailListener object the files are
+            written for.
+        msg_dict (dict): The dictionary of email message data.
+        extension (str): The file extension, such as ".txt".
+        convert (function): The function converting an email's value
+            dictionary to the contents of its file.
+        executor (Executor): The thread pool to write in, or None.
+        workers (int): The number of threads to write in, if no executor is
+            given.
+
+    Returns:
+        A list of file paths of files that were created and written to, in the
+        order of msg_dict.
+
+    """
+
+    index = __key_index(email_listener.attachment_dir, extension)
+    file_paths = {key: os.path.join(email_listener.attachment_dir,
+            "{}{}".format(key, extension)) for key in msg_dict.keys()}
+
+    # Write each email in turn
+    if executor is None and workers <= 1:
+        results = [__write_file(index, key, file_paths[key], convert, msg_dict[key])
+                for key in msg_dict.keys()]
+        return [file_path for file_path in results if file_path is not None]
+
+    # Only needed for concurrent writes, so not imported with the module
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = executor if executor is not None else ThreadPoolExecutor(
+            max_workers=workers)
+    try:
+        futures = [(key, pool.submit(__write_file, index, key, file_paths[key],
+                convert, msg_dict[key])) for key in msg_dict.keys()]
+        # Collect the results in order, and the error of each email that failed
+        file_list = []
+        errors = {}
+        for key, future in futures:
+            try:
+                file_path = future.result()
+            except Exception as error:
+                errors[key] = error
+                continue
+            if file_path is not None:
+                file_list.append(file_path)
+    finally:
+        if executor is None:
+            pool.shutdown()
+
+    if errors:
+        raise WriteError(file_list, errors) from next(iter(errors.values()))
     return file_list
 
+
+def __write_file(index, key, file_path, convert, msg):
+    """Helper function, writes an email to its file, unless it has already been created.
+
+    Args:
+        index (KeyIndex): The key index of the directory.
+        key (str): The email's key.
+        file_path (str): The file path to write to.
+        convert (function): The function converting the email's value
+            dictionary to the contents of its file.
+        msg (dict): The email's value dictionary.
+
+    Returns:
+        The file path, or None if the file has already been created.
+
+    """
+
+    # Create the file and ensure it doesn't exist, then convert the message data
+    file = index.create(key)
+    if file is None:
+        print("File has already been created.")
+        return None
+    try:
+        with file:
+            file.write(convert(msg))
+    except Exception:
+        # Remove the partly written file, so the email can be written again
+        os.remove(file_path)
+        index.discard(key)
+        raise
+    index.commit(key)
+    return file_path
@@ -44,6 +44,7 @@ from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import smtplib, ssl
+import time
 
 
 class EmailResponder:
@@ -53,6 +54,9 @@ class EmailResponder:
         email (str): The email to send emails from.
         app_password (str): The password for the email.
         server (SMTP_SSL): The SMTP server to use. Defaults to None.
+        metrics (ResponderMetrics): Counters and histograms of the emails
+            sent, which can be served to Prometheus. Defaults to None, which
+            doesn't count anything.
 
     """
 
@@ -68,23 +72,30 @@ class EmailResponder:
         self.email = email
         self.app_password = app_password
         self.server = None
+        self.metrics = None
 
 
-    def login(self, host="smtp.gmail.com", port=465):
+    def login(self, host="smtp.gmail.com", port=465, use_ssl=True):
         """Logs in the EmailResponder to the SMTP server.
 
         Args:
             host (str): The smtp host to log into. Default host is Gmail.
             port (int): The port number to connect through. Default port is
                 465, which is needed for a secure SSL connection.
+            use_ssl (bool): Whether to connect over SSL. Set to False for a
+                plaintext connection, such as to a local test server. Defaults
+                to True.
 
         Returns:
             None
 
         """
 
-        context = ssl.create_default_context()
-        self.server = smtplib.SMTP_SSL(host, port, context=context)
+        if use_ssl:
+            context = ssl.create_default_context()
+            self.server = smtplib.SMTP_SSL(host, port, context=context)
+        else:
+            self.server = smtplib.SMTP(host, port)
         self.server.login(self.email, self.app_password)
 
 
@@ -117,7 +128,7 @@ class EmailResponder:
         """
 
         msg = "Subject: {}\n\n{}".format(subject, text)
-        self.server.sendmail(self.email, recipient, msg)
+        self.__sendmail(recipient, msg)
         return
 
 
@@ -196,6 +207,33 @@ class EmailResponder:
             msg.attach(part)
 
         # Send the email
-        self.server.sendmail(self.email, recipient, msg.as_string())
+        self.__sendmail(recipient, msg.as_string())
         return
 
+
+    def __sendmail(self, recipient, msg):
+        """Helper function, sends an email, counting it if metrics are kept.
+
+        Args:
+            recipient (str): The email address to send the email to.
+            msg (str): The whole email, with its headers.
+
+        Returns:
+            None
+
+        """
+
+        metrics = self.metrics
+        if metrics is None:
+            self.server.sendmail(self.email, recipient, msg)
+            return
+        start = time.perf_counter()
+        try:
+            self.server.sendmail(self.email, recipient, msg)
+        except Exception:
+            metrics.send_errors_total.inc()
+            raise
+        metrics.send_seconds.observe(time.perf_counter() - start)
+        metrics.sent_total.inc()
+        metrics.sent_bytes_total.inc(len(msg))
+
@@ -0,0 +1,1212 @@
+"""fake_server: In-process IMAP and SMTP stand-ins for tests and benchmarks.
+
+Example:
+
+    # Start a fake IMAP server with a single account and folder
+    imap = FakeIMAPServer(latency=0.02)
+    imap.add_account("example@email.com", "badpassword")
+    imap.create_folder("example@email.com", "Inbox")
+    imap.start()
+
+    # Start a fake SMTP sink which delivers into the IMAP server
+    smtp = FakeSMTPServer(imap_server=imap)
+    smtp.start()
+
+    # Point an EmailListener at the fake IMAP server
+    listener = EmailListener("example@email.com", "badpassword", "Inbox", "./files/")
+    listener.login(host=imap.host, port=imap.port, use_ssl=False)
+
+    # Point an EmailResponder at the fake SMTP server
+    responder = EmailResponder("example@email.com", "badpassword")
+    responder.login(host=smtp.host, port=smtp.port, use_ssl=False)
+
+    # Deliver a message directly into a folder
+    imap.deliver("example@email.com", "Inbox", b"Subject: Hi\\r\\n\\r\\nHello.\\r\\n")
+
+    # Shut both servers down
+    smtp.stop()
+    imap.stop()
+
+"""
+
+# Imports from other packages
+import base64
+import datetime
+import queue
+import re
+import socket
+import socketserver
+import threading
+import time
+import zlib
+
+
+# Capabilities advertised by the fake IMAP server
+IMAP_CAPABILITIES = ("IMAP4rev1", "IDLE", "MOVE", "UIDPLUS", "CONDSTORE",
+        "ENABLE", "LITERAL+", "COMPRESS=DEFLATE", "NOTIFY")
+
+
+class FakeMessage:
+    """A single message stored in a FakeIMAPServer folder.
+
+    Attributes:
+        uid (int): The UID of the message in its folder.
+        raw (bytes): The RFC822 source of the message.
+        flags (set): The flags and keywords set on the message.
+        internal_date (datetime.datetime): When the message was delivered.
+        modseq (int): The CONDSTORE modification sequence of the message.
+
+    """
+
+    def __init__(self, uid, raw, flags, internal_date, modseq):
+        """Initialize a FakeMessage instance.
+
+        Args:
+            uid (int): The UID of the message in its folder.
+            raw (bytes): The RFC822 source of the message.
+            flags (set): The flags and keywords set on the message.
+            internal_date (datetime.datetime): When the message was delivered.
+            modseq (int): The CONDSTORE modification sequence of the message.
+
+        """
+
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+        self.internal_date = internal_date
+        self.modseq = modseq
+
+
+class FakeFolder:
+    """A folder stored in a FakeIMAPServer account.
+
+    Attributes:
+        name (str): The name of the folder.
+        uidvalidity (int): The UIDVALIDITY of the folder.
+        uidnext (int): The next UID to be assigned in the folder.
+        highestmodseq (int): The highest modification sequence in the folder.
+        messages (list): The FakeMessage objects in the folder, in UID order.
+
+    """
+
+    def __init__(self, name, uidvalidity):
+        """Initialize a FakeFolder instance.
+
+        Args:
+            name (str): The name of the folder.
+            uidvalidity (int): The UIDVALIDITY of the folder.
+
+        """
+
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.messages = []
+
+
+    def unseen(self):
+        """Count the messages in the folder that are not marked as seen.
+
+        Args:
+            None
+
+        Returns:
+            The number of unseen messages.
+
+        """
+
+        return sum(1 for msg in self.messages if "\\Seen" not in msg.flags)
+
+
+class FakeIMAPServer:
+    """In-process IMAP4rev1 server supporting the subset used by EmailListener.
+
+    Supports CAPABILITY, LOGIN, LOGOUT, NOOP, SELECT, EXAMINE, CREATE, DELETE,
+    LIST, STATUS, ENABLE, COMPRESS, IDLE, NOTIFY (new message events only), and
+    the plain and UID forms of SEARCH, FETCH, STORE and MOVE.
+
+    Attributes:
+        host (str): The host the server is listening on.
+        port (int): The port the server is listening on.
+        latency (float): The simulated network round trip time in seconds.
+            Each response is delayed until this long after its command was
+            received, so pipelined commands overlap like they would on a
+            real link.
+        capabilities (tuple): The capabilities advertised to clients.
+        ssl_context (ssl.SSLContext): The server side SSL context clients
+            connect with TLS through, or None for plain connections.
+        accounts (dict): The accounts on the server, keyed by email, each
+            holding a password and a dictionary of FakeFolder objects.
+        command_count (int): The number of commands handled so far.
+
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0,
+            capabilities=IMAP_CAPABILITIES, ssl_context=None):
+        """Initialize a FakeIMAPServer instance.
+
+        Args:
+            host (str): The host to listen on. Defaults to localhost.
+            port (int): The port to listen on. Defaults to 0, which picks a
+                free port.
+            latency (float): The simulated round trip time in seconds.
+                Defaults to 0.
+            capabilities (tuple): The capabilities advertised to clients.
+                Defaults to IMAP_CAPABILITIES.
+            ssl_context (ssl.SSLContext): A server side SSL context, with its
+                certificate loaded, to accept TLS connections with. Defaults
+                to None, which accepts plain connections.
+
+        Returns:
+            None
+
+        """
+
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.capabilities = tuple(capabilities)
+        self.ssl_context = ssl_context
+        self.accounts = {}
+        self.command_count = 0
+        self._lock = threading.RLock()
+        self._sessions = set()
+        self._server = None
+        self._thread = None
+        self._next_uidvalidity = 1
+
+
+    def add_account(self, email, password):
+        """Add an account to the server, with an INBOX folder.
+
+        Args:
+            email (str): The login name of the account.
+            password (str): The password of the account.
+
+        Returns:
+            None
+
+        """
+
+        with self._lock:
+            self.accounts[email] = {"password": password, "folders": {}}
+            self.create_folder(email, "INBOX")
+
+
+    def create_folder(self, email, folder):
+        """Create a folder in an account, if it doesn't already exist.
+
+        Args:
+            email (str): The account to create the folder in.
+            folder (str): The name of the folder.
+
+        Returns:
+            The FakeFolder object.
+
+        """
+
+        folder = _folder_name(folder)
+        with self._lock:
+            folders = self.accounts[email]["folders"]
+            if folder not in folders:
+                folders[folder] = FakeFolder(folder, self._next_uidvalidity)
+                self._next_uidvalidity += 1
+            return folders[folder]
+
+
+    def deliver(self, email, folder, raw, flags=(), internal_date=None):
+        """Deliver a message into a folder, notifying any selected sessions.
+
+        Args:
+            email (str): The account to deliver to.
+            folder (str): The folder to deliver to. Created if it doesn't exist.
+            raw (bytes or str): The RFC822 source of the message.
+            flags (iterable): Flags to set on the message. Defaults to none.
+            internal_date (datetime.datetime): The delivery time. Defaults to
+                the current time.
+
+        Returns:
+            The UID assigned to the message.
+
+        """
+
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        if internal_date is None:
+            internal_date = datetime.datetime.now(datetime.timezone.utc)
+
+        with self._lock:
+            fld = self.create_folder(email, folder)
+            uid = self.__append(fld, raw, flags, internal_date)
+            self._notify(email, fld.name, "* {} EXISTS".format(len(fld.messages)))
+        return uid
+
+
+    def messages(self, email, folder):
+        """Get the messages currently stored in a folder.
+
+        Args:
+            email (str): The account to look in.
+            folder (str): The folder to look in.
+
+        Returns:
+            A list of FakeMessage objects.
+
+        """
+
+        with self._lock:
+            return list(self.accounts[email]["folders"][_folder_name(folder)]
+                    .messages)
+
+
+    def start(self):
+        """Start serving in a background thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        owner = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sock = self.request
+                if owner.ssl_context is not None:
+                    try:
+                        sock = owner.ssl_context.wrap_socket(sock, server_side=True)
+                    except OSError:
+                        return
+                _IMAPSession(owner, sock).run()
+
+        self._server = _ThreadingServer((self.host, self.port), Handler)
+        self.host, self.port = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """Stop serving and drop all client connections.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.close()
+        self._server = None
+
+
+    def drop_connections(self, address=None):
+        """Abruptly close client connections, keeping the server running.
+
+        Args:
+            address (tuple): The address of the client connection to close, as
+                given by getsockname() on the client's socket. Defaults to
+                None, which closes every client connection.
+
+        Returns:
+            None
+
+        """
+
+        with self._lock:
+            sessions = [session for session in self._sessions
+                    if address is None or session.address == tuple(address)]
+        for session in sessions:
+            session.close()
+
+
+    def __append(self, fld, raw, flags, internal_date):
+        """Helper function, appends a message to a folder. Caller holds the lock.
+
+        Args:
+            fld (FakeFolder): The folder to append to.
+            raw (bytes): The RFC822 source of the message.
+            flags (iterable): Flags to set on the message.
+            internal_date (datetime.datetime): The delivery time.
+
+        Returns:
+            The UID assigned to the message.
+
+        """
+
+        uid = fld.uidnext
+        fld.uidnext += 1
+        fld.highestmodseq += 1
+        fld.messages.append(FakeMessage(uid, raw, flags, internal_date,
+                fld.highestmodseq))
+        return uid
+
+
+    def _move(self, email, src, uids, dest):
+        """Move messages between folders. Caller holds the lock.
+
+        Args:
+            email (str): The account the folders belong to.
+            src (FakeFolder): The folder to move from.
+            uids (list): The UIDs of the messages to move.
+            dest (str): The name of the folder to move to.
+
+        Returns:
+            A list of the sequence numbers expunged from the source folder, in
+            the order they should be reported.
+
+        """
+
+        dst = self.create_folder(email, dest)
+        expunged = []
+        for uid in uids:
+            for i, msg in enumerate(src.messages):
+                if msg.uid == uid:
+                    self.__append(dst, msg.raw, msg.flags, msg.internal_date)
+                    del src.messages[i]
+                    expunged.append(i + 1)
+                    break
+        src.highestmodseq += 1
+        self._notify(email, dst.name, "* {} EXISTS".format(len(dst.messages)))
+        return expunged
+
+
+    def _notify(self, email, folder, line, exclude=None):
+        """Queue an untagged response for every session with a folder selected.
+
+        Args:
+            email (str): The account the folder belongs to.
+            folder (str): The folder that changed.
+            line (str): The untagged response to send.
+            exclude (_IMAPSession): A session to skip. Defaults to None.
+
+        Returns:
+            None
+
+        """
+
+        folder = _folder_name(folder)
+        fld = self.accounts[email]["folders"][folder]
+        for session in self._sessions:
+            if session is exclude or session.user != email:
+                continue
+            if session.selected == folder:
+                session.pending.append(line)
+                session.wake()
+            elif (line.endswith("EXISTS") and session.notify is not None
+                    and (session.notify is True or folder in session.notify)):
+                # NOTIFY reports new messages in other folders with STATUS
+                session.pending.append('* STATUS "{}" (MESSAGES {} UIDNEXT {})'
+                        .format(folder, len(fld.messages), fld.uidnext))
+                session.wake()
+
+
+class FakeSMTPServer:
+    """In-process SMTP sink that records, and optionally delivers, messages.
+
+    Attributes:
+        host (str): The host the server is listening on.
+        port (int): The port the server is listening on.
+        latency (float): Seconds to delay each reply by. Defaults to 0.
+        imap_server (FakeIMAPServer): If set, each message is delivered to the
+            folder named by the recipient's '+' suffix (or INBOX) of the
+            matching account on this server.
+        messages (list): A list of (sender, recipients, data) tuples for each
+            message received.
+
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, imap_server=None):
+        """Initialize a FakeSMTPServer instance.
+
+        Args:
+            host (str): The host to listen on. Defaults to localhost.
+            port (int): The port to listen on. Defaults to 0, which picks a
+                free port.
+            latency (float): Seconds to delay each reply by. Defaults to 0.
+            imap_server (FakeIMAPServer): The server to deliver messages to.
+                Defaults to None.
+
+        Returns:
+            None
+
+        """
+
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.imap_server = imap_server
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+
+    def start(self):
+        """Start serving in a background thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        owner = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                _SMTPSession(owner, self.rfile, self.wfile).run()
+
+        self._server = _ThreadingServer((self.host, self.port), Handler)
+        self.host, self.port = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """Stop serving.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+
+
+    def _received(self, sender, recipients, data):
+        """Record a received message, and deliver it if configured to.
+
+        Args:
+            sender (str): The envelope sender.
+            recipients (list): The envelope recipients.
+            data (bytes): The message data.
+
+        Returns:
+            None
+
+        """
+
+        with self._lock:
+            self.messages.append((sender, recipients, data))
+        if self.imap_server is None:
+            return
+        for rcpt in recipients:
+            local, _, domain = rcpt.partition("@")
+            local, _, folder = local.partition("+")
+            account = "{}@{}".format(local, domain)
+            if account in self.imap_server.accounts:
+                self.imap_server.deliver(account, folder or "INBOX", data)
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    """ThreadingTCPServer which doesn't block shutdown on open connections."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _IMAPSession:
+    """A single client connection to a FakeIMAPServer."""
+
+    def __init__(self, owner, sock):
+        self.owner = owner
+        self.sock = sock
+        self.address = sock.getpeername()
+        self.user = None
+        self.selected = None
+        self.readonly = False
+        self.pending = []
+        self.lines = queue.Queue()
+        self.compressor = None
+        self.decompressor = None
+        self.compress_decided = threading.Event()
+        self.closed = False
+        self._wake = threading.Event()
+        self._trash = []
+        self._buffer = None
+        self.notify = None
+
+
+    def wake(self):
+        self._wake.set()
+
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.wake()
+
+
+    def run(self):
+        with self.owner._lock:
+            self.owner._sessions.add(self)
+        reader = threading.Thread(target=self._reader, daemon=True)
+        reader.start()
+        try:
+            self.send("* OK Fake IMAP server ready")
+            while not self.closed:
+                item = self.lines.get()
+                if item is None:
+                    break
+                arrived, line = item
+                self.owner.command_count += 1
+                if not self._dispatch(arrived, line):
+                    break
+        except OSError:
+            pass
+        finally:
+            with self.owner._lock:
+                self.owner._sessions.discard(self)
+            self.closed = True
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+
+    # -- Transport --------------------------------------------------------
+
+    def send(self, text):
+        data = text.encode("utf-8") if isinstance(text, str) else text
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        if self._buffer is not None:
+            self._buffer.append(data)
+        else:
+            self._sendall(data)
+
+
+    def _flush_buffer(self, arrived):
+        # Hold the response back until a round trip after the command arrived
+        buffered, self._buffer = self._buffer, None
+        if self.owner.latency:
+            delay = arrived + self.owner.latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if buffered:
+            self._sendall(b"".join(buffered))
+
+
+    def _sendall(self, data):
+        if self.compressor is not None:
+            data = (self.compressor.compress(data)
+                    + self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.sock.sendall(data)
+
+
+    def _reader(self):
+        buf = b""
+        try:
+            while True:
+                while b"\r\n" not in buf:
+                    chunk = self._recv()
+                    if not chunk:
+                        return
+                    buf += chunk
+                arrived = time.monotonic()
+                line, buf = buf.split(b"\r\n", 1)
+                # Read in any literals which are part of the command
+                while True:
+                    m = re.search(rb"\{(\d+)(\+?)\}$", line)
+                    if m is None:
+                        break
+                    size = int(m.group(1))
+                    if not m.group(2):
+                        self._sendall(b"+ Ready for literal\r\n")
+                    while len(buf) < size + 2 or b"\r\n" not in buf[size:]:
+                        chunk = self._recv()
+                        if not chunk:
+                            return
+                        buf += chunk
+                    literal = buf[:size]
+                    rest, buf = buf[size:].split(b"\r\n", 1)
+                    line = line[:m.start()] + b"\x00LIT" + base64.b64encode(
+                            literal) + b"\x00" + rest
+                self.lines.put((arrived, line))
+                if re.match(rb"^\S+ COMPRESS ", line, re.I):
+                    self.compress_decided.wait()
+                    self.compress_decided.clear()
+                    if self.decompressor is not None and buf:
+                        buf = self.decompressor.decompress(buf)
+        except OSError:
+            pass
+        finally:
+            self.lines.put(None)
+
+
+    def _recv(self):
+        data = self.sock.recv(65536)
+        if data and self.decompressor is not None:
+            data = self.decompressor.decompress(data)
+            if not data:
+                # Compressed data with no output yet, keep reading
+                return self._recv()
+        return data
+
+
+    # -- Commands ---------------------------------------------------------
+
+    def _dispatch(self, arrived, line):
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            text = line.decode("latin-1")
+        parts = text.split(" ", 2)
+        if len(parts) < 2:
+            self.send("* BAD Missing command")
+            return True
+        tag, cmd = parts[0], parts[1].upper()
+        rest = parts[2] if len(parts) > 2 else ""
+        uid = False
+        if cmd == "UID":
+            sub = rest.split(" ", 1)
+            cmd = sub[0].upper()
+            rest = sub[1] if len(sub) > 1 else ""
+            uid = True
+
+        handler = getattr(self, "cmd_" + cmd.lower(), None)
+        if handler is None:
+            self.send("{} BAD Unknown command {}".format(tag, cmd))
+            return True
+        if cmd not in ("CAPABILITY", "LOGIN", "LOGOUT", "NOOP", "COMPRESS") \
+                and self.user is None:
+            self.send("{} NO Not authenticated".format(tag))
+            return True
+        self._buffer = []
+        try:
+            args = _tokenize(rest)
+            if cmd == "IDLE":
+                # IDLE runs until DONE, so it can't hold the lock or buffer
+                self.send("+ idling")
+                self._flush_buffer(arrived)
+                return handler(tag, args, uid, arrived) is not False
+            with self.owner._lock:
+                result = handler(tag, args, uid, arrived)
+        except _CommandError as err:
+            self.send("{} {} {}".format(tag, err.status, err.text))
+            result = None
+        except (ValueError, IndexError, KeyError) as err:
+            self.send("{} BAD Malformed command: {}".format(tag, err))
+            result = None
+        self._flush_buffer(arrived)
+        return result is not False
+
+
+    def _flush_pending(self):
+        with self.owner._lock:
+            pending, self.pending = self.pending, []
+        for line in pending:
+            self.send(line)
+
+
+    def cmd_capability(self, tag, args, uid, arrived):
+        self.send("* CAPABILITY " + " ".join(self.owner.capabilities))
+        self.send("{} OK CAPABILITY completed".format(tag))
+
+
+    def cmd_login(self, tag, args, uid, arrived):
+        if len(args) != 2:
+            raise _CommandError("BAD", "LOGIN needs user and password")
+        user, password = (_as_text(a) for a in args)
+        account = self.owner.accounts.get(user)
+        if account is None or account["password"] != password:
+            raise _CommandError("NO", "[AUTHENTICATIONFAILED] Invalid credentials")
+        self.user = user
+        self.send("{} OK [CAPABILITY {}] LOGIN completed".format(tag,
+                " ".join(self.owner.capabilities)))
+
+
+    def cmd_logout(self, tag, args, uid, arrived):
+        self.send("* BYE Logging out")
+        self.send("{} OK LOGOUT completed".format(tag))
+        return False
+
+
+    def cmd_noop(self, tag, args, uid, arrived):
+        self._flush_pending()
+        self.send("{} OK NOOP completed".format(tag))
+
+
+    def cmd_enable(self, tag, args, uid, arrived):
+        enabled = [_as_text(a).upper() for a in args
+                if _as_text(a).upper() in self.owner.capabilities]
+        self.send("* ENABLED " + " ".join(enabled))
+        self.send("{} OK ENABLE completed".format(tag))
+
+
+    def cmd_compress(self, tag, args, uid, arrived):
+        if ("COMPRESS=DEFLATE" not in self.owner.capabilities
+                or not args or _as_text(args[0]).upper() != "DEFLATE"):
+            self.compress_decided.set()
+            raise _CommandError("NO", "Compression not supported")
+        if self.compressor is not None:
+            self.compress_decided.set()
+            raise _CommandError("NO", "[COMPRESSIONACTIVE] Already compressing")
+        self.send("{} OK DEFLATE active".format(tag))
+        # The OK itself must go out uncompressed
+        self._flush_buffer(arrived)
+        self._buffer = []
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                zlib.DEFLATED, -15)
+        self.decompressor = zlib.decompressobj(-15)
+        self.compress_decided.set()
+
+
+    def cmd_select(self, tag, args, uid, arrived, readonly=False):
+        name = _as_text(args[0])
+        fld = self._folder(name)
+        self.selected = fld.name
+        self.readonly = readonly
+        self.pending = []
+        self.send("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        self.send("* {} EXISTS".format(len(fld.messages)))
+        self.send("* 0 RECENT")
+        self.send("* OK [UIDVALIDITY {}] UIDs valid".format(fld.uidvalidity))
+        self.send("* OK [UIDNEXT {}] Predicted next UID".format(fld.uidnext))
+        self.send("* OK [HIGHESTMODSEQ {}] Highest".format(fld.highestmodseq))
+        self.send("{} OK [{}] SELECT completed".format(tag,
+                "READ-ONLY" if readonly else "READ-WRITE"))
+
+
+    def cmd_examine(self, tag, args, uid, arrived):
+        return self.cmd_select(tag, args, uid, arrived, readonly=True)
+
+
+    def cmd_create(self, tag, args, uid, arrived):
+        name = _folder_name(_as_text(args[0]))
+        if name in self.owner.accounts[self.user]["folders"]:
+            raise _CommandError("NO", "[ALREADYEXISTS] Folder exists")
+        self.owner.create_folder(self.user, name)
+        self.send("{} OK CREATE completed".format(tag))
+
+
+    def cmd_delete(self, tag, args, uid, arrived):
+        name = _folder_name(_as_text(args[0]))
+        folders = self.owner.accounts[self.user]["folders"]
+        if name not in folders:
+            raise _CommandError("NO", "[NONEXISTENT] No such folder")
+        del folders[name]
+        self.send("{} OK DELETE completed".format(tag))
+
+
+    def cmd_list(self, tag, args, uid, arrived):
+        pattern = _as_text(args[1]) if len(args) > 1 else "*"
+        regex = "^" + re.escape(pattern).replace(r"\*", ".*").replace(
+                "%", "[^/]*") + "$"
+        for name in sorted(self.owner.accounts[self.user]["folders"]):
+            if re.match(regex, name):
+                self.send('* LIST (\\HasNoChildren) "/" "{}"'.format(name))
+        self.send("{} OK LIST completed".format(tag))
+
+
+    def cmd_status(self, tag, args, uid, arrived):
+        name = _as_text(args[0])
+        fld = self._folder(name)
+        items = []
+        for item in args[1]:
+            item = _as_text(item).upper()
+            value = {
+                "MESSAGES": len(fld.messages),
+                "RECENT": 0,
+                "UIDNEXT": fld.uidnext,
+                "UIDVALIDITY": fld.uidvalidity,
+                "UNSEEN": fld.unseen(),
+                "HIGHESTMODSEQ": fld.highestmodseq,
+            }.get(item)
+            if value is None:
+                raise _CommandError("BAD", "Unknown STATUS item " + item)
+            items.append("{} {}".format(item, value))
+        self.send('* STATUS "{}" ({})'.format(name, " ".join(items)))
+        self.send("{} OK STATUS completed".format(tag))
+
+
+    def cmd_idle(self, tag, args, uid, arrived):
+        while not self.closed:
+            self._flush_pending()
+            try:
+                item = self.lines.get(timeout=0.02)
+            except queue.Empty:
+                continue
+            if item is None:
+                return False
+            if item[1].strip().upper() == b"DONE":
+                break
+        self._flush_pending()
+        self.send("{} OK IDLE terminated".format(tag))
+
+
+    def cmd_notify(self, tag, args, uid, arrived):
+        if "NOTIFY" not in self.owner.capabilities:
+            raise _CommandError("BAD", "NOTIFY not supported")
+        if _as_text(args[0]).upper() == "NONE":
+            self.notify = None
+        else:
+            self.notify = set()
+            for spec in args[1:]:
+                kind = _as_text(spec[0]).lower()
+                if kind == "personal":
+                    self.notify = True
+                    break
+                if kind == "mailboxes":
+                    names = spec[1] if isinstance(spec[1], list) else [spec[1]]
+                    self.notify.update(_folder_name(_as_text(n)) for n in names)
+        self.send("{} OK NOTIFY completed".format(tag))
+
+
+    def cmd_search(self, tag, args, uid, arrived):
+        fld = self._selected()
+        if args and _as_text(args[0]).upper() == "CHARSET":
+            args = args[2:]
+        matches = [msg for msg in fld.messages
+                if _matches(fld, msg, list(args))]
+        ids = [str(msg.uid if uid else fld.messages.index(msg) + 1)
+                for msg in matches]
+        self._flush_pending()
+        self.send("* SEARCH" + "".join(" " + i for i in ids))
+        self.send("{} OK SEARCH completed".format(tag))
+
+
+    def cmd_fetch(self, tag, args, uid, arrived):
+        fld = self._selected()
+        msgs = _select_messages(fld, _as_text(args[0]), uid)
+        items = args[1] if isinstance(args[1], list) else [args[1]]
+        items = [_as_text(i).upper() for i in items]
+        changedsince = None
+        if len(args) > 2 and isinstance(args[2], list):
+            mods = [_as_text(m).upper() for m in args[2]]
+            if "CHANGEDSINCE" in mods:
+                changedsince = int(mods[mods.index("CHANGEDSINCE") + 1])
+        for msg in msgs:
+            if changedsince is not None and msg.modseq <= changedsince:
+                continue
+            parts = []
+            if uid or "UID" in items:
+                parts.append(b"UID " + str(msg.uid).encode())
+            for item in items:
+                if item == "UID":
+                    continue
+                elif item == "FLAGS":
+                    parts.append(b"FLAGS (" + " ".join(
+                            sorted(msg.flags)).encode() + b")")
+                elif item == "INTERNALDATE":
+                    parts.append(b'INTERNALDATE "' + msg.internal_date.strftime(
+                            "%d-%b-%Y %H:%M:%S %z").encode() + b'"')
+                elif item == "RFC822.SIZE":
+                    parts.append(b"RFC822.SIZE " + str(len(msg.raw)).encode())
+                elif item == "MODSEQ":
+                    parts.append(b"MODSEQ (" + str(msg.modseq).encode() + b")")
+                elif item in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+                    name = b"RFC822" if item == "RFC822" else b"BODY[]"
+                    parts.append(name + b" {" + str(len(msg.raw)).encode()
+                            + b"}\r\n" + msg.raw)
+                    if item != "BODY.PEEK[]" and not self.readonly \
+                            and "\\Seen" not in msg.flags:
+                        msg.flags.add("\\Seen")
+                        fld.highestmodseq += 1
+                        msg.modseq = fld.highestmodseq
+                elif item == "RFC822.HEADER":
+                    header = msg.raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+                    parts.append(b"RFC822.HEADER {" + str(len(header)).encode()
+                            + b"}\r\n" + header)
+                else:
+                    raise _CommandError("BAD", "Unsupported FETCH item " + item)
+            seq = fld.messages.index(msg) + 1
+            self.send(b"* " + str(seq).encode() + b" FETCH (" + b" ".join(parts)
+                    + b")")
+        self.send("{} OK FETCH completed".format(tag))
+
+
+    def cmd_store(self, tag, args, uid, arrived):
+        fld = self._selected()
+        if self.readonly:
+            raise _CommandError("NO", "Folder is read-only")
+        msgs = _select_messages(fld, _as_text(args[0]), uid)
+        rest = args[1:]
+        unchangedsince = None
+        if isinstance(rest[0], list):
+            mods = [_as_text(m).upper() for m in rest[0]]
+            unchangedsince = int(mods[mods.index("UNCHANGEDSINCE") + 1])
+            rest = rest[1:]
+        action = _as_text(rest[0]).upper()
+        values = rest[1] if isinstance(rest[1], list) else rest[1:]
+        values = {_as_text(v) for v in values}
+        silent = action.endswith(".SILENT")
+        action = action.replace(".SILENT", "")
+
+        modified = []
+        for msg in msgs:
+            if unchangedsince is not None and msg.modseq > unchangedsince:
+                modified.append(str(msg.uid if uid else
+                        fld.messages.index(msg) + 1))
+                continue
+            if action == "X-GM-LABELS" or action == "+X-GM-LABELS":
+                if "\\Trash" in values:
+                    self._trash.append(msg.uid)
+                continue
+            if action == "+FLAGS":
+                msg.flags |= values
+            elif action == "-FLAGS":
+                msg.flags -= values
+            elif action == "FLAGS":
+                msg.flags = set(values)
+            else:
+                raise _CommandError("BAD", "Unsupported STORE action " + action)
+            fld.highestmodseq += 1
+            msg.modseq = fld.highestmodseq
+            if not silent:
+                self.send("* {} FETCH (UID {} MODSEQ ({}) FLAGS ({}))".format(
+                        fld.messages.index(msg) + 1, msg.uid, msg.modseq,
+                        " ".join(sorted(msg.flags))))
+
+        trash, self._trash = self._trash, []
+        if trash:
+            for seq in self.owner._move(self.user, fld, trash, "Trash"):
+                self.send("* {} EXPUNGE".format(seq))
+
+        if modified:
+            self.send("{} OK [MODIFIED {}] Conditional STORE failed".format(
+                    tag, ",".join(modified)))
+        else:
+            self.send("{} OK STORE completed".format(tag))
+
+
+    def cmd_move(self, tag, args, uid, arrived):
+        fld = self._selected()
+        msgs = _select_messages(fld, _as_text(args[0]), uid)
+        dest = _folder_name(_as_text(args[1]))
+        if dest not in self.owner.accounts[self.user]["folders"]:
+            raise _CommandError("NO", "[TRYCREATE] No such folder")
+        uids = [msg.uid for msg in msgs]
+        for seq in self.owner._move(self.user, fld, uids, dest):
+            self.send("* {} EXPUNGE".format(seq))
+        self.send("{} OK MOVE completed".format(tag))
+
+
+    def _folder(self, name):
+        folders = self.owner.accounts[self.user]["folders"]
+        name = _folder_name(name)
+        if name not in folders:
+            raise _CommandError("NO", "[NONEXISTENT] No such folder " + name)
+        return folders[name]
+
+
+    def _selected(self):
+        if self.selected is None:
+            raise _CommandError("BAD", "No folder selected")
+        return self._folder(self.selected)
+
+
+class _SMTPSession:
+    """A single client connection to a FakeSMTPServer."""
+
+    def __init__(self, owner, rfile, wfile):
+        self.owner = owner
+        self.rfile = rfile
+        self.wfile = wfile
+
+
+    def reply(self, text):
+        if self.owner.latency:
+            time.sleep(self.owner.latency)
+        self.wfile.write(text.encode("utf-8") + b"\r\n")
+        self.wfile.flush()
+
+
+    def run(self):
+        sender = None
+        recipients = []
+        self.reply("220 Fake SMTP server ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            text = line.decode("utf-8", "replace").rstrip("\r\n")
+            cmd = text.split(" ", 1)[0].upper()
+            if cmd in ("EHLO", "HELO"):
+                if cmd == "EHLO":
+                    self.wfile.write(b"250-fake.smtp\r\n250-8BITMIME\r\n")
+                    self.reply("250 AUTH PLAIN LOGIN")
+                else:
+                    self.reply("250 fake.smtp")
+            elif cmd == "AUTH":
+                mech = text.split(" ")[1].upper()
+                if mech == "LOGIN" and len(text.split(" ")) == 2:
+                    self.reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                elif mech == "LOGIN":
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self.reply("235 Authentication successful")
+            elif cmd == "MAIL":
+                sender = text.split(":", 1)[1].strip().split(" ")[0].strip("<>")
+                recipients = []
+                self.reply("250 OK")
+            elif cmd == "RCPT":
+                recipients.append(text.split(":", 1)[1].strip().strip("<>"))
+                self.reply("250 OK")
+            elif cmd == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line == b".\r\n":
+                        break
+                    if line.startswith(b".."):
+                        line = line[1:]
+                    data.append(line)
+                self.owner._received(sender, recipients, b"".join(data))
+                self.reply("250 OK Message accepted")
+            elif cmd in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif cmd == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _CommandError(Exception):
+    """Raised by IMAP command handlers to send a tagged NO or BAD response."""
+
+    def __init__(self, status, text):
+        super().__init__(text)
+        self.status = status
+        self.text = text
+
+
+def _folder_name(name):
+    """Get the name a folder is stored under. INBOX isn't case sensitive."""
+
+    return "INBOX" if name.upper() == "INBOX" else name
+
+
+def _tokenize(text):
+    """Split IMAP command arguments into atoms, strings and nested lists."""
+
+    tokens = re.findall(r'\x00LIT[^\x00]*\x00|"(?:[^"\\]|\\.)*"|\(|\)'
+            r'|[^\s()"\[]+(?:\[[^\]]*\])?[^\s()"]*', text)
+    stack = [[]]
+    for tok in tokens:
+        if tok == "(":
+            stack.append([])
+        elif tok == ")":
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif tok.startswith('"'):
+            stack[-1].append(_Quoted(re.sub(r'\\(.)', r'\1', tok[1:-1])))
+        elif tok.startswith("\x00LIT"):
+            stack[-1].append(_Quoted(base64.b64decode(tok[4:-1]).decode(
+                    "utf-8", "replace")))
+        else:
+            stack[-1].append(tok)
+    return stack[0]
+
+
+class _Quoted(str):
+    """A quoted string argument."""
+
+
+def _as_text(token):
+    return str(token)
+
+
+def _parse_set(text, maximum):
+    """Parse an IMAP sequence set into a set of integers."""
+
+    out = set()
+    for part in text.split(","):
+        if ":" in part:
+            lo, hi = part.split(":")
+            lo = maximum if lo == "*" else int(lo)
+            hi = maximum if hi == "*" else int(hi)
+            lo, hi = min(lo, hi), max(lo, hi)
+            out.update(range(lo, hi + 1))
+        else:
+            out.add(maximum if part == "*" else int(part))
+    return out
+
+
+def _select_messages(fld, text, uid):
+    """Get the messages of a folder matching a sequence or UID set."""
+
+    if uid:
+        maximum = fld.messages[-1].uid if fld.messages else 0
+        wanted = _parse_set(text, maximum)
+        if text.endswith(":*") and fld.messages:
+            # A range ending in * always includes the last message
+            wanted.add(maximum)
+        return [msg for msg in fld.messages if msg.uid in wanted]
+    wanted = _parse_set(text, len(fld.messages))
+    return [msg for i, msg in enumerate(fld.messages) if i + 1 in wanted]
+
+
+def _matches(fld, msg, criteria):
+    """Check a message against a list of SEARCH criteria, consuming them."""
+
+    while criteria:
+        if not _match_one(fld, msg, criteria):
+            return False
+    return True
+
+
+def _match_one(fld, msg, criteria):
+    key = criteria.pop(0)
+    if isinstance(key, list):
+        return _matches(fld, msg, list(key))
+    key = _as_text(key).upper()
+    if key == "ALL":
+        return True
+    if key == "UNSEEN":
+        return "\\Seen" not in msg.flags
+    if key == "SEEN":
+        return "\\Seen" in msg.flags
+    if key == "DELETED":
+        return "\\Deleted" in msg.flags
+    if key == "UNDELETED":
+        return "\\Deleted" not in msg.flags
+    if key == "KEYWORD":
+        return _as_text(criteria.pop(0)) in msg.flags
+    if key == "UNKEYWORD":
+        return _as_text(criteria.pop(0)) not in msg.flags
+    if key == "NOT":
+        return not _match_one(fld, msg, criteria)
+    if key == "OR":
+        first = _match_one(fld, msg, criteria)
+        second = _match_one(fld, msg, criteria)
+        return first or second
+    if key == "UID":
+        return msg in _select_messages(fld, _as_text(criteria.pop(0)), True)
+    if key == "MODSEQ":
+        return msg.modseq >= int(_as_text(criteria.pop(0)))
+    if re.match(r"^[\d:*,]+$", key):
+        return msg in _select_messages(fld, key, False)
+    raise _CommandError("BAD", "Unsupported SEARCH key " + key)
@@ -11,6 +11,12 @@ Examples:
     # Get the current time for timeout comparison
     time = get_time()
 
+    # Calculate the delay before the third retry of a failed connection
+    delay = calc_backoff(2)
+
+    # Calculate the next polling interval after a poll found new emails
+    interval = calc_poll_interval(60, True, 5, 300)
+
 """
 
 import datetime
@@ -76,3 +82,48 @@ def get_time():
 
     return datetime.datetime.now().timestamp()
 
+
+def calc_backoff(attempt, base=0.25, maximum=30):
+    """Calculate the delay before retrying an operation, backing off exponentially.
+
+    Args:
+        attempt (int): The number of attempts that have already failed. The
+            first retry (attempt 0) isn't delayed at all.
+        base (float): The delay in seconds before the second retry, which is
+            doubled for each retry after that. Defaults to 0.25.
+        maximum (float): The longest delay in seconds. Defaults to 30.
+
+    Returns:
+        The delay in seconds.
+
+    """
+
+    if attempt <= 0:
+        return 0
+    return min(base * 2**(attempt - 1), maximum)
+
+
+def calc_poll_interval(interval, changed, min_interval, max_interval):
+    """Calculate the next polling interval from whether the last poll saw changes.
+
+    The interval halves each time a poll sees changes, so it tightens while
+    emails are arriving, and grows by half each time a poll sees nothing, so
+    it backs off while the folder is quiet.
+
+    Args:
+        interval (float): The current polling interval in seconds.
+        changed (bool): Whether the last poll saw changes.
+        min_interval (float): The shortest interval in seconds.
+        max_interval (float): The longest interval in seconds.
+
+    Returns:
+        The next polling interval in seconds.
+
+    """
+
+    if changed:
+        interval = interval / 2
+    else:
+        interval = interval * 1.5
+    return max(min_interval, min(interval, max_interval))
+
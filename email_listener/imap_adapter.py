@@ -0,0 +1,317 @@
+"""imap_adapter: The one place the internals of IMAPClient and imaplib are used.
+
+IMAPClient has no public way to pipeline commands, to send commands it doesn't
+know, like NOTIFY and COMPRESS, or to swap the socket it reads from. These need
+private methods of IMAPClient and of the imaplib connection underneath it,
+which can change in any release. IMAPInternals wraps every one of them, and is
+only created for the IMAPClient versions from MIN_VERSION up to MAX_VERSION,
+which have been tested. With any other version, or if a private method is
+missing, creating one raises AttributeError before anything is sent, and the
+callers fall back to IMAPClient's public methods: the pipeline sends its
+commands one by one, connections aren't compressed, and watch() sweeps the
+folders with STATUS rather than using NOTIFY.
+
+Example:
+
+    # Send a command, and read its completion and untagged responses
+    internals = IMAPInternals(listener.server)
+    tag = internals.send("UID", "FETCH", b"1:3", b"(RFC822)")
+    typ, data = internals.complete("FETCH", tag)
+    internals.check_ok("fetch", typ, data)
+    responses = internals.untagged("FETCH")
+
+"""
+
+# Imports from other packages
+import imapclient
+from imapclient.imap_utf7 import decode as decode_utf7
+from imapclient.imapclient import as_pairs
+from imapclient.response_parser import parse_response
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# The oldest IMAPClient version tested, and the first version that isn't
+MIN_VERSION = (2, 1)
+MAX_VERSION = (5, 0)
+
+# Whether the warning about an untested IMAPClient version has been logged
+_warned = False
+
+
+def supported_version():
+    """Check whether the installed IMAPClient is a tested version.
+
+    Args:
+        None
+
+    Returns:
+        True if its internals can be used.
+
+    """
+
+    return MIN_VERSION <= tuple(imapclient.version_info[:2]) < MAX_VERSION
+
+
+class IMAPInternals:
+    """IMAPInternals object wrapping the private methods of one IMAPClient connection.
+
+    Attributes:
+        server (IMAPClient): The connection.
+
+    """
+
+    def __init__(self, server):
+        """Initialize an IMAPInternals instance, looking up every private method.
+
+        Args:
+            server (IMAPClient): The connection.
+
+        Returns:
+            None
+
+        """
+
+        global _warned
+        if not supported_version():
+            if not _warned:
+                logger.warning("IMAPClient %s isn't a tested version, so "
+                        "pipelining, COMPRESS and NOTIFY aren't used",
+                        imapclient.__version__)
+                _warned = True
+            raise AttributeError("IMAPClient {} isn't a tested version".format(
+                    imapclient.__version__))
+        self.server = server
+        self.__imap = server._imap
+        self.__command = self.__imap._command
+        self.__command_complete = self.__imap._command_complete
+        self.__untagged_response = self.__imap._untagged_response
+        self.__simple_command = self.__imap._simple_command
+        self.__raw_command_untagged = server._raw_command_untagged
+        self.__checkok = server._checkok
+        self.__normalise_folder = server._normalise_folder
+        self.__normalise_labels = server._normalise_labels
+        # The socket and file are swapped by swap_socket()
+        self.__imap.sock, self.__imap.file
+
+
+    def send(self, name, *args):
+        """Send a command without waiting for its completion.
+
+        Args:
+            name (str): The command, such as "UID" or "STATUS".
+            *args (bytes): The command's arguments.
+
+        Returns:
+            The command's tag.
+
+        """
+
+        return self.__command(name, *args)
+
+
+    def complete(self, name, tag):
+        """Wait for the completion of a command sent with send().
+
+        Any untagged responses read on the way are kept for untagged().
+
+        Args:
+            name (str): The command's name, such as "FETCH".
+            tag (bytes): The command's tag.
+
+        Returns:
+            A tuple of the completion status, such as "OK", and its data.
+
+        """
+
+        return self.__command_complete(name, tag)
+
+
+    def untagged(self, name):
+        """Take the untagged responses of a type, read since they were last taken.
+
+        Args:
+            name (str): The type of response, such as "FETCH".
+
+        Returns:
+            A list of the responses.
+
+        """
+
+        typ, data = self.__untagged_response("OK", [None], name)
+        return [] if data == [None] else data
+
+
+    def check_ok(self, command, typ, data):
+        """Raise IMAPClient.Error if a command didn't complete with OK.
+
+        Args:
+            command (str): The command's name, for the error message.
+            typ (str): The completion status.
+            data (list): The completion data.
+
+        Returns:
+            None
+
+        """
+
+        self.__checkok(command, typ, data)
+
+
+    def simple_command(self, name, *args):
+        """Send a command IMAPClient has no method for, and wait for its completion.
+
+        Args:
+            name (str): The command, which must be in imaplib.Commands.
+            *args (str): The command's arguments.
+
+        Returns:
+            A tuple of the completion status and its data.
+
+        """
+
+        return self.__simple_command(name, *args)
+
+
+    def untagged_command(self, name, args):
+        """Send a command IMAPClient has no method for, raising if it fails.
+
+        Args:
+            name (bytes): The command, such as b"NOTIFY".
+            args (list): The command's arguments, as bytes.
+
+        Returns:
+            The command's untagged responses.
+
+        """
+
+        return self.__raw_command_untagged(name, args, uid=False)
+
+
+    def normalise_folder(self, folder):
+        """Encode a folder name as IMAPClient would for a command.
+
+        Args:
+            folder (str): The folder name.
+
+        Returns:
+            The folder name, as bytes.
+
+        """
+
+        return self.__normalise_folder(folder)
+
+
+    def normalise_labels(self, labels):
+        """Encode Gmail labels as IMAPClient would for a command.
+
+        Args:
+            labels (list or str): The labels.
+
+        Returns:
+            A list of the labels, as bytes.
+
+        """
+
+        return self.__normalise_labels(labels)
+
+
+    def swap_socket(self, sock):
+        """Replace the socket the connection reads from and writes to.
+
+        Args:
+            sock (object): The new socket, with a makefile() method giving the
+                file to read responses from.
+
+        Returns:
+            The old socket.
+
+        """
+
+        old = self.__imap.sock
+        self.__imap.file.close()
+        self.__imap.sock = sock
+        self.__imap.file = sock.makefile()
+        return old
+
+
+    @property
+    def sock(self):
+        """The socket the connection reads from and writes to."""
+
+        return self.__imap.sock
+
+
+def server_socket(server):
+    """Get the socket of an IMAPClient connection.
+
+    Older IMAPClient versions, such as the pinned 2.1.0, have no socket()
+    method, so the socket is taken from the imaplib connection underneath.
+
+    Args:
+        server (IMAPClient): The connection.
+
+    Returns:
+        The connected socket, which is an ssl.SSLSocket for TLS connections.
+
+    """
+
+    socket = getattr(server, "socket", None)
+    if socket is not None:
+        return socket()
+    return server._imap.sock
+
+
+def parse_statuses(data):
+    """Parse untagged STATUS responses.
+
+    Args:
+        data (list): The responses, as returned by IMAPInternals.untagged().
+
+    Returns:
+        A dictionary of each folder's status items, in the same format as
+        IMAPClient.folder_status(), keyed by folder_key() of its name.
+
+    """
+
+    statuses = {}
+    for response in data:
+        name, items = parse_response([response])
+        statuses[folder_key(name)] = dict(as_pairs(items))
+    return statuses
+
+
+def folder_key(name):
+    """Get the key to match a folder name in a STATUS response.
+
+    Args:
+        name (bytes or int): The folder name, as parsed from a response.
+            Numeric names are parsed as integers.
+
+    Returns:
+        The folder name as bytes, with INBOX in upper case, as its name isn't
+        case sensitive.
+
+    """
+
+    if isinstance(name, int):
+        name = str(name).encode("ascii")
+    return b"INBOX" if name.upper() == b"INBOX" else name
+
+
+def folder_name(name):
+    """Decode a folder name parsed from a response, such as an untagged STATUS.
+
+    Args:
+        name (bytes or int): The folder name, as parsed from a response.
+            Numeric names are parsed as integers.
+
+    Returns:
+        The folder name, as a string.
+
+    """
+
+    if isinstance(name, int):
+        return str(name)
+    return decode_utf7(name)
@@ -0,0 +1,179 @@
+"""instrumentation: Per-stage timing of the listener pipeline.
+
+Example:
+
+    # Time every stage of the listener's scrapes and IDLE wake ups
+    stats = PipelineStats()
+    listener.stats = stats
+    listener.scrape()
+
+    # See where the time went in the last cycle, and in total
+    print(stats.last_cycle)
+    print(stats.as_dict())
+
+    # Or have each finished cycle passed to a callback
+    stats.callbacks.append(lambda cycle: print(cycle["kind"], cycle["seconds"]))
+
+"""
+
+# Imports from other packages
+import threading
+import time
+
+
+# The stages timed, in pipeline order. The parse stage includes the time spent
+# in html2text and writing attachments, which are also timed on their own.
+STAGES = (
+    "idle_wait",
+    "search",
+    "claim",
+    "fetch",
+    "parse",
+    "html2text",
+    "attachment_write",
+    "execute_options",
+    "process_func",
+)
+
+
+class PipelineStats:
+    """PipelineStats object for recording the time each pipeline stage takes.
+
+    Each stage adds its duration, the bytes it handled and the emails it
+    handled. These are summed into the totals, and into the cycle in progress
+    if there is one. A cycle is one scrape(), or one IDLE wake up along with
+    the scrape and process function call it leads to; a scrape within an IDLE
+    wake up is part of the wake up's cycle.
+
+    Timing is only done when a listener's stats attribute is set, so a listener
+    without one pays nothing but an attribute check per stage.
+
+    Attributes:
+        totals (dict): For each stage, a dictionary of the number of times it
+            ran, and its total seconds, bytes and emails.
+        cycles (int): The number of cycles finished.
+        last_cycle (dict): The last finished cycle, or None. Holds the kind
+            and folder of the cycle, its total seconds, and the totals of each
+            stage which ran in it.
+        callbacks (list): Functions called with each finished cycle's
+            dictionary.
+        profiler (CycleProfiler): A profiler started at the beginning of each
+            cycle, and told when each stage finishes. Defaults to None.
+
+    """
+
+    def __init__(self):
+        """Initialize a PipelineStats instance, with every total at zero.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.totals = {stage: {"calls": 0, "seconds": 0.0, "bytes": 0, "emails": 0}
+                for stage in STAGES}
+        self.cycles = 0
+        self.last_cycle = None
+        self.callbacks = []
+        self.profiler = None
+        self.__lock = threading.Lock()
+        self.__cycle = None
+        self.__depth = 0
+
+
+    def begin(self, kind, folder):
+        """Start a cycle, unless one is already in progress.
+
+        Args:
+            kind (str): What the cycle is, such as "scrape" or "idle".
+            folder (str): The folder the cycle is for.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.__depth += 1
+            if self.__depth != 1:
+                return
+            self.__cycle = {"kind": kind, "folder": folder,
+                    "start": time.perf_counter(), "stages": {}}
+        if self.profiler is not None:
+            self.profiler.start(kind, folder)
+
+
+    def end(self):
+        """Finish the cycle started by the matching begin().
+
+        The outermost cycle is stored as last_cycle and passed to each callback.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.__depth -= 1
+            if self.__depth > 0 or self.__cycle is None:
+                return
+            cycle, self.__cycle = self.__cycle, None
+            cycle["seconds"] = time.perf_counter() - cycle.pop("start")
+            self.cycles += 1
+            self.last_cycle = cycle
+        if self.profiler is not None:
+            self.profiler.stop()
+        for callback in self.callbacks:
+            callback(cycle)
+
+
+    def add(self, stage, seconds, nbytes=0, emails=0):
+        """Add a run of a stage.
+
+        Args:
+            stage (str): One of STAGES.
+            seconds (float): How long the stage took.
+            nbytes (int): The number of bytes the stage handled. Defaults to 0.
+            emails (int): The number of emails the stage handled. Defaults
+                to 0.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            totals = [self.totals[stage]]
+            if self.__cycle is not None:
+                totals.append(self.__cycle["stages"].setdefault(stage,
+                        {"calls": 0, "seconds": 0.0, "bytes": 0, "emails": 0}))
+            for total in totals:
+                total["calls"] += 1
+                total["seconds"] += seconds
+                total["bytes"] += nbytes
+                total["emails"] += emails
+        if self.profiler is not None:
+            self.profiler.stage(stage, seconds)
+
+
+    def as_dict(self):
+        """Get the number of cycles and the totals of each stage.
+
+        Args:
+            None
+
+        Returns:
+            A dictionary of the cycle count and a copy of the stage totals.
+
+        """
+
+        with self.__lock:
+            return {"cycles": self.cycles,
+                    "stages": {stage: dict(total)
+                            for stage, total in self.totals.items()}}
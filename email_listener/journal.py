@@ -0,0 +1,222 @@
+"""journal: Write-ahead checkpoint journal for exactly-once email processing.
+
+Example:
+
+    # Open (or resume) a journal, and have the listener use it
+    listener.journal = CheckpointJournal("./files/checkpoint.journal")
+
+    # Emails are now fetched without marking them as seen, and recorded as
+    # fetched. They are only marked as seen, moved or deleted after the
+    # process function returns, so a crash in between loses nothing.
+    listener.listen(5, "email_listener", send_reply)
+
+    # See which emails of a folder were processed but not yet acknowledged
+    journal = listener.journal
+    print(journal.uids("Inbox", 1, PROCESSED))
+
+"""
+
+# Imports from other packages
+import json
+import os
+
+
+# The states an email moves through, in order
+FETCHED = "fetched"
+PROCESSED = "processed"
+ACKNOWLEDGED = "acknowledged"
+
+
+class CheckpointJournal:
+    """CheckpointJournal object for recording the state of each scraped email.
+
+    Each email is identified by its folder, the folder's UIDVALIDITY and its
+    UID. Every state change is appended to the journal file as one JSON line
+    per batch of emails, and synced to disk before it is acted on. Opening an
+    existing journal replays it, so a restarted listener knows which emails to
+    refetch, which only need acknowledging, and the highest UID it has seen.
+
+    Attributes:
+        path (str): The file path of the journal.
+        states (dict): The state of each email, keyed by (folder, UIDVALIDITY)
+            tuples, each holding a dictionary of UIDs to states.
+        compact_threshold (int): The number of records appended before the
+            journal is rewritten without the acknowledged emails.
+
+    """
+
+    compact_threshold = 10000
+
+    def __init__(self, path):
+        """Initialize a CheckpointJournal instance, replaying any existing journal.
+
+        Args:
+            path (str): The file path of the journal. It is created if it
+                doesn't exist.
+
+        Returns:
+            None
+
+        """
+
+        self.path = path
+        self.states = {}
+        self.__records = 0
+        self.__load()
+        self.__file = open(self.path, "a", encoding="utf-8")
+
+
+    def record(self, folder, uidvalidity, uids, state):
+        """Record that emails have reached a state, and sync it to disk.
+
+        Args:
+            folder (str): The folder the emails are in.
+            uidvalidity (int): The folder's UIDVALIDITY.
+            uids (list): The UIDs of the emails.
+            state (str): One of FETCHED, PROCESSED or ACKNOWLEDGED.
+
+        Returns:
+            None
+
+        """
+
+        if not uids:
+            return
+        record = {"folder": folder, "uidvalidity": uidvalidity,
+                "uids": [int(uid) for uid in uids], "state": state}
+        self.__file.write(json.dumps(record) + "\n")
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__apply(record)
+
+        self.__records += 1
+        if self.__records >= self.compact_threshold:
+            self.compact()
+
+
+    def uids(self, folder, uidvalidity, state):
+        """Get the UIDs of the emails in a folder which are in a state.
+
+        Args:
+            folder (str): The folder the emails are in.
+            uidvalidity (int): The folder's UIDVALIDITY.
+            state (str): One of FETCHED, PROCESSED or ACKNOWLEDGED.
+
+        Returns:
+            A sorted list of UIDs.
+
+        """
+
+        states = self.states.get((folder, uidvalidity), {})
+        return sorted(uid for uid, uid_state in states.items() if uid_state == state)
+
+
+    def last_uid(self, folder, uidvalidity):
+        """Get the highest UID recorded for a folder.
+
+        Args:
+            folder (str): The folder to check.
+            uidvalidity (int): The folder's UIDVALIDITY.
+
+        Returns:
+            The highest UID, or None if nothing has been recorded for the
+            folder with this UIDVALIDITY.
+
+        """
+
+        states = self.states.get((folder, uidvalidity))
+        return max(states) if states else None
+
+
+    def compact(self):
+        """Rewrite the journal without the acknowledged emails.
+
+        Only the highest UID of each folder is kept once acknowledged, so
+        last_uid() is unchanged. The new journal replaces the old one
+        atomically.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            for (folder, uidvalidity), states in self.states.items():
+                last = max(states)
+                for uid in [uid for uid, state in states.items()
+                        if state == ACKNOWLEDGED and uid != last]:
+                    del states[uid]
+                for state in (FETCHED, PROCESSED, ACKNOWLEDGED):
+                    uids = self.uids(folder, uidvalidity, state)
+                    if uids:
+                        file.write(json.dumps({"folder": folder,
+                                "uidvalidity": uidvalidity, "uids": uids,
+                                "state": state}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.__file.close()
+        os.replace(temp_path, self.path)
+        self.__file = open(self.path, "a", encoding="utf-8")
+        self.__records = 0
+
+
+    def close(self):
+        """Close the journal file.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.__file.close()
+
+
+    def __load(self):
+        """Helper function, replays the journal file into the states attribute.
+
+        A partly written last line, left by a crash, is discarded.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as file:
+            data = file.read()
+            # Cut off anything after the last complete line
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                file.truncate(end)
+        for line in data[:end].splitlines():
+            if line.strip():
+                self.__apply(json.loads(line))
+                self.__records += 1
+
+
+    def __apply(self, record):
+        """Helper function, applies a record to the states attribute.
+
+        Args:
+            record (dict): The decoded journal record.
+
+        Returns:
+            None
+
+        """
+
+        states = self.states.setdefault((record["folder"], record["uidvalidity"]), {})
+        for uid in record["uids"]:
+            states[uid] = record["state"]
@@ -0,0 +1,411 @@
+"""jsonl_sink: Append scraped emails to rotating JSON lines files.
+
+Rather than one file per email, each email is appended to the current
+segment file as one compact JSON line. Segments are rotated by size or age,
+and an offset index allows reading an email back by its folder and key.
+
+Example:
+
+    # Use a sink as the process function, syncing to disk once per batch
+    sink = JSONLSink("./files/emails/", fsync="batch", max_bytes=64 * 2**20)
+    listener.listen(60, process_func=sink)
+
+    # Read an email back by its folder and key
+    msg = sink.get("Inbox", "12_somebody@gmail.com")
+    sink.close()
+
+    # Or use the sink kept for the listener's attachment_dir, which can be
+    # named on the command line as email_listener.jsonl_sink:write_jsonl_file
+    listener.listen(60, process_func=write_jsonl_file)
+
+"""
+
+# Imports from other packages
+import json
+import os
+import re
+import threading
+import time
+
+
+# The fsync policies a sink can use
+FSYNC_POLICIES = ("batch", "records", "interval", "never")
+
+# The sinks used by write_jsonl_file(), keyed by directory
+_sinks = {}
+
+
+class JSONLSink:
+    """JSONLSink object for appending emails to rotating JSON lines segments.
+
+    Each email is written as {"key": ..., "folder": ..., "data": ...}, where
+    data is the email's value dictionary from scrape(). Segments are named
+    <prefix>-<number>.jsonl. The index file, <prefix>.index, holds a JSON line
+    of [folder, key, segment number, offset, length] per email. Keys start
+    with the email's UID, which is only unique within a folder, so emails are
+    indexed by their folder and key. An email written twice is found at its
+    latest offset.
+
+    Attributes:
+        directory (str): The folder the segments and index are written to.
+        prefix (str): The start of each segment's file name.
+        fsync (str): When data is synced to disk. One of "batch", after each
+            call of the sink; "records", after every fsync_records emails;
+            "interval", at most fsync_interval seconds after each write; or
+            "never", which leaves it to the operating system.
+        fsync_records (int): The number of emails between syncs with the
+            "records" policy.
+        fsync_interval (float): The most seconds between a write and its sync
+            with the "interval" policy.
+        max_bytes (int): The size a segment is rotated at.
+        max_age (float): The number of seconds after a segment is opened that
+            it is rotated at, or None to only rotate by size.
+        index (dict): The location of each email, keyed by a tuple of its
+            folder and key, as a tuple of the segment number, offset and
+            length.
+
+    """
+
+    def __init__(self, directory, prefix="emails", fsync="batch",
+            fsync_records=1000, fsync_interval=1.0, max_bytes=64 * 2**20,
+            max_age=None):
+        """Initialize a JSONLSink instance, resuming any segments in the directory.
+
+        Args:
+            directory (str): The folder to write to. It is created if it
+                doesn't exist.
+            prefix (str): The start of each segment's file name. Defaults to
+                "emails".
+            fsync (str): The fsync policy. Defaults to "batch".
+            fsync_records (int): The emails between syncs with the "records"
+                policy. Defaults to 1000.
+            fsync_interval (float): The most seconds between a write and its
+                sync with the "interval" policy. Defaults to 1.
+            max_bytes (int): The size to rotate segments at. Defaults to 64 MiB.
+            max_age (float): The age in seconds to rotate segments at. Defaults
+                to None, which only rotates by size.
+
+        Returns:
+            None
+
+        """
+
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("fsync must be one of {}".format(", ".join(FSYNC_POLICIES)))
+        self.directory = directory
+        self.prefix = prefix
+        self.fsync = fsync
+        self.fsync_records = fsync_records
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index = {}
+        self.__lock = threading.RLock()
+        self.__unsynced = 0
+        self.__closed = threading.Event()
+        self.__sync_thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.__index_path = os.path.join(directory, prefix + ".index")
+        self.__segment = self.__load()
+        self.__open_segment()
+        if fsync == "interval":
+            self.__sync_thread = threading.Thread(target=self.__sync_loop,
+                    daemon=True)
+            self.__sync_thread.start()
+
+
+    def __call__(self, email_listener, msg_dict):
+        """Append a batch of scraped emails, so the sink can be a process function.
+
+        Args:
+            email_listener (EmailListener): The EmailListener object this
+                function is used with.
+            msg_dict (dict): The dictionary of email message data returned by
+                the scraping function.
+
+        Returns:
+            A list of the (segment path, offset) of each email written.
+
+        """
+
+        return self.write(msg_dict, getattr(email_listener, "folder", None))
+
+
+    def write(self, msg_dict, folder=None):
+        """Append a batch of emails.
+
+        Args:
+            msg_dict (dict): The emails, keyed by key, as returned by scrape().
+            folder (str): The folder the emails came from. Defaults to None.
+
+        Returns:
+            A list of the (segment path, offset) of each email written.
+
+        """
+
+        written = []
+        with self.__lock:
+            for key, val_dict in msg_dict.items():
+                self.__rotate_if_due()
+                line = json.dumps({"key": key, "folder": folder, "data": val_dict},
+                        separators=(",", ":")).encode("utf-8") + b"\n"
+                offset = self.__size
+                self.__file.write(line)
+                self.__size += len(line)
+                self.__index_file.write(json.dumps([folder, key, self.__segment,
+                        offset, len(line)], separators=(",", ":")) + "\n")
+                self.index[(folder, key)] = (self.__segment, offset, len(line))
+                written.append((self.segment_path(self.__segment), offset))
+                self.__unsynced += 1
+                if self.fsync == "records" and self.__unsynced >= self.fsync_records:
+                    self.sync()
+            if self.fsync == "batch":
+                self.sync()
+            else:
+                self.__file.flush()
+                self.__index_file.flush()
+        return written
+
+
+    def get(self, folder, key):
+        """Read an email back by its folder and key.
+
+        Args:
+            folder (str): The folder the email came from, or None if it was
+                written without one.
+            key (str): The email's key.
+
+        Returns:
+            The email's record, holding its key, folder and data, or None if
+            there is no email with the folder and key.
+
+        """
+
+        with self.__lock:
+            location = self.index.get((folder, key))
+            if location is None:
+                return None
+            segment, offset, length = location
+            if segment == self.__segment:
+                self.__file.flush()
+        with open(self.segment_path(segment), "rb") as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+
+    def keys(self):
+        """Get the folder and key of every email written.
+
+        Args:
+            None
+
+        Returns:
+            A list of tuples of each email's folder and key.
+
+        """
+
+        with self.__lock:
+            return list(self.index)
+
+
+    def segment_path(self, segment):
+        """Get the file path of a segment.
+
+        Args:
+            segment (int): The segment number.
+
+        Returns:
+            The file path.
+
+        """
+
+        return os.path.join(self.directory, "{}-{:06d}.jsonl".format(self.prefix,
+                segment))
+
+
+    def sync(self):
+        """Flush the current segment and index, and sync them to disk.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            if self.__unsynced == 0:
+                return
+            for file in (self.__file, self.__index_file):
+                file.flush()
+                os.fsync(file.fileno())
+            self.__unsynced = 0
+
+
+    def rotate(self):
+        """Close the current segment, and start a new one.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.sync()
+            self.__file.close()
+            self.__segment += 1
+            self.__open_segment()
+
+
+    def close(self):
+        """Sync and close the sink.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.__closed.set()
+        if self.__sync_thread is not None:
+            self.__sync_thread.join()
+        with self.__lock:
+            self.sync()
+            self.__file.close()
+            self.__index_file.close()
+
+
+    def __rotate_if_due(self):
+        """Helper function, rotates the segment if it is too big or too old.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        if self.__size >= self.max_bytes or (self.max_age is not None
+                and time.time() - self.__opened >= self.max_age):
+            if self.__size > 0:
+                self.rotate()
+
+
+    def __open_segment(self):
+        """Helper function, opens the current segment for appending.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.__file = open(self.segment_path(self.__segment), "ab")
+        self.__size = self.__file.tell()
+        self.__opened = time.time()
+
+
+    def __load(self):
+        """Helper function, loads the index, and recovers the last segment.
+
+        Emails appended to the last segment after the index was last synced
+        are indexed again from the segment, and a partly written last line,
+        left by a crash, is discarded.
+
+        Args:
+            None
+
+        Returns:
+            The number of the segment to append to.
+
+        """
+
+        pattern = re.compile(re.escape(self.prefix) + r"-(\d+)\.jsonl$")
+        segments = sorted(int(match.group(1)) for match in
+                (pattern.match(name) for name in os.listdir(self.directory)) if match)
+        last = segments[-1] if segments else 0
+
+        # Load the index, ignoring a partly written last line
+        indexed_end = 0
+        if os.path.exists(self.__index_path):
+            with open(self.__index_path, "rb+") as file:
+                data = file.read()
+                end = data.rfind(b"\n") + 1
+                if end != len(data):
+                    file.truncate(end)
+            for line in data[:end].splitlines():
+                folder, key, segment, offset, length = json.loads(line)
+                self.index[(folder, key)] = (segment, offset, length)
+                if segment == last:
+                    indexed_end = max(indexed_end, offset + length)
+        self.__index_file = open(self.__index_path, "a", encoding="utf-8")
+
+        # Index any complete lines of the last segment past the indexed ones
+        path = self.segment_path(last)
+        if not os.path.exists(path):
+            return last
+        with open(path, "rb+") as file:
+            file.seek(indexed_end)
+            data = file.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                file.truncate(indexed_end + end)
+        offset = indexed_end
+        for line in data[:end].splitlines(keepends=True):
+            record = json.loads(line)
+            folder, key = record["folder"], record["key"]
+            self.index[(folder, key)] = (last, offset, len(line))
+            self.__index_file.write(json.dumps([folder, key, last, offset,
+                    len(line)], separators=(",", ":")) + "\n")
+            offset += len(line)
+        self.__index_file.flush()
+        return last
+
+
+    def __sync_loop(self):
+        """Helper function, syncs any unsynced writes every fsync_interval seconds.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        while not self.__closed.wait(self.fsync_interval):
+            self.sync()
+
+
+def write_jsonl_file(email_listener, msg_dict):
+    """Append the email message data returned from scrape to JSON lines segments.
+
+    A JSONLSink with the default options is kept for each attachment_dir, and
+    written to in its "emails" subfolder.
+
+    Args:
+        email_listener (EmailListener): The EmailListener object this function
+            is used with.
+        msg_dict (dict): The dictionary of email message data returned by the
+            scraping function.
+
+    Returns:
+        A list of the (segment path, offset) of each email written.
+
+    """
+
+    directory = os.path.join(email_listener.attachment_dir, "emails")
+    sink = _sinks.get(directory)
+    if sink is None:
+        sink = _sinks[directory] = JSONLSink(directory)
+    return sink(email_listener, msg_dict)
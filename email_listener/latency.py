@@ -0,0 +1,166 @@
+"""latency: Sliding window percentiles of how long emails wait to be processed.
+
+Example:
+
+    # Track the latency of each email the listener processes
+    listener.latency = LatencyTracker(window=300)
+    listener.listen(60)
+
+    # Get the 50th, 90th and 99th percentiles over the last 5 minutes, of the
+    # time from each email's delivery (its INTERNALDATE) to the listener
+    # fetching it, and from fetching it to the process function finishing
+    print(listener.latency.summary())
+
+"""
+
+# Imports from other packages
+from collections import deque
+import math
+import threading
+import time
+
+
+class SlidingWindow:
+    """SlidingWindow object holding the values added within a recent time span.
+
+    Attributes:
+        window (float): The number of seconds values are kept for.
+        max_samples (int): The most values kept, with the oldest dropped
+            first, so a burst of emails can't use unbounded memory.
+
+    """
+
+    def __init__(self, window=300, max_samples=10000):
+        """Initialize a SlidingWindow instance with no values.
+
+        Args:
+            window (float): The number of seconds to keep values for. Defaults
+                to 300.
+            max_samples (int): The most values to keep. Defaults to 10000.
+
+        Returns:
+            None
+
+        """
+
+        self.window = window
+        self.max_samples = max_samples
+        self.__values = deque(maxlen=max_samples)
+        self.__lock = threading.Lock()
+
+
+    def add(self, value, now=None):
+        """Add a value.
+
+        Args:
+            value (float): The value to add.
+            now (float): The time the value was measured at, in seconds since
+                epoch. Defaults to None, which uses the current time.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.__values.append((time.time() if now is None else now, value))
+
+
+    def values(self, now=None):
+        """Get the values added within the window, dropping older ones.
+
+        Args:
+            now (float): The time the window ends at, in seconds since epoch.
+                Defaults to None, which uses the current time.
+
+        Returns:
+            A list of the values, oldest first.
+
+        """
+
+        start = (time.time() if now is None else now) - self.window
+        with self.__lock:
+            while self.__values and self.__values[0][0] < start:
+                self.__values.popleft()
+            return [value for _, value in self.__values]
+
+
+    def percentiles(self, percents=(50, 90, 99), now=None):
+        """Get percentiles of the values within the window.
+
+        Uses the nearest rank method, so each percentile is one of the values.
+
+        Args:
+            percents (tuple): The percentiles to get, from 0 to 100. Defaults
+                to (50, 90, 99).
+            now (float): The time the window ends at, in seconds since epoch.
+                Defaults to None, which uses the current time.
+
+        Returns:
+            A dictionary of the number of values, their maximum, and each
+            percentile keyed as "p<percent>". The maximum and percentiles are
+            None if there are no values.
+
+        """
+
+        values = sorted(self.values(now))
+        summary = {"count": len(values), "max": values[-1] if values else None}
+        for percent in percents:
+            if not values:
+                summary["p{}".format(percent)] = None
+                continue
+            rank = max(1, math.ceil(percent / 100 * len(values)))
+            summary["p{}".format(percent)] = values[rank - 1]
+        return summary
+
+
+class LatencyTracker:
+    """LatencyTracker object holding the latency windows of a listener.
+
+    An email is detected when the scrape that fetches it starts.
+
+    Attributes:
+        delivery_to_detect (SlidingWindow): The seconds from each email's
+            INTERNALDATE to it being detected.
+        detect_to_processed (SlidingWindow): The seconds from each email being
+            detected to the process function finishing with it.
+        delivery_to_processed (SlidingWindow): The seconds from each email's
+            INTERNALDATE to the process function finishing with it.
+
+    """
+
+    def __init__(self, window=300, max_samples=10000):
+        """Initialize a LatencyTracker instance.
+
+        Args:
+            window (float): The number of seconds each window covers. Defaults
+                to 300.
+            max_samples (int): The most values each window keeps. Defaults to
+                10000.
+
+        Returns:
+            None
+
+        """
+
+        self.delivery_to_detect = SlidingWindow(window, max_samples)
+        self.detect_to_processed = SlidingWindow(window, max_samples)
+        self.delivery_to_processed = SlidingWindow(window, max_samples)
+
+
+    def summary(self, percents=(50, 90, 99)):
+        """Get the percentiles of every window.
+
+        Args:
+            percents (tuple): The percentiles to get. Defaults to (50, 90, 99).
+
+        Returns:
+            A dictionary of each window's percentiles, as returned by
+            SlidingWindow.percentiles(), keyed by the window's name.
+
+        """
+
+        now = time.time()
+        return {name: getattr(self, name).percentiles(percents, now)
+                for name in ("delivery_to_detect", "detect_to_processed",
+                        "delivery_to_processed")}
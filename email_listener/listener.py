@@ -0,0 +1,1930 @@
+"""listener: Listen in an email folder and process incoming emails.
+
+Example:
+
+    # Create the listener
+    listener = EmailListener("example@email.com", "badpassword", "Inbox", "./files/")
+    # Log the listener into the IMAP server
+    listener.login()
+    # Scrape emails from the folder without moving them
+    listener.scrape()
+    # Scrape emails from the folder, and move them to the "email_listener" folder
+    listener.scrape("email_listener")
+    # Listen in the folder for 5 minutes, without moving the emails, and not
+    # calling any process function on the emails.
+    listener.listen(5)
+    # Listen in the folder until 1:30pm, moving each new email to the "email_listener"
+    # folder, and calling the processing function 'send_reply()'
+    listener.listen([13, 30], "email_listener", send_reply)
+    # Log the listener out of the IMAP server
+    listener.logout()
+
+"""
+
+# Imports from other packages
+from imapclient import IMAPClient, SEEN
+import logging
+import random
+import socket
+import threading
+import time
+# Imports from this package
+from .helpers import (
+    calc_backoff,
+    calc_poll_interval,
+    calc_timeout,
+    get_time,
+)
+from .claims import claim_keyword, claim_time, parse_modified
+from .compression import enable_compression, TransferStats
+from .connection import SessionCachingContext
+from .email_processing import write_txt_file
+from .imap_adapter import folder_name, IMAPInternals, server_socket
+from .journal import ACKNOWLEDGED, FETCHED, PROCESSED
+from .parsing import parse_message
+from .pipeline import IMAPPipeline
+
+
+logger = logging.getLogger(__name__)
+
+class EmailListener:
+    """EmailListener object for listening to an email folder and processing emails.
+
+    Attributes:
+        email (str): The email to listen to.
+        app_password (str): The password for the email.
+        folder (str): The email folder to listen in.
+        attachment_dir (str): The file path to the folder to save scraped
+            emails and attachments to.
+        server (IMAPClient): The IMAP server to log into. Defaults to None.
+        host (str): The IMAP host to connect to. Set by login(). Defaults to
+            'imap.gmail.com'.
+        port (int): The port to connect to, or None for the default port of
+            the connection type. Set by login(). Defaults to None.
+        use_ssl (bool): Whether connections use TLS. Set by login(). Defaults
+            to True.
+        ssl_context (SessionCachingContext): The SSL context used for
+            connections, which caches the TLS session so reconnects can
+            resume it. Set by login(). Defaults to None.
+        standby (IMAPClient): A spare connection, logged in with the folder
+            selected, which listen() switches to if the main connection fails.
+            Only kept when listening with the standby option. Defaults to None.
+        standby_noop_interval (int): The number of seconds between NOOPs
+            that keep the standby connection alive.
+        compress (bool): Whether connections negotiate COMPRESS=DEFLATE when
+            the server supports it. Set by login(). Defaults to True.
+        transfer_stats (TransferStats): Counters for the bytes sent and
+            received on the wire and before compression, and the time spent
+            transferring them, across every compressed connection.
+        fetch_chunk_size (int): The number of emails requested by each FETCH
+            command in scrape(). The FETCH commands are pipelined, so chunking
+            keeps command lines short without costing extra round trips.
+        journal (CheckpointJournal): A write-ahead journal of each scraped
+            email's state. When set, scrape() leaves emails unseen and defers
+            the move, unread and delete options until acknowledge() is called,
+            which listen(), poll() and watch() do once the process function
+            returns. Defaults to None.
+        claim_timeout (int): The number of seconds after which another
+            listener's claim on an email is stale, and the email can be claimed
+            again. Emails must be processed within this time.
+        claim_batch_size (int): The most emails claimed by each scrape.
+        stats (PipelineStats): Timings of each stage of every scrape() and
+            IDLE wake up, such as the SEARCH, FETCH, parsing and process
+            function. Defaults to None, which doesn't time anything.
+        metrics (ListenerMetrics): Counters and histograms of the emails
+            scraped and processed, the delay from their delivery, reconnects
+            and TLS session resumption, which can be served to Prometheus.
+            Defaults to None, which doesn't count anything.
+        latency (LatencyTracker): Sliding windows of the time from each
+            email's delivery to it being detected, and from it being detected
+            to being processed. Defaults to None, which doesn't track them.
+        raw_archive (ArchiveWriter): A compressed archive the RFC822 source of
+            each scraped email is appended to, along with its folder, UID and
+            INTERNALDATE. It is flushed after each scrape. Defaults to None,
+            which doesn't keep the source.
+        raw_store (RawStore): A store the RFC822 source of each scraped email
+            is appended to, indexed by the folder, its UIDVALIDITY and the
+            email's UID, so emails can be parsed again without fetching them.
+            It is flushed after each scrape. Defaults to None, which doesn't
+            keep the source.
+
+    """
+
+    fetch_chunk_size = 100
+    standby_noop_interval = 60
+    claim_timeout = 600
+    claim_batch_size = 100
+
+    def __init__(self, email, app_password, folder, attachment_dir):
+        """Initialize an EmailListener instance.
+
+        Args:
+            email (str): The email to listen to.
+            app_password (str): The password for the email.
+            folder (str): The email folder to listen in.
+            attachment_dir (str): The file path to folder to save scraped
+                emails and attachments to.
+
+        Returns:
+            None
+
+        """
+
+        self.email = email
+        self.app_password = app_password
+        self.folder = folder
+        self.attachment_dir = attachment_dir
+        self.server = None
+        self.host = 'imap.gmail.com'
+        self.port = None
+        self.use_ssl = True
+        self.ssl_context = None
+        self.standby = None
+        self.compress = True
+        self.transfer_stats = TransferStats()
+        self.__standby_lock = threading.Lock()
+        self.__standby_thread = None
+        self.__standby_noop = 0
+        self.__last_status = {}
+        self.journal = None
+        self.__unacknowledged = {}
+        self.stats = None
+        self.metrics = None
+        self.latency = None
+        self.raw_archive = None
+        self.raw_store = None
+        self.__arrivals = {}
+
+
+    def login(self, host='imap.gmail.com', port=None, use_ssl=True,
+            ssl_context=None, compress=True):
+        """Logs in the EmailListener to the IMAP server.
+
+        Args:
+            host (str): The IMAP host to log into. Default host is Gmail.
+            port (int): The port number to connect through. Defaults to None,
+                which uses 993 for TLS connections and 143 otherwise.
+            use_ssl (bool): Whether to connect over TLS. Set to False for a
+                plaintext connection, such as to a local test server. Defaults
+                to True.
+            ssl_context (ssl.SSLContext): The SSL context for TLS connections.
+                Defaults to None, which uses a default context that verifies
+                certificates.
+            compress (bool): Whether to negotiate COMPRESS=DEFLATE (RFC 4978)
+                when the server advertises it. Defaults to True.
+
+        Returns:
+            None
+
+        """
+
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.ssl_context = SessionCachingContext(ssl_context) if use_ssl else None
+        self.compress = compress
+        self.server = self.__connect()
+
+
+    def reconnect(self, retries=5):
+        """Replaces a broken connection to the IMAP server with a new one.
+
+        The first attempt is made straight away, resuming the cached TLS
+        session, and each attempt after that backs off exponentially.
+
+        Args:
+            retries (int): The number of attempts to make before giving up.
+                Defaults to 5.
+
+        Returns:
+            None
+
+        """
+
+        # Drop the old connection without waiting on the server
+        if self.server is not None:
+            try:
+                self.server.shutdown()
+            except Exception:
+                pass
+            self.server = None
+
+        for attempt in range(retries):
+            time.sleep(calc_backoff(attempt))
+            try:
+                self.server = self.__connect()
+                if self.metrics is not None:
+                    self.metrics.reconnects_total.inc()
+                return
+            except (OSError, IMAPClient.AbortError):
+                if attempt == retries - 1:
+                    raise
+
+
+    def __connect(self):
+        """Helper function, opens an authenticated connection to the IMAP server.
+
+        Args:
+            None
+
+        Returns:
+            An IMAPClient logged in with the current folder selected.
+
+        """
+
+        server = IMAPClient(self.host, port=self.port, ssl=self.use_ssl,
+                ssl_context=self.ssl_context)
+        # IMAPClient writes some commands in pieces, which Nagle's algorithm
+        # would hold back waiting on the server's delayed ACK
+        server_socket(server).setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        server.login(self.email, self.app_password)
+        if self.ssl_context is not None:
+            if self.metrics is not None:
+                self.metrics.tls_connections_total.inc()
+                if getattr(server_socket(server), "session_reused", False):
+                    self.metrics.tls_resumed_total.inc()
+            self.ssl_context.save_session(server_socket(server))
+        if self.compress:
+            enable_compression(server, self.transfer_stats)
+        server.select_folder(self.folder, readonly=False)
+        return server
+
+
+    def logout(self):
+        """Logs out the EmailListener from the IMAP server.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.server.logout()
+        self.server = None
+        # Wait for any spare connection being built, then log it out too
+        if self.__standby_thread is not None:
+            self.__standby_thread.join()
+            self.__standby_thread = None
+        with self.__standby_lock:
+            standby, self.standby = self.standby, None
+        if standby is not None:
+            try:
+                standby.logout()
+            except (OSError, IMAPClient.Error):
+                pass
+
+
+    def scrape(self, move=None, unread=False, delete=False, claim=False):
+        """Scrape unread emails from the current folder.
+
+        Args:
+            move (str): The folder to move the emails to. If None, the emails
+                are not moved. Defaults to None.
+            unread (bool): Whether the emails should be marked as unread.
+                Defaults to False.
+            delete (bool): Whether the emails should be deleted. Defaults to
+                False.
+            claim (bool): Whether to only scrape emails this listener claims,
+                so several listeners can share the folder. Unclaimed emails,
+                and ones whose claim is stale, are claimed in a random batch of
+                at most claim_batch_size, and the claim is removed along with
+                the other options. Needs the CONDSTORE capability, and can't be
+                used with unread unless the emails are moved or deleted, as
+                they would be claimed again. Defaults to False.
+
+        Returns:
+            A list of the file paths to each scraped email. Each email's
+            INTERNALDATE, the time the server received it, is included as
+            "Internal_Date".
+
+        """
+
+        # Ensure server is connected
+        if type(self.server) is not IMAPClient:
+            raise ValueError("server attribute must be type IMAPClient")
+        self.__check_claim(move, unread, delete, claim)
+
+        # Time the scrape as a cycle, if requested
+        stats = self.stats
+        raw_archive = self.raw_archive
+        raw_store = self.raw_store
+        if (stats is None and self.metrics is None and raw_archive is None
+                and raw_store is None):
+            return self.__scrape(move, unread, delete, claim)
+        if stats is not None:
+            stats.begin("scrape", self.folder)
+        start = time.perf_counter()
+        try:
+            return self.__scrape(move, unread, delete, claim)
+        finally:
+            if raw_archive is not None:
+                # Complete the scrape's batch of the archive
+                raw_archive.flush()
+            if raw_store is not None:
+                raw_store.flush()
+            if stats is not None:
+                stats.end()
+            if self.metrics is not None:
+                self.metrics.scrapes_total.inc()
+                self.metrics.scrape_seconds.observe(time.perf_counter() - start)
+
+
+    def __scrape(self, move, unread, delete, claim):
+        """Helper function, scrapes unread emails from the current folder.
+
+        Args:
+            move (str): The folder to move the emails to, or None.
+            unread (bool): Whether the emails should be marked as unread.
+            delete (bool): Whether the emails should be deleted.
+            claim (bool): Whether to only scrape emails this listener claims.
+
+        Returns:
+            A dictionary of the scraped emails, in the same format as scrape().
+
+        """
+
+        # Scrape through the journal, if there is one
+        if self.journal is not None:
+            return self.__scrape_journaled(move, unread, delete, claim)
+
+        stats = self.stats
+        # List containing the file paths of each file created for an email message
+        msg_dict = {}
+
+        # Search for unseen messages, and claim them if required
+        if stats is not None:
+            start = time.perf_counter()
+        messages = self.server.search("UNSEEN")
+        if stats is not None:
+            stats.add("search", time.perf_counter() - start, emails=len(messages))
+        release = []
+        if claim:
+            messages, release = self.__claim(messages)
+        uidvalidity = self.__raw_store_uidvalidity()
+        # Fetch the unseen messages in pipelined chunks. Claimed emails are
+        # left unseen until their options are executed, so if this listener
+        # stops first, their claims go stale and another listener takes them.
+        if claim:
+            data, body = 'BODY.PEEK[]', b'BODY[]'
+        else:
+            data, body = 'RFC822', b'RFC822'
+        detected = time.time()
+        start = time.perf_counter()
+        pipeline = IMAPPipeline(self.server)
+        for i in range(0, len(messages), self.fetch_chunk_size):
+            pipeline.fetch(messages[i:i + self.fetch_chunk_size],
+                    [data, 'INTERNALDATE'])
+        results = pipeline.execute()
+        self.__record_fetch(time.perf_counter() - start, results, body)
+        arrivals = self.__new_arrivals()
+        uids = []
+        # For each unseen message
+        for fetched in results:
+            for uid, message_data in fetched.items():
+                # Parse the message
+                key, val_dict = self.__parse_message(uid, message_data,
+                        body, arrivals, uidvalidity)
+                msg_dict[key] = val_dict
+                uids.append(uid)
+        self.__record_arrivals(self.folder, arrivals, detected)
+
+        # If required, move the emails, mark them as unread, or delete them
+        self.__execute_options(uids, move, unread, delete, release=release,
+                mark_seen=claim)
+
+        # Return the dictionary of messages and their contents
+        return msg_dict
+
+
+    def __claim(self, messages):
+        """Helper function, claims a batch of emails for this listener.
+
+        Every listener picks its batch at random from the unclaimed emails, so
+        listeners sharing a folder rarely race for the same ones. The claim
+        keyword is added with one conditional STORE, which only succeeds for
+        the emails no other listener has changed since their flags were read.
+
+        Args:
+            messages (list): The UIDs of the emails to claim from.
+
+        Returns:
+            A tuple of the sorted UIDs claimed, and the claim keywords to remove
+            from them once they are done with.
+
+        """
+
+        if not messages:
+            return [], []
+        if not self.server.has_capability('CONDSTORE'):
+            raise ValueError("claiming emails needs the CONDSTORE capability")
+        if self.stats is None:
+            return self.__claim_batch(messages)
+        start = time.perf_counter()
+        claimed, release = self.__claim_batch(messages)
+        self.stats.add("claim", time.perf_counter() - start, emails=len(claimed))
+        return claimed, release
+
+
+    def __claim_batch(self, messages):
+        """Helper function, reads the flags of emails and claims a batch of them.
+
+        Args:
+            messages (list): The UIDs of the emails to claim from.
+
+        Returns:
+            A tuple of the sorted UIDs claimed, and the claim keywords to remove
+            from them once they are done with.
+
+        """
+
+        # Read the flags and mod-sequence of each email
+        now = time.time()
+        fetched = self.server.fetch(messages, ['FLAGS', 'MODSEQ'])
+        if not fetched:
+            return [], []
+        modseq = max(data[b'MODSEQ'][0] for data in fetched.values())
+
+        # Find the emails without a claim, or with only stale claims
+        candidates = []
+        stale = set()
+        for uid, data in fetched.items():
+            claims = {flag: claim_time(flag) for flag in data[b'FLAGS']
+                    if claim_time(flag) is not None}
+            if not claims or now - max(claims.values()) >= self.claim_timeout:
+                candidates.append(uid)
+                stale.update(claims)
+        random.shuffle(candidates)
+        batch = sorted(candidates[:self.claim_batch_size])
+        if not batch:
+            return [], []
+
+        # Claim the batch, unless another listener changed the emails first
+        keyword = claim_keyword(now)
+        pipeline = IMAPPipeline(self.server)
+        pipeline.add_flags(batch, [keyword], unchanged_since=modseq)
+        typ, text = pipeline.execute()[0]
+        if typ != 'OK':
+            return [], []
+        modified = parse_modified(text)
+        claimed = [uid for uid in batch if uid not in modified]
+        return claimed, sorted(stale, key=str) + [keyword]
+
+
+    def __claim_keywords(self, messages):
+        """Helper function, finds the claim keywords set on emails.
+
+        Args:
+            messages (list): The UIDs of the emails.
+
+        Returns:
+            A sorted list of the claim keywords set on any of the emails.
+
+        """
+
+        if not messages:
+            return []
+        keywords = set()
+        for data in self.server.fetch(messages, ['FLAGS']).values():
+            keywords.update(flag for flag in data[b'FLAGS']
+                    if claim_time(flag) is not None)
+        return sorted(keywords, key=str)
+
+
+    def __check_claim(self, move, unread, delete, claim):
+        """Helper function, checks that claiming can be used with the other options.
+
+        Args:
+            move (str): The folder to move the emails to, or None.
+            unread (bool): Whether the emails should be marked as unread.
+            delete (bool): Whether the emails should be deleted.
+            claim (bool): Whether to only scrape emails this listener claims.
+
+        Returns:
+            None
+
+        """
+
+        # Emails left unseen in the folder, without a claim, would be claimed
+        # and processed again by the next scrape
+        if claim and unread and move is None and not delete:
+            raise ValueError("claim can't be used with unread unless emails are "
+                    "moved or deleted")
+
+
+    def __scrape_journaled(self, move, unread, delete, claim):
+        """Helper function, scrapes the current folder through the journal.
+
+        Emails processed before a crash, but not acknowledged, have their
+        options executed first. Emails fetched but never processed are fetched
+        again, along with any unseen emails past the highest journaled UID, so
+        the rest of the folder isn't searched again. Emails are fetched with
+        BODY.PEEK[] so they stay unseen until acknowledged. When claiming, every
+        unseen email is searched, since emails claimed by other listeners can
+        become claimable again.
+
+        Args:
+            move (str): The folder to move the emails to, or None.
+            unread (bool): Whether the emails should be marked as unread.
+            delete (bool): Whether the emails should be deleted.
+            claim (bool): Whether to only scrape emails this listener claims.
+
+        Returns:
+            A dictionary of the scraped emails, in the same format as scrape().
+
+        """
+
+        stats = self.stats
+        folder = self.folder
+        uidvalidity = self.server.folder_status(folder,
+                ['UIDVALIDITY'])[b'UIDVALIDITY']
+
+        # Finish acknowledging emails processed before a crash, releasing any
+        # claims on them
+        processed = self.journal.uids(folder, uidvalidity, PROCESSED)
+        release = self.__claim_keywords(processed) if claim else []
+        self.__execute_options(processed, move, unread, delete, release=release,
+                mark_seen=True)
+        self.journal.record(folder, uidvalidity, processed, ACKNOWLEDGED)
+
+        # Search past the highest journaled UID, and add the emails still
+        # waiting to be processed
+        last = self.journal.last_uid(folder, uidvalidity)
+        if stats is not None:
+            start = time.perf_counter()
+        if last is None or claim:
+            messages = self.server.search("UNSEEN")
+        else:
+            messages = [uid for uid in self.server.search(
+                    ["UNSEEN", "UID", "{}:*".format(last + 1)]) if uid > last]
+        if stats is not None:
+            stats.add("search", time.perf_counter() - start, emails=len(messages))
+        messages = sorted(set(messages).union(
+                self.journal.uids(folder, uidvalidity, FETCHED)))
+        release = []
+        if claim:
+            messages, release = self.__claim(messages)
+
+        # Fetch the messages in pipelined chunks, without setting \Seen
+        detected = time.time()
+        start = time.perf_counter()
+        pipeline = IMAPPipeline(self.server)
+        for i in range(0, len(messages), self.fetch_chunk_size):
+            pipeline.fetch(messages[i:i + self.fetch_chunk_size],
+                    ['BODY.PEEK[]', 'INTERNALDATE'])
+        fetched = {}
+        for result in pipeline.execute():
+            fetched.update(result)
+        self.__record_fetch(time.perf_counter() - start, [fetched], b'BODY[]')
+        uids = sorted(fetched)
+        self.journal.record(folder, uidvalidity, uids, FETCHED)
+        # Emails which have disappeared since they were journaled are done with
+        self.journal.record(folder, uidvalidity,
+                [uid for uid in messages if uid not in fetched], ACKNOWLEDGED)
+
+        msg_dict = {}
+        arrivals = self.__new_arrivals()
+        for uid in uids:
+            key, val_dict = self.__parse_message(uid, fetched[uid], b'BODY[]',
+                    arrivals, uidvalidity)
+            msg_dict[key] = val_dict
+        self.__record_arrivals(folder, arrivals, detected)
+
+        # Hold the options until the emails are acknowledged
+        self.__unacknowledged[folder] = (uidvalidity, uids,
+                (move, unread, delete, release))
+        return msg_dict
+
+
+    def acknowledge(self, folder=None):
+        """Acknowledge processed emails, executing their deferred options.
+
+        The emails returned by the last journaled scrape() of the folder are
+        recorded as processed, then marked as seen (unless the unread option
+        was given), moved or deleted as scrape() was asked to, and finally
+        recorded as acknowledged. Does nothing without a journal.
+
+        Args:
+            folder (str): The folder to acknowledge the emails of. Defaults to
+                None, which acknowledges every folder scraped.
+
+        Returns:
+            None
+
+        """
+
+        if self.journal is None:
+            return
+        folders = list(self.__unacknowledged) if folder is None else [folder]
+        for folder in folders:
+            if folder not in self.__unacknowledged:
+                continue
+            uidvalidity, uids, options = self.__unacknowledged.pop(folder)
+            self.journal.record(folder, uidvalidity, uids, PROCESSED)
+            if not uids:
+                continue
+            # Select the folder the emails are in, if needed
+            if folder != self.folder:
+                self.server.select_folder(folder, readonly=False)
+            try:
+                self.__execute_options(uids, *options, mark_seen=True)
+            finally:
+                if folder != self.folder:
+                    self.server.select_folder(self.folder, readonly=False)
+            self.journal.record(folder, uidvalidity, uids, ACKNOWLEDGED)
+
+
+    def drain_backlog(self, connections=4, chunk_size=500, move=None,
+            unread=False, delete=False, process_func=None):
+        """Scrape a large backlog of unread emails over several connections.
+
+        The unseen UIDs are split into chunks, which are fetched concurrently
+        over extra connections to the IMAP server. As each chunk arrives, it is
+        parsed and handed to the process function, and only then are its
+        options executed, over the main connection. Only the fetching is done
+        in other threads, so the stats, metrics, latency tracker and raw
+        source stores are only updated from the calling thread. Emails are fetched
+        without being marked as seen, so a crash part way through the drain
+        leaves every email not yet processed unseen for the next scrape. The
+        extra connections are logged out once the backlog is drained. Any
+        emails still unseen afterwards, such as ones that arrived during the
+        drain, are picked up by a normal scrape.
+
+        Args:
+            connections (int): The number of extra connections to open. Keep
+                this under the provider's connection limit. Defaults to 4.
+            chunk_size (int): The number of emails fetched per chunk. Backlogs
+                no larger than this are scraped over the main connection only.
+                Defaults to 500.
+            move (str): The folder to move the emails to. If None, the emails
+                are not moved. Defaults to None.
+            unread (bool): Whether the emails should be marked as unread.
+                Defaults to False.
+            delete (bool): Whether the emails should be deleted. Defaults to
+                False.
+            process_func (function): A function called with each chunk's
+                dictionary of emails, in the same format as scrape(), as soon
+                as the chunk is parsed. Defaults to None, which collects every
+                chunk's emails to return instead.
+
+        Returns:
+            The number of emails processed if there is a process function, or
+            else a dictionary of the scraped emails, in the same format as
+            scrape().
+
+        """
+
+        # Ensure server is connected
+        if type(self.server) is not IMAPClient:
+            raise ValueError("server attribute must be type IMAPClient")
+        if connections < 1:
+            raise ValueError("connections must be at least 1")
+
+        msg_dict = {}
+        count = 0
+        options = (move, unread, delete)
+        seen_uids = set()
+        # Only needed for big backlogs, so not imported with the module
+        from concurrent.futures import ThreadPoolExecutor
+        import queue
+
+        # Create the move folder up front, so the options don't race to do it
+        if move is not None and not self.server.folder_exists(move):
+            self.server.create_folder(move)
+        uidvalidity = self.__raw_store_uidvalidity()
+
+        while True:
+            # Search for unseen messages, ignoring any already drained but
+            # left unseen by the unread option
+            messages = [uid for uid in self.server.search("UNSEEN")
+                    if uid not in seen_uids]
+            if len(messages) <= chunk_size:
+                break
+
+            # Split the UIDs into chunks
+            messages.sort()
+            chunks = [messages[i:i + chunk_size]
+                    for i in range(0, len(messages), chunk_size)]
+            seen_uids.update(messages)
+
+            # Fetch and parse the chunks concurrently, one connection each. The
+            # queue only holds a chunk per worker, so fetching can't get far
+            # ahead of processing.
+            workers = min(connections, len(chunks))
+            results = queue.Queue(maxsize=workers)
+            stop = threading.Event()
+            servers = [self.__connect() for _ in range(workers)]
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for i in range(workers):
+                        executor.submit(self.__drain_chunks, servers[i],
+                                chunks[i::workers], results, stop)
+                    running = workers
+                    error = None
+                    while running:
+                        result = results.get()
+                        if result is None:
+                            running -= 1
+                        elif isinstance(result, BaseException):
+                            error = error or result
+                            stop.set()
+                        elif error is None:
+                            chunk, fetched = result
+                            try:
+                                count += self.__finish_chunk(chunk,
+                                        self.__parse_chunk(*fetched, uidvalidity),
+                                        options, process_func, msg_dict)
+                            except BaseException as finish_error:
+                                # Let the workers stop before raising
+                                error = finish_error
+                                stop.set()
+                    if error is not None:
+                        raise error
+            finally:
+                for server in servers:
+                    server.logout()
+
+        # Scrape whatever is left over the main connection
+        if messages:
+            count += self.__finish_chunk(messages, self.__parse_chunk(
+                    *self.__fetch_chunk(self.server, messages), uidvalidity),
+                    options, process_func, msg_dict)
+        if self.raw_store is not None:
+            self.raw_store.flush()
+        return msg_dict if process_func is None else count
+
+
+    def __drain_chunks(self, server, chunks, results, stop):
+        """Helper function, fetches chunks of emails on a connection.
+
+        Each fetched chunk is put on the results queue as a tuple of its UIDs
+        and what __fetch_chunk() returned for it, followed by None once the
+        chunks are done. An error is put on the queue in place of a chunk.
+
+        Args:
+            server (IMAPClient): The connection to fetch the emails over.
+            chunks (list): A list of lists of UIDs to fetch.
+            results (queue.Queue): The queue to put the fetched chunks on.
+            stop (threading.Event): Set to stop before the next chunk.
+
+        Returns:
+            None
+
+        """
+
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                results.put((chunk, self.__fetch_chunk(server, chunk)))
+        except BaseException as error:
+            results.put(error)
+        finally:
+            results.put(None)
+
+
+    def __finish_chunk(self, chunk, msgs, options, process_func, msg_dict):
+        """Helper function, processes a drained chunk, then executes its options.
+
+        Args:
+            chunk (list): The UIDs of the chunk.
+            msgs (dict): The chunk's scraped emails.
+            options (tuple): The (move, unread, delete) options to execute.
+            process_func (function): The process function, or None to add the
+                emails to msg_dict instead.
+            msg_dict (dict): The emails collected when there is no process
+                function.
+
+        Returns:
+            The number of emails in the chunk.
+
+        """
+
+        if process_func is None:
+            msg_dict.update(msgs)
+        elif msgs:
+            self.__call_process_func(msgs, process_func)
+        move, unread, delete = options
+        self.__execute_options(chunk, move, unread, delete, mark_seen=True)
+        return len(msgs)
+
+
+    def __fetch_chunk(self, server, chunk):
+        """Helper function, fetches a chunk of emails, leaving them unseen.
+
+        Nothing is recorded, so this can be run in any thread.
+
+        Args:
+            server (IMAPClient): The connection to fetch the emails over.
+            chunk (list): The UIDs to fetch.
+
+        Returns:
+            A tuple of the fetched data of each email, keyed by UID, when the
+            emails were detected, in seconds since epoch, and the seconds the
+            fetch took.
+
+        """
+
+        detected = time.time()
+        start = time.perf_counter()
+        fetched = server.fetch(chunk, ['BODY.PEEK[]', 'INTERNALDATE'])
+        return fetched, detected, time.perf_counter() - start
+
+
+    def __parse_chunk(self, fetched, detected, seconds, uidvalidity):
+        """Helper function, records and parses a fetched chunk of emails.
+
+        Args:
+            fetched (dict): The fetched data of each email, keyed by UID.
+            detected (float): When the emails were detected, in seconds since
+                epoch.
+            seconds (float): The seconds the fetch took.
+            uidvalidity (int): The UIDVALIDITY of the folder, if the raw store
+                needs it, or None.
+
+        Returns:
+            A dictionary of the scraped emails, in the same format as scrape().
+
+        """
+
+        msg_dict = {}
+        self.__record_fetch(seconds, [fetched], b'BODY[]')
+        arrivals = self.__new_arrivals()
+        for uid, message_data in fetched.items():
+            key, val_dict = self.__parse_message(uid, message_data,
+                    b'BODY[]', arrivals, uidvalidity)
+            msg_dict[key] = val_dict
+        self.__record_arrivals(self.folder, arrivals, detected, merge=True)
+        return msg_dict
+
+
+    def replay(self, source, process_func=write_txt_file, workers=1,
+            batch_size=100):
+        """Run emails from an mbox file, Maildir directory or .eml files through processing.
+
+        The emails are parsed exactly as scrape() parses them, and the process
+        function is called with each batch, so archives can be backfilled, or
+        parsing measured, without an IMAP server. No login is needed. Each
+        email's position in the source, starting at 1, is used as its UID.
+
+        Args:
+            source (str): An mbox file, a Maildir directory, a directory of
+                .eml files, or a single .eml file.
+            process_func (function): A function called to further process the
+                emails of each batch. Defaults to the example function
+                write_txt_file in the email_processing module.
+            workers (int): The number of processes to parse in. Defaults to 1,
+                which parses in this process.
+            batch_size (int): The number of emails passed to each call of the
+                process function. Defaults to 100.
+
+        Returns:
+            The number of emails replayed.
+
+        """
+
+        # Imported here, since replaying doesn't need the mailbox module
+        # otherwise
+        from .replay import replay_batches
+
+        count = 0
+        for msg_dict in replay_batches(source, self.attachment_dir,
+                workers=workers, batch_size=batch_size):
+            process_func(self, msg_dict)
+            count += len(msg_dict)
+        return count
+
+
+    def profile(self, cycles, output_dir):
+        """Profile the next cycles with cProfile and tracemalloc.
+
+        Each scrape(), or IDLE wake up with the scrape and process function
+        call it leads to, is a cycle. The profile of each cycle is written to
+        output_dir, in files named after the folder and cycle number. See the
+        profiling module. Timing stats are kept from now on if they weren't
+        already.
+
+        Args:
+            cycles (int): The number of cycles to profile.
+            output_dir (str): The folder to write the stats files to.
+
+        Returns:
+            The CycleProfiler, whose dumps attribute lists the files written.
+
+        """
+
+        from .instrumentation import PipelineStats
+        from .profiling import CycleProfiler
+
+        if self.stats is None:
+            self.stats = PipelineStats()
+        profiler = self.stats.profiler
+        if profiler is None or profiler.output_dir != output_dir:
+            profiler = self.stats.profiler = CycleProfiler(output_dir)
+        profiler.arm(cycles)
+        return profiler
+
+
+    def profile_on_signal(self, signum, cycles, output_dir):
+        """Profile the next cycles whenever the process receives a signal.
+
+        Must be called from the main thread. See profile().
+
+        Args:
+            signum (int): The signal to profile on, such as signal.SIGUSR2.
+            cycles (int): The number of cycles to profile after each signal.
+            output_dir (str): The folder to write the stats files to.
+
+        Returns:
+            The CycleProfiler.
+
+        """
+
+        import signal
+
+        profiler = self.profile(0, output_dir)
+        signal.signal(signum, lambda signum, frame: profiler.arm(cycles))
+        return profiler
+
+
+    def __record_fetch(self, seconds, results, body):
+        """Helper function, adds a FETCH to the stats and metrics, if kept.
+
+        Args:
+            seconds (float): The seconds the fetch took.
+            results (list): The dictionaries of fetched emails, keyed by UID.
+            body (bytes): The key of each email's source in its fetched data.
+
+        Returns:
+            None
+
+        """
+
+        if self.stats is None and self.metrics is None:
+            return
+        count = sum(len(fetched) for fetched in results)
+        nbytes = sum(len(data[body]) for fetched in results
+                for data in fetched.values())
+        if self.stats is not None:
+            self.stats.add("fetch", seconds, nbytes, count)
+        if self.metrics is not None:
+            self.metrics.emails_total.inc(count)
+            self.metrics.fetched_bytes_total.inc(nbytes)
+
+
+    def __parse_message(self, uid, data, body, arrivals=None, uidvalidity=None):
+        """Helper function for parsing a fetched email message.
+
+        The email's INTERNALDATE is added to its value dictionary as
+        "Internal_Date", an ISO 8601 string with the UTC offset.
+
+        Args:
+            uid (int): The UID of the email message.
+            data (dict): The fetched data of the email message.
+            body (bytes): The key of the email's RFC822 source in data.
+            arrivals (dict): A dictionary to add the email's delivery time to,
+                in seconds since epoch, keyed by the email's dict key. Defaults
+                to None.
+            uidvalidity (int): The UIDVALIDITY of the folder, which is needed
+                to add the email to the raw store. Defaults to None.
+
+        Returns:
+            A tuple of the dict key for the email and its value dictionary.
+
+        """
+
+        key, val_dict = parse_message(uid, data[body], self.attachment_dir,
+                self.stats)
+        internal_date = data.get(b'INTERNALDATE')
+        if internal_date is not None:
+            # IMAPClient gives the time as a naive local time
+            internal_date = internal_date.astimezone()
+            val_dict["Internal_Date"] = internal_date.isoformat()
+            if arrivals is not None:
+                arrivals[key] = internal_date.timestamp()
+        if self.raw_archive is not None:
+            self.raw_archive.write_raw(key, data[body], folder=self.folder,
+                    uid=uid, internal_date=val_dict.get("Internal_Date"))
+        if self.raw_store is not None:
+            self.raw_store.write(self.folder, uidvalidity, uid,
+                    data[body])
+        return key, val_dict
+
+
+    def __raw_store_uidvalidity(self):
+        """Helper function, gets the folder's UIDVALIDITY if the raw store needs it.
+
+        Args:
+            None
+
+        Returns:
+            The UIDVALIDITY, or None if there is no raw store.
+
+        """
+
+        if self.raw_store is None:
+            return None
+        return self.server.folder_status(self.folder,
+                ['UIDVALIDITY'])[b'UIDVALIDITY']
+
+
+    def __new_arrivals(self):
+        """Helper function, starts collecting the delivery times of a scrape.
+
+        Args:
+            None
+
+        Returns:
+            An empty dictionary if delivery times are needed for the metrics
+            or latency tracker, or None otherwise.
+
+        """
+
+        if self.metrics is None and self.latency is None:
+            return None
+        return {}
+
+
+    def __record_arrivals(self, folder, arrivals, detected, merge=False):
+        """Helper function, records when a scrape's emails were delivered and detected.
+
+        The delivery to detection latency is recorded straight away, and the
+        times are kept until the emails are processed.
+
+        Args:
+            folder (str): The folder the emails were scraped from.
+            arrivals (dict): The delivery time of each email, keyed by its dict
+                key, or None if delivery times aren't needed.
+            detected (float): When the emails were detected, in seconds since
+                epoch.
+            merge (bool): Whether to add to the times kept for the folder,
+                rather than replacing them. Defaults to False.
+
+        Returns:
+            None
+
+        """
+
+        if arrivals is None:
+            return
+        if self.latency is not None:
+            for delivered in arrivals.values():
+                self.latency.delivery_to_detect.add(max(0, detected - delivered),
+                        detected)
+        times = {key: (delivered, detected) for key, delivered in arrivals.items()}
+        if merge:
+            self.__arrivals.setdefault(folder, {}).update(times)
+        else:
+            self.__arrivals[folder] = times
+
+
+    def __execute_options(self, uid, move, unread, delete, release=None,
+            server=None, mark_seen=False):
+        """Loop through optional arguments and execute any required processing.
+
+        Args:
+            uid (int or list): The email ID, or list of IDs, to process.
+            move (str): The folder to move the emails to. If None, the emails
+                are not moved. Defaults to None.
+            unread (bool): Whether the emails should be marked as unread.
+                Defaults to False.
+            delete (bool): Whether the emails should be deleted. Defaults to
+                False.
+            release (list): The claim keywords to remove from the emails.
+                Defaults to None, which removes none.
+            server (IMAPClient): The connection to use. Defaults to None, which
+                uses the server attribute.
+            mark_seen (bool): Whether the emails need marking as seen, because
+                they were fetched without setting the flag. Defaults to False.
+
+        Returns:
+            None
+
+        """
+
+        server = server or self.server
+        if not uid:
+            return
+        if self.stats is not None:
+            start = time.perf_counter()
+
+        # Pipeline the commands, which the server runs in the order given
+        pipeline = IMAPPipeline(server)
+        # If the message should be marked as unread
+        if bool(unread):
+            pipeline.remove_flags(uid, [SEEN])
+        # If the message was fetched without marking it as read
+        elif bool(mark_seen):
+            pipeline.add_flags(uid, [SEEN])
+        # If the message was claimed
+        if release:
+            pipeline.remove_flags(uid, release)
+
+        # If a move folder is specified
+        if move is not None:
+            # Move the message to another folder
+            move_index = pipeline.move(uid, move)
+        # If the message should be deleted
+        elif bool(delete):
+            # Move the email to the trash
+            pipeline.set_gmail_labels(uid, "\\Trash")
+
+        results = pipeline.execute()
+        if move is not None and results[move_index][0] != 'OK':
+            # Create the folder and move the message to the folder. Another
+            # listener sharing the folder may have just created it.
+            try:
+                server.create_folder(move)
+            except IMAPClient.Error:
+                if not server.folder_exists(move):
+                    raise
+            server.move(uid, move)
+        if self.stats is not None:
+            self.stats.add("execute_options", time.perf_counter() - start,
+                    emails=len(uid) if isinstance(uid, (list, tuple)) else 1)
+        return
+
+
+    def listen(self, timeout, process_func=write_txt_file, **kwargs):
+        """Listen in an email folder for incoming emails, and process them.
+
+        Args:
+            timeout (int or list): Either an integer representing the number
+                of minutes to timeout in, or a list, formatted as [hour, minute]
+                of the local time to timeout at.
+            process_func (function): A function called to further process the
+                emails. The function must take only the list of file paths
+                returned by the scrape function as an argument. Defaults to the
+                example function write_txt_file in the email_processing module.
+            **kwargs (dict): Additional arguments for processing the email.
+                Optional arguments include:
+                    move (str): The folder to move emails to. If not set, the
+                        emails will not be moved.
+                    unread (bool): Whether the emails should be marked as unread.
+                        If not set, emails are kept as read.
+                    delete (bool): Whether the emails should be deleted. If not
+                        set, emails are not deleted.
+                    claim (bool): Whether to only process emails this listener
+                        claims, so several listeners can share the folder. See
+                        scrape(). If not set, every unseen email is processed.
+                    backlog_connections (int): The number of extra connections
+                        used to drain a backlog of unread emails before idling.
+                        If not set, the backlog is left for the first IDLE
+                        response to pick up.
+                    backlog_chunk_size (int): The number of emails fetched per
+                        chunk while draining the backlog. Defaults to 500.
+                    reconnect (bool): Whether to reconnect, and resume idling,
+                        when the connection fails. If not set, the error is
+                        raised.
+                    standby (bool): Whether to keep a spare logged in
+                        connection, refreshed with NOOPs, which is switched to
+                        straight away when the connection fails. A new spare is
+                        then built in the background. If no spare is ready, the
+                        reconnect option applies.
+                    poll (bool): Whether to poll the folder with STATUS instead
+                        of idling. Servers without the IDLE capability are
+                        always polled. See poll() for the polling options.
+
+        Returns:
+            None
+
+        """
+
+        # Ensure server is connected
+        if type(self.server) is not IMAPClient:
+            raise ValueError("server attribute must be type IMAPClient")
+        self.__check_claim(kwargs.get('move'), bool(kwargs.get('unread')),
+                bool(kwargs.get('delete')), bool(kwargs.get('claim')))
+
+        # Fall back to polling if IDLE can't be used
+        if kwargs.get('poll') or not self.server.has_capability('IDLE'):
+            return self.poll(timeout, process_func=process_func, **kwargs)
+
+        # Get the timeout value
+        outer_timeout = calc_timeout(timeout)
+
+        # If requested, drain the backlog over several connections first. The
+        # backlog isn't drained past the journal or claims, which scrape it
+        # instead.
+        backlog_connections = kwargs.get('backlog_connections')
+        if (backlog_connections and self.journal is None
+                and not kwargs.get('claim')):
+            self.drain_backlog(connections=backlog_connections,
+                    chunk_size=kwargs.get('backlog_chunk_size') or 500,
+                    move=kwargs.get('move'), unread=bool(kwargs.get('unread')),
+                    delete=bool(kwargs.get('delete')), process_func=process_func)
+
+        # If requested, keep a spare connection ready to switch to
+        if kwargs.get('standby'):
+            self.__build_standby()
+
+        # Run until the timeout is reached, first resuming from any journal
+        catch_up = self.journal is not None
+        while (get_time() < outer_timeout):
+            try:
+                # Process any emails that arrived while disconnected
+                if catch_up:
+                    catch_up = False
+                    msgs = self.scrape(move=kwargs.get('move'),
+                            unread=bool(kwargs.get('unread')),
+                            delete=bool(kwargs.get('delete')),
+                            claim=bool(kwargs.get('claim')))
+                    if msgs:
+                        self.__process(msgs, process_func)
+                    # Keep claiming batches until there are none left
+                    while kwargs.get('claim') and msgs:
+                        msgs = self.scrape(move=kwargs.get('move'),
+                                unread=bool(kwargs.get('unread')),
+                                delete=bool(kwargs.get('delete')), claim=True)
+                        if msgs:
+                            self.__process(msgs, process_func)
+                self.__idle(process_func=process_func, **kwargs)
+            except (OSError, IMAPClient.AbortError):
+                if kwargs.get('standby') and self.__failover():
+                    logger.warning("Connection lost, switched to the standby connection.")
+                elif kwargs.get('reconnect'):
+                    logger.warning("Connection lost, reconnecting.")
+                    self.reconnect()
+                else:
+                    raise
+                catch_up = True
+        return
+
+
+    def poll(self, timeout, process_func=write_txt_file, **kwargs):
+        """Poll an email folder for incoming emails with STATUS, and process them.
+
+        Each poll issues a cheap STATUS command for the folder's UIDNEXT and
+        UNSEEN counts (plus HIGHESTMODSEQ if the server supports CONDSTORE),
+        and only scrapes when they change. The time between polls halves while
+        emails are arriving and grows while the folder is quiet.
+
+        Args:
+            timeout (int or list): Either an integer representing the number
+                of minutes to timeout in, or a list, formatted as [hour, minute]
+                of the local time to timeout at.
+            process_func (function): A function called to further process the
+                emails. The function must take only the list of file paths
+                returned by the scrape function as an argument. Defaults to the
+                example function write_txt_file in the email_processing module.
+            **kwargs (dict): Additional arguments for processing the email.
+                Optional arguments include:
+                    move (str): The folder to move emails to. If not set, the
+                        emails will not be moved.
+                    unread (bool): Whether the emails should be marked as unread.
+                        If not set, emails are kept as read.
+                    delete (bool): Whether the emails should be deleted. If not
+                        set, emails are not deleted.
+                    claim (bool): Whether to only process emails this listener
+                        claims, so several listeners can share the folder. See
+                        scrape(). If not set, every unseen email is processed.
+                    min_interval (float): The shortest time between polls, in
+                        seconds. Defaults to 5.
+                    max_interval (float): The longest time between polls, in
+                        seconds. Defaults to 300.
+
+        Returns:
+            None
+
+        """
+
+        # Ensure server is connected
+        if type(self.server) is not IMAPClient:
+            raise ValueError("server attribute must be type IMAPClient")
+
+        # Set the relevant kwarg variables
+        move = kwargs.get('move')
+        unread = bool(kwargs.get('unread'))
+        delete = bool(kwargs.get('delete'))
+        claim = bool(kwargs.get('claim'))
+        min_interval = kwargs.get('min_interval') or 5
+        max_interval = kwargs.get('max_interval') or 300
+        self.__check_claim(move, unread, delete, claim)
+
+        # Get the timeout value
+        outer_timeout = calc_timeout(timeout)
+
+        # Resume from any journal before waiting for changes
+        if self.journal is not None:
+            msgs = self.scrape(move=move, unread=unread, delete=delete,
+                    claim=claim)
+            if msgs:
+                self.__process(msgs, process_func)
+
+        interval = min_interval
+        last_status = self.__folder_status(self.folder)
+        # Run until the timeout is reached
+        while (get_time() < outer_timeout):
+            time.sleep(max(0, min(interval, outer_timeout - get_time())))
+            status = self.__folder_status(self.folder)
+            changed = (status != last_status)
+            logger.debug("Folder status: %s", status if changed else "unchanged")
+            # If the folder has changed
+            if changed:
+                if self.stats is not None:
+                    self.stats.begin("poll", self.folder)
+                try:
+                    # Process the new emails
+                    msgs = self.scrape(move=move, unread=unread, delete=delete,
+                            claim=claim)
+                    # Run the process function
+                    self.__process(msgs, process_func)
+                    # Keep claiming batches until there are none left
+                    while claim and msgs:
+                        msgs = self.scrape(move=move, unread=unread,
+                                delete=delete, claim=claim)
+                        if msgs:
+                            self.__process(msgs, process_func)
+                finally:
+                    if self.stats is not None:
+                        self.stats.end()
+                # Don't count the scrape's own changes next time
+                status = self.__folder_status(self.folder)
+            last_status = status
+            interval = calc_poll_interval(interval, changed, min_interval,
+                    max_interval)
+        return
+
+
+    def watch(self, folders, timeout, process_func=write_txt_file, **kwargs):
+        """Watch several email folders over one connection, and process new emails.
+
+        If the server supports NOTIFY (RFC 5465), it is asked to report new
+        emails in the watched folders while the connection idles in the current
+        folder. Otherwise, or if the server refuses the NOTIFY command, every
+        watched folder is swept with STATUS, at an interval that adapts like
+        poll(). Either way, a folder is only selected
+        and scraped once it has changed. While process_func runs, the folder
+        attribute is set to the folder the emails came from. The current folder
+        is selected again afterwards.
+
+        Args:
+            folders (list): The names of the folders to watch, or None to watch
+                every personal folder.
+            timeout (int or list): Either an integer representing the number
+                of minutes to timeout in, or a list, formatted as [hour, minute]
+                of the local time to timeout at.
+            process_func (function): A function called to further process the
+                emails. The function must take only the list of file paths
+                returned by the scrape function as an argument. Defaults to the
+                example function write_txt_file in the email_processing module.
+            **kwargs (dict): Additional arguments for processing the email.
+                Optional arguments include:
+                    move (str): The folder to move emails to. If not set, the
+                        emails will not be moved.
+                    unread (bool): Whether the emails should be marked as unread.
+                        If not set, emails are kept as read.
+                    delete (bool): Whether the emails should be deleted. If not
+                        set, emails are not deleted.
+                    claim (bool): Whether to only process emails this listener
+                        claims, so several listeners can share the folder. See
+                        scrape(). If not set, every unseen email is processed.
+                    min_interval (float): The shortest time between STATUS
+                        sweeps, in seconds. Defaults to 5.
+                    max_interval (float): The longest time between STATUS
+                        sweeps, in seconds. Defaults to 300.
+
+        Returns:
+            None
+
+        """
+
+        # Ensure server is connected
+        if type(self.server) is not IMAPClient:
+            raise ValueError("server attribute must be type IMAPClient")
+        self.__check_claim(kwargs.get('move'), bool(kwargs.get('unread')),
+                bool(kwargs.get('delete')), bool(kwargs.get('claim')))
+
+        # Get the timeout value
+        outer_timeout = calc_timeout(timeout)
+
+        if self.server.has_capability('NOTIFY') and self.server.has_capability('IDLE'):
+            self.__watch_notify(folders, outer_timeout, process_func, **kwargs)
+        else:
+            self.__watch_status(folders, outer_timeout, process_func, **kwargs)
+        return
+
+
+    def __watch_notify(self, folders, outer_timeout, process_func, **kwargs):
+        """Helper function, watches folders for new emails using NOTIFY.
+
+        Args:
+            folders (list): The names of the folders to watch, or None to watch
+                every personal folder.
+            outer_timeout (float): The time to stop watching at, in seconds
+                since epoch.
+            process_func (function): A function called to further process the
+                emails.
+            **kwargs (dict): Additional arguments for processing the email,
+                as in watch().
+
+        Returns:
+            None
+
+        """
+
+        # Ask for new and expunged emails in the current and watched folders
+        events = b"(MessageNew MessageExpunge)"
+        try:
+            internals = IMAPInternals(self.server)
+            if folders is None:
+                mailboxes = b"(personal " + events + b")"
+            else:
+                mailboxes = (b"(mailboxes (" + b" ".join(
+                        internals.normalise_folder(f) for f in folders)
+                        + b") " + events + b")")
+            internals.untagged_command(b"NOTIFY",
+                    [b"SET", b"(selected " + events + b")", mailboxes])
+        except IMAPClient.AbortError:
+            raise
+        except (AttributeError, IMAPClient.Error) as err:
+            logger.info("NOTIFY can't be used, so sweeping with STATUS: %s", err)
+            self.__watch_status(folders, outer_timeout, process_func, **kwargs)
+            return
+
+        try:
+            # Run until the timeout is reached
+            while (get_time() < outer_timeout):
+                self.server.idle()
+                logger.info("Connection is now in IDLE mode.")
+                # Wait for events until the timeout, 5 minutes at most
+                inner_timeout = min(get_time() + 60*5, outer_timeout)
+                changed = []
+                while (get_time() < inner_timeout) and not changed:
+                    responses = self.server.idle_check(timeout=min(30,
+                            max(0, inner_timeout - get_time())))
+                    logger.debug("Server sent: %s",
+                            responses if responses else "nothing")
+                    # Find which folders the responses are about
+                    for response in responses:
+                        if response[1] == b'EXISTS':
+                            folder = self.folder
+                        elif response[0] == b'STATUS':
+                            folder = folder_name(response[1])
+                        else:
+                            continue
+                        if ((folders is None or folder in folders)
+                                and folder not in changed):
+                            changed.append(folder)
+                self.server.idle_done()
+                # Scrape and process each folder that has changed
+                results = self.__scrape_each(changed, kwargs.get('move'),
+                        bool(kwargs.get('unread')), bool(kwargs.get('delete')),
+                        bool(kwargs.get('claim')))
+                self.__process_each(results, process_func)
+        finally:
+            internals.untagged_command(b"NOTIFY", [b"NONE"])
+
+
+    def __watch_status(self, folders, outer_timeout, process_func, **kwargs):
+        """Helper function, watches folders for new emails using STATUS sweeps.
+
+        Args:
+            folders (list): The names of the folders to watch, or None to watch
+                every folder.
+            outer_timeout (float): The time to stop watching at, in seconds
+                since epoch.
+            process_func (function): A function called to further process the
+                emails.
+            **kwargs (dict): Additional arguments for processing the email,
+                as in watch().
+
+        Returns:
+            None
+
+        """
+
+        min_interval = kwargs.get('min_interval') or 5
+        max_interval = kwargs.get('max_interval') or 300
+        if folders is None:
+            folders = [name for flags, delim, name in self.server.list_folders()
+                    if b'\\Noselect' not in flags]
+
+        # Record where each folder starts, so only later changes are scraped
+        self.__last_status.update(self.__folder_statuses(folders, modseq=False))
+
+        interval = min_interval
+        # Run until the timeout is reached
+        while (get_time() < outer_timeout):
+            time.sleep(max(0, min(interval, outer_timeout - get_time())))
+            results = self.scrape_folders(folders, move=kwargs.get('move'),
+                    unread=bool(kwargs.get('unread')),
+                    delete=bool(kwargs.get('delete')),
+                    claim=bool(kwargs.get('claim')))
+            changed = [folder for folder in folders if results[folder]]
+            logger.debug("Changed folders: %s", changed if changed else "none")
+            self.__process_each(results, process_func)
+            interval = calc_poll_interval(interval, bool(changed), min_interval,
+                    max_interval)
+
+
+    def scrape_folders(self, folders, move=None, unread=False, delete=False,
+            claim=False):
+        """Scrape unread emails from several folders, skipping unchanged ones.
+
+        Each folder's UIDNEXT and UNSEEN counts are checked with STATUS, which
+        doesn't need the folder to be selected. The STATUS commands for every
+        folder are pipelined, so checking them costs one round trip. Only
+        folders whose counts differ from the ones recorded after the last
+        scrape_folders() call are selected and scraped, so every folder is
+        scraped on the first call. The current folder is selected again
+        afterwards.
+
+        Args:
+            folders (list): The names of the folders to scrape.
+            move (str): The folder to move the emails to. If None, the emails
+                are not moved. Defaults to None.
+            unread (bool): Whether the emails should be marked as unread.
+                Defaults to False.
+            delete (bool): Whether the emails should be deleted. Defaults to
+                False.
+            claim (bool): Whether to only scrape emails this listener claims.
+                See scrape(). Defaults to False.
+
+        Returns:
+            A dictionary keyed by folder name, holding the dictionary returned
+            by scrape() for each folder. Skipped folders hold an empty
+            dictionary.
+
+        """
+
+        # Ensure server is connected
+        if type(self.server) is not IMAPClient:
+            raise ValueError("server attribute must be type IMAPClient")
+
+        # Find the folders which have changed
+        statuses = self.__folder_statuses(folders, modseq=False)
+        changed = [folder for folder in folders
+                if statuses[folder] != self.__last_status.get(folder)]
+
+        results = {folder: {} for folder in folders}
+        results.update(self.__scrape_each(changed, move, unread, delete, claim))
+
+        # Record the counts left after scraping, so the next call skips the
+        # folders again unless something else changes them. A folder which
+        # had emails claimed may have more left to claim, so isn't skipped.
+        recheck = []
+        for folder in changed:
+            if claim and results[folder]:
+                self.__last_status.pop(folder, None)
+            else:
+                recheck.append(folder)
+        self.__last_status.update(self.__folder_statuses(recheck, modseq=False))
+        return results
+
+
+    def __scrape_each(self, folders, move, unread, delete, claim=False):
+        """Helper function, selects and scrapes each of a list of folders.
+
+        Args:
+            folders (list): The names of the folders to scrape.
+            move (str): The folder to move the emails to, or None.
+            unread (bool): Whether the emails should be marked as unread.
+            delete (bool): Whether the emails should be deleted.
+            claim (bool): Whether to only scrape emails this listener claims.
+                Defaults to False.
+
+        Returns:
+            A dictionary keyed by folder name, holding the dictionary returned
+            by scrape() for each folder.
+
+        """
+
+        results = {}
+        if not folders:
+            return results
+        home = self.folder
+        try:
+            for folder in folders:
+                # Select the folder, then scrape it
+                self.folder = folder
+                if folder != home:
+                    self.server.select_folder(folder, readonly=False)
+                results[folder] = self.scrape(move=move, unread=unread,
+                        delete=delete, claim=claim)
+        finally:
+            # Go back to the original folder
+            self.folder = home
+            if list(folders) != [home]:
+                self.server.select_folder(home, readonly=False)
+        return results
+
+
+    def __process_each(self, results, process_func):
+        """Helper function, runs the process function on each folder's emails.
+
+        Args:
+            results (dict): The scraped emails of each folder, keyed by folder
+                name, as returned by scrape_folders().
+            process_func (function): A function called to further process the
+                emails. While it runs, the folder attribute is set to the
+                folder the emails came from.
+
+        Returns:
+            None
+
+        """
+
+        home = self.folder
+        for folder, msgs in results.items():
+            if msgs:
+                self.folder = folder
+                try:
+                    self.__call_process_func(msgs, process_func)
+                finally:
+                    self.folder = home
+            # Acknowledge the folder's emails, even if there were none, so
+            # the journal knows they were all processed
+            self.acknowledge(folder)
+
+
+    def __process(self, msgs, process_func):
+        """Helper function, runs the process function, then acknowledges the emails.
+
+        Args:
+            msgs (dict): The scraped emails, as returned by scrape().
+            process_func (function): A function called to further process the
+                emails.
+
+        Returns:
+            None
+
+        """
+
+        self.__call_process_func(msgs, process_func)
+        self.acknowledge()
+
+
+    def __call_process_func(self, msgs, process_func):
+        """Helper function, calls the process function, timing it if requested.
+
+        Args:
+            msgs (dict): The scraped emails, as returned by scrape().
+            process_func (function): A function called to further process the
+                emails.
+
+        Returns:
+            None
+
+        """
+
+        metrics = self.metrics
+        if self.stats is None and metrics is None and self.latency is None:
+            process_func(self, msgs)
+            return
+        if metrics is not None:
+            metrics.queue_depth.inc(len(msgs))
+        start = time.perf_counter()
+        try:
+            process_func(self, msgs)
+        finally:
+            if metrics is not None:
+                metrics.queue_depth.dec(len(msgs))
+        seconds = time.perf_counter() - start
+        if self.stats is not None:
+            self.stats.add("process_func", seconds, emails=len(msgs))
+        if metrics is not None:
+            metrics.processed_total.inc(len(msgs))
+            metrics.process_seconds.observe(seconds)
+
+        # Measure the latency of the emails just processed
+        arrivals = self.__arrivals.pop(self.folder, {})
+        now = time.time()
+        for key in msgs:
+            if key not in arrivals:
+                continue
+            delivered, detected = arrivals[key]
+            if metrics is not None:
+                metrics.delivery_delay_seconds.observe(now - delivered)
+            if self.latency is not None:
+                self.latency.detect_to_processed.add(now - detected, now)
+                self.latency.delivery_to_processed.add(now - delivered, now)
+
+
+    def __folder_status(self, folder, modseq=True):
+        """Helper function, gets the counters used to detect changes to a folder.
+
+        Args:
+            folder (str): The folder to get the status of.
+            modseq (bool): Whether to include HIGHESTMODSEQ, which also changes
+                when flags change. Defaults to True.
+
+        Returns:
+            A tuple of the folder's UIDNEXT, UNSEEN and, if requested and the
+            server supports CONDSTORE, HIGHESTMODSEQ counts. HIGHESTMODSEQ is
+            None otherwise.
+
+        """
+
+        return self.__folder_statuses([folder], modseq)[folder]
+
+
+    def __folder_statuses(self, folders, modseq=True):
+        """Helper function, gets the counters of several folders in one round trip.
+
+        Args:
+            folders (list): The folders to get the status of.
+            modseq (bool): Whether to include HIGHESTMODSEQ, which also changes
+                when flags change. Defaults to True.
+
+        Returns:
+            A dictionary keyed by folder name, holding a tuple of each folder's
+            UIDNEXT, UNSEEN and, if requested and the server supports
+            CONDSTORE, HIGHESTMODSEQ counts. HIGHESTMODSEQ is None otherwise.
+
+        """
+
+        what = ['UIDNEXT', 'UNSEEN']
+        condstore = modseq and self.server.has_capability('CONDSTORE')
+        if condstore:
+            what.append('HIGHESTMODSEQ')
+        if len(folders) == 1:
+            results = [self.server.folder_status(folders[0], what)]
+        else:
+            pipeline = IMAPPipeline(self.server)
+            for folder in folders:
+                pipeline.status(folder, what)
+            results = pipeline.execute()
+        return {folder: (status.get(b'UIDNEXT'), status.get(b'UNSEEN'),
+                status.get(b'HIGHESTMODSEQ') if condstore else None)
+                for folder, status in zip(folders, results)}
+
+
+    def __idle(self, process_func=write_txt_file, **kwargs):
+        """Helper function, idles in an email folder processing incoming emails.
+
+        Args:
+            process_func (function): A function called to further process the
+                emails. The function must take only the list of file paths
+                returned by the scrape function as an argument. Defaults to the
+                example function write_txt_file in the email_processing module.
+            **kwargs (dict): Additional arguments for processing the email.
+                Optional arguments include:
+                    move (str): The folder to move emails to. If not set, the
+                        emails will not be moved.
+                    unread (bool): Whether the emails should be marked as unread.
+                        If not set, emails are kept as read.
+                    delete (bool): Whether the emails should be deleted. If not
+                        set, emails are not deleted.
+                    claim (bool): Whether to only process emails this listener
+                        claims, so several listeners can share the folder. See
+                        scrape(). If not set, every unseen email is processed.
+                    standby (bool): Whether to keep the standby connection
+                        alive. If not set, it is left alone.
+
+        Returns:
+            None
+
+        """
+
+        # Set the relevant kwarg variables
+        move = kwargs.get('move')
+        unread = bool(kwargs.get('unread'))
+        delete = bool(kwargs.get('delete'))
+        claim = bool(kwargs.get('claim'))
+
+        stats = self.stats
+        # Start idling
+        self.server.idle()
+        logger.info("Connection is now in IDLE mode.")
+        if stats is not None:
+            idle_start = time.perf_counter()
+        # Set idle timeout to 5 minutes
+        inner_timeout = get_time() + 60*5
+        # Until idle times out
+        while (get_time() < inner_timeout):
+            # Check for a new response every 30 seconds
+            check_start = get_time()
+            responses = self.server.idle_check(timeout=30)
+            logger.debug("Server sent: %s", responses if responses else "nothing")
+            # idle_check() swallows EOF, so returning early with nothing means
+            # the connection may have closed. Restarting IDLE raises if so.
+            if not responses and get_time() - check_start < 30:
+                self.server.idle_done()
+                self.server.idle()
+            # Keep any standby connection alive
+            if kwargs.get('standby'):
+                self.__refresh_standby()
+            # If there is a response
+            if (responses):
+                # Time the wake up as a cycle, from when idling started
+                if stats is not None:
+                    stats.begin("idle", self.folder)
+                    stats.add("idle_wait", time.perf_counter() - idle_start)
+                try:
+                    # Suspend the idling
+                    self.server.idle_done()
+                    # Process the new emails
+                    msgs = self.scrape(move=move, unread=unread, delete=delete,
+                            claim=claim)
+                    # Run the process function
+                    self.__process(msgs, process_func)
+                    # Keep claiming batches until there are none left
+                    while claim and msgs:
+                        msgs = self.scrape(move=move, unread=unread,
+                                delete=delete, claim=claim)
+                        if msgs:
+                            self.__process(msgs, process_func)
+                finally:
+                    if stats is not None:
+                        stats.end()
+                # Restart idling
+                self.server.idle()
+                if stats is not None:
+                    idle_start = time.perf_counter()
+        # Stop idling
+        self.server.idle_done()
+        return
+
+
+    def __build_standby(self):
+        """Helper function, builds a spare connection in a background thread.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        # Only build one spare at a time
+        if self.__standby_thread is not None and self.__standby_thread.is_alive():
+            return
+
+        def build():
+            try:
+                server = self.__connect()
+            except (OSError, IMAPClient.Error):
+                # Try again on the next refresh
+                return
+            with self.__standby_lock:
+                self.standby = server
+                self.__standby_noop = get_time()
+
+        self.__standby_thread = threading.Thread(target=build, daemon=True)
+        self.__standby_thread.start()
+
+
+    def __refresh_standby(self):
+        """Helper function, NOOPs the spare connection if it is due one.
+
+        A spare that fails its NOOP, or is missing, is rebuilt in the background.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__standby_lock:
+            standby = self.standby
+            if standby is not None and (get_time() - self.__standby_noop
+                    < self.standby_noop_interval):
+                return
+            self.__standby_noop = get_time()
+
+        if standby is None:
+            self.__build_standby()
+            return
+        try:
+            standby.noop()
+        except (OSError, IMAPClient.Error):
+            with self.__standby_lock:
+                if self.standby is standby:
+                    self.standby = None
+            self.__build_standby()
+
+
+    def __failover(self):
+        """Helper function, swaps a failed connection for the spare connection.
+
+        Args:
+            None
+
+        Returns:
+            True if the spare connection was swapped in, or False if there was
+            no spare connection ready.
+
+        """
+
+        with self.__standby_lock:
+            standby, self.standby = self.standby, None
+        if standby is None:
+            return False
+
+        # Drop the failed connection without waiting on the server
+        try:
+            self.server.shutdown()
+        except Exception:
+            pass
+        self.server = standby
+        if self.metrics is not None:
+            self.metrics.failovers_total.inc()
+        # Replace the spare in the background
+        self.__build_standby()
+        return True
+
@@ -0,0 +1,498 @@
+"""metrics: Counters and histograms, exposed in the Prometheus text format.
+
+Example:
+
+    # Count what a listener and a responder do, in one registry
+    registry = MetricsRegistry()
+    listener.metrics = ListenerMetrics(registry)
+    responder.metrics = ResponderMetrics(registry)
+
+    # Serve the metrics at http://127.0.0.1:9464/metrics
+    registry.serve(9464)
+
+    # Or get the Prometheus text directly
+    print(registry.render())
+
+"""
+
+# Imports from other packages
+from bisect import bisect_left
+import threading
+
+
+# The default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+        60, 300)
+# Buckets for delays measured from delivery, in seconds
+DELAY_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class Counter:
+    """Counter object for a value that only goes up.
+
+    Attributes:
+        value (float): The current value.
+
+    """
+
+    kind = "counter"
+
+    def __init__(self):
+        """Initialize a Counter instance at zero.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.value = 0
+        self.__lock = threading.Lock()
+
+
+    def inc(self, amount=1):
+        """Add to the counter.
+
+        Args:
+            amount (float): The amount to add. Defaults to 1.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.value += amount
+
+
+    def samples(self):
+        """Get the samples to render, as (suffix, extra labels, value) tuples."""
+
+        return [("", "", self.value)]
+
+
+class Gauge(Counter):
+    """Gauge object for a value that goes up and down.
+
+    Attributes:
+        value (float): The current value.
+
+    """
+
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        """Subtract from the gauge.
+
+        Args:
+            amount (float): The amount to subtract. Defaults to 1.
+
+        Returns:
+            None
+
+        """
+
+        self.inc(-amount)
+
+
+    def set(self, value):
+        """Set the gauge.
+
+        Args:
+            value (float): The new value.
+
+        Returns:
+            None
+
+        """
+
+        self.value = value
+
+
+class Histogram:
+    """Histogram object for counting observations into buckets.
+
+    Each observation costs one binary search and a few additions, so it can
+    be made for every email.
+
+    Attributes:
+        buckets (tuple): The sorted upper bounds of the buckets.
+        counts (list): The number of observations in each bucket, with the
+            last holding those above every bound. Not cumulative.
+        sum (float): The sum of every observation.
+        count (int): The number of observations.
+
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Initialize a Histogram instance with no observations.
+
+        Args:
+            buckets (tuple): The upper bounds of the buckets. Defaults to
+                DEFAULT_BUCKETS.
+
+        Returns:
+            None
+
+        """
+
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.__lock = threading.Lock()
+
+
+    def observe(self, value):
+        """Add an observation.
+
+        Args:
+            value (float): The value observed.
+
+        Returns:
+            None
+
+        """
+
+        index = bisect_left(self.buckets, value)
+        with self.__lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+    def samples(self):
+        """Get the samples to render, as (suffix, extra labels, value) tuples."""
+
+        with self.__lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            samples.append(("_bucket", 'le="{}"'.format(le), cumulative))
+        samples.append(("_sum", "", total))
+        samples.append(("_count", "", count))
+        return samples
+
+
+class MetricsRegistry:
+    """MetricsRegistry object holding every metric to expose.
+
+    Metrics are grouped into families by name. Getting a metric with the same
+    name and labels twice returns the same metric, so several listeners can
+    share a registry, each with their own labels.
+
+    Attributes:
+        families (dict): For each metric name, a tuple of its type, its help
+            text, and a dictionary of its metrics keyed by their labels.
+
+    """
+
+    def __init__(self):
+        """Initialize a MetricsRegistry instance with no metrics.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.families = {}
+        self.__lock = threading.Lock()
+
+
+    def counter(self, name, help_text, labels=None):
+        """Get or create a counter.
+
+        Args:
+            name (str): The metric name.
+            help_text (str): The help text of the metric.
+            labels (dict): The labels of the metric. Defaults to None.
+
+        Returns:
+            The Counter.
+
+        """
+
+        return self.__get(Counter, name, help_text, labels)
+
+
+    def gauge(self, name, help_text, labels=None):
+        """Get or create a gauge.
+
+        Args:
+            name (str): The metric name.
+            help_text (str): The help text of the metric.
+            labels (dict): The labels of the metric. Defaults to None.
+
+        Returns:
+            The Gauge.
+
+        """
+
+        return self.__get(Gauge, name, help_text, labels)
+
+
+    def histogram(self, name, help_text, labels=None, buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram.
+
+        Args:
+            name (str): The metric name.
+            help_text (str): The help text of the metric.
+            labels (dict): The labels of the metric. Defaults to None.
+            buckets (tuple): The upper bounds of the buckets, used if the
+                histogram is created. Defaults to DEFAULT_BUCKETS.
+
+        Returns:
+            The Histogram.
+
+        """
+
+        return self.__get(lambda: Histogram(buckets), name, help_text, labels,
+                kind=Histogram.kind)
+
+
+    def render(self):
+        """Render every metric in the Prometheus text format.
+
+        Args:
+            None
+
+        Returns:
+            The text, as a string.
+
+        """
+
+        lines = []
+        with self.__lock:
+            families = [(name, kind, help_text, list(metrics.items()))
+                    for name, (kind, help_text, metrics) in sorted(self.families.items())]
+        for name, kind, help_text, metrics in families:
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, metric in metrics:
+                for suffix, extra, value in metric.samples():
+                    label_text = ",".join(["{}=\"{}\"".format(key, escape(val))
+                            for key, val in labels] + ([extra] if extra else []))
+                    lines.append("{}{}{} {}".format(name, suffix,
+                            "{" + label_text + "}" if label_text else "",
+                            format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the metrics over HTTP in a background thread.
+
+        Every GET request is answered with the Prometheus text of the metrics.
+
+        Args:
+            port (int): The port to listen on, or 0 to pick a free port.
+            host (str): The host to listen on. Defaults to localhost only.
+
+        Returns:
+            The http.server.ThreadingHTTPServer, whose shutdown() method stops
+            serving.
+
+        """
+
+        # Only needed when serving, so not imported with the module
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+    def __get(self, factory, name, help_text, labels, kind=None):
+        """Helper function, gets or creates a metric.
+
+        Args:
+            factory (function): Creates the metric.
+            name (str): The metric name.
+            help_text (str): The help text of the metric.
+            labels (dict): The labels of the metric, or None.
+            kind (str): The metric type. Defaults to None, which uses the
+                factory's kind attribute.
+
+        Returns:
+            The metric.
+
+        """
+
+        kind = kind or factory.kind
+        key = tuple(sorted((labels or {}).items()))
+        with self.__lock:
+            family = self.families.setdefault(name, (kind, help_text, {}))
+            if family[0] != kind:
+                raise ValueError("metric {} is already a {}".format(name, family[0]))
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+        return metric
+
+
+class ListenerMetrics:
+    """ListenerMetrics object holding the metrics kept by an EmailListener.
+
+    The rate of emails_total gives the emails scraped per second, and the
+    ratio of tls_resumed_total to tls_connections_total gives the TLS session
+    cache hit rate.
+
+    Attributes:
+        registry (MetricsRegistry): The registry the metrics are in.
+        emails_total (Counter): Emails scraped.
+        fetched_bytes_total (Counter): Bytes of email fetched.
+        scrapes_total (Counter): Calls of scrape().
+        scrape_seconds (Histogram): The duration of each scrape().
+        processed_total (Counter): Emails the process function finished.
+        process_seconds (Histogram): The duration of each process function
+            call.
+        delivery_delay_seconds (Histogram): The time from each email's
+            INTERNALDATE to the process function finishing with it.
+        queue_depth (Gauge): Emails scraped and waiting on the process function.
+        reconnects_total (Counter): Reconnections after a failed connection.
+        failovers_total (Counter): Switches to the standby connection.
+        tls_connections_total (Counter): TLS connections opened.
+        tls_resumed_total (Counter): TLS connections which resumed a cached
+            session.
+
+    """
+
+    def __init__(self, registry=None, labels=None):
+        """Initialize a ListenerMetrics instance.
+
+        Args:
+            registry (MetricsRegistry): The registry to keep the metrics in.
+                Defaults to None, which creates one.
+            labels (dict): Labels to tell this listener's metrics apart from
+                other listeners in the registry, such as its email and folder.
+                Defaults to None.
+
+        Returns:
+            None
+
+        """
+
+        self.registry = registry = registry or MetricsRegistry()
+        self.emails_total = registry.counter("email_listener_emails_total",
+                "Emails scraped.", labels)
+        self.fetched_bytes_total = registry.counter(
+                "email_listener_fetched_bytes_total", "Bytes of email fetched.",
+                labels)
+        self.scrapes_total = registry.counter("email_listener_scrapes_total",
+                "Calls of scrape().", labels)
+        self.scrape_seconds = registry.histogram("email_listener_scrape_seconds",
+                "The duration of each scrape().", labels)
+        self.processed_total = registry.counter("email_listener_processed_total",
+                "Emails the process function finished.", labels)
+        self.process_seconds = registry.histogram(
+                "email_listener_process_seconds",
+                "The duration of each process function call.", labels)
+        self.delivery_delay_seconds = registry.histogram(
+                "email_listener_delivery_delay_seconds",
+                "The time from each email's INTERNALDATE to it being processed.",
+                labels, buckets=DELAY_BUCKETS)
+        self.queue_depth = registry.gauge("email_listener_queue_depth",
+                "Emails scraped and waiting on the process function.", labels)
+        self.reconnects_total = registry.counter(
+                "email_listener_reconnects_total",
+                "Reconnections after a failed connection.", labels)
+        self.failovers_total = registry.counter("email_listener_failovers_total",
+                "Switches to the standby connection.", labels)
+        self.tls_connections_total = registry.counter(
+                "email_listener_tls_connections_total", "TLS connections opened.",
+                labels)
+        self.tls_resumed_total = registry.counter(
+                "email_listener_tls_resumed_total",
+                "TLS connections which resumed a cached session.", labels)
+
+
+class ResponderMetrics:
+    """ResponderMetrics object holding the metrics kept by an EmailResponder.
+
+    Attributes:
+        registry (MetricsRegistry): The registry the metrics are in.
+        sent_total (Counter): Emails sent.
+        sent_bytes_total (Counter): Bytes of email sent.
+        send_seconds (Histogram): The duration of each send.
+        send_errors_total (Counter): Sends which raised an error.
+
+    """
+
+    def __init__(self, registry=None, labels=None):
+        """Initialize a ResponderMetrics instance.
+
+        Args:
+            registry (MetricsRegistry): The registry to keep the metrics in.
+                Defaults to None, which creates one.
+            labels (dict): Labels to tell this responder's metrics apart from
+                other responders in the registry. Defaults to None.
+
+        Returns:
+            None
+
+        """
+
+        self.registry = registry = registry or MetricsRegistry()
+        self.sent_total = registry.counter("email_responder_sent_total",
+                "Emails sent.", labels)
+        self.sent_bytes_total = registry.counter(
+                "email_responder_sent_bytes_total", "Bytes of email sent.", labels)
+        self.send_seconds = registry.histogram("email_responder_send_seconds",
+                "The duration of each send.", labels)
+        self.send_errors_total = registry.counter(
+                "email_responder_send_errors_total",
+                "Sends which raised an error.", labels)
+
+
+def escape(value):
+    """Escape a label value for the Prometheus text format.
+
+    Args:
+        value (str): The label value.
+
+    Returns:
+        The escaped value.
+
+    """
+
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    """Format a sample value for the Prometheus text format.
+
+    Args:
+        value (float): The value.
+
+    Returns:
+        The value as a string, without a trailing .0 for whole numbers.
+
+    """
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
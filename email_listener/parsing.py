@@ -0,0 +1,195 @@
+"""parsing: Parse raw email messages into the dictionaries returned by scrape().
+
+Example:
+
+    # Parse an email with UID 12, saving any attachments to ./files/
+    key, val_dict = parse_message(12, raw_bytes, "./files/")
+
+    # key is formatted as "<uid>_<from address>", for example
+    # "12_somebody@gmail.com", and val_dict holds the Subject, Plain_Text,
+    # Plain_HTML, HTML and attachments of the email, where present.
+
+"""
+
+# Imports from other packages
+import email
+import email.utils
+import logging
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_message(uid, raw, attachment_dir, stats=None):
+    """Parse an email message.
+
+    Args:
+        uid (int): The UID of the email message.
+        raw (bytes): The RFC822 source of the email message.
+        attachment_dir (str): The file path to the folder to save attachments
+            to.
+        stats (PipelineStats): The stats to add the time spent parsing to.
+            Defaults to None, which doesn't time it.
+
+    Returns:
+        A tuple of the dict key for the email and its value dictionary.
+
+    """
+
+    if stats is not None:
+        start = time.perf_counter()
+    # Get the message
+    email_message = email.message_from_bytes(raw)
+    # Get who the message is from
+    from_email = get_from(email_message)
+
+    # Generate the dict key for this email
+    key = "{}_{}".format(uid, from_email)
+    # Generate the value dictionary to be filled later
+    val_dict = {}
+
+    # Display notice
+    logger.info("PROCESSING: Email UID = %s from %s", uid, from_email)
+
+    # Add the subject
+    val_dict["Subject"] = get_subject(email_message).strip()
+
+    # If the email has multiple parts
+    if email_message.is_multipart():
+        val_dict = parse_multipart_message(email_message, val_dict, attachment_dir,
+                stats)
+
+    # If the message isn't multipart
+    else:
+        val_dict = parse_singlepart_message(email_message, val_dict)
+
+    if stats is not None:
+        stats.add("parse", time.perf_counter() - start, len(raw), 1)
+    return key, val_dict
+
+
+def get_from(email_message):
+    """Get who an email message is from.
+
+    Args:
+        email_message (email.message): The email message to get sender of.
+
+    Returns:
+        A string containing the from email address.
+
+    """
+
+    from_raw = email_message.get_all('From', [])
+    from_list = email.utils.getaddresses(from_raw)
+    if not from_list:
+        from_email = "UnknownEmail"
+    elif len(from_list[0]) == 1:
+        from_email = from_list[0][0]
+    elif len(from_list[0]) == 2:
+        from_email = from_list[0][1]
+    else:
+        from_email = "UnknownEmail"
+
+    return from_email
+
+
+def get_subject(email_message):
+    """Get the subject of an email message.
+
+    Args:
+        email_message (email.message): The email message to get the subject of.
+
+    Returns:
+        The subject, or "No Subject" if the email doesn't have one.
+
+    """
+
+    # Get the subject
+    subject = email_message.get("Subject")
+    # If there isn't a subject
+    if subject is None:
+        return "No Subject"
+    return subject
+
+
+def parse_multipart_message(email_message, val_dict, attachment_dir, stats=None):
+    """Parse a multipart email message.
+
+    Args:
+        email_message (email.message): The email message to parse.
+        val_dict (dict): A dictionary containing the message data from each
+            part of the message. Will be returned after it is updated.
+        attachment_dir (str): The file path to the folder to save attachments
+            to.
+        stats (PipelineStats): The stats to add the time spent converting HTML
+            and writing attachments to. Defaults to None, which doesn't time
+            them.
+
+    Returns:
+        The dictionary containing the message data for each part of the
+        message.
+
+    """
+
+    # For each part
+    for part in email_message.walk():
+        # If the part is an attachment
+        file_name = part.get_filename()
+        if bool(file_name):
+            if stats is not None:
+                start = time.perf_counter()
+            # Generate file path
+            file_path = os.path.join(attachment_dir, file_name)
+            payload = part.get_payload(decode=True)
+            file = open(file_path, 'wb')
+            file.write(payload)
+            file.close()
+            if stats is not None:
+                stats.add("attachment_write", time.perf_counter() - start,
+                        len(payload), 1)
+            # Get the list of attachments, or initialize it if there isn't one
+            attachment_list = val_dict.get("attachments") or []
+            attachment_list.append("{}".format(file_path))
+            val_dict["attachments"] = attachment_list
+
+        # If the part is html text
+        elif part.get_content_type() == 'text/html':
+            # Convert the body from html to plain text, importing the
+            # converter the first time it is needed
+            import html2text
+            if stats is not None:
+                start = time.perf_counter()
+            val_dict["Plain_HTML"] = html2text.html2text(
+                    part.get_payload())
+            val_dict["HTML"] = part.get_payload()
+            if stats is not None:
+                stats.add("html2text", time.perf_counter() - start,
+                        len(val_dict["HTML"]), 1)
+
+        # If the part is plain text
+        elif part.get_content_type() == 'text/plain':
+            # Get the body
+            val_dict["Plain_Text"] = part.get_payload()
+
+    return val_dict
+
+
+def parse_singlepart_message(email_message, val_dict):
+    """Parse a singlepart email message.
+
+    Args:
+        email_message (email.message): The email message to parse.
+        val_dict (dict): A dictionary containing the message data from each
+            part of the message. Will be returned after it is updated.
+
+    Returns:
+        The dictionary containing the message data for each part of the
+        message.
+
+    """
+
+    # Get the message body, which is plain text
+    val_dict["Plain_Text"] = email_message.get_payload()
+    return val_dict
@@ -0,0 +1,340 @@
+"""pipeline: Send several independent IMAP commands before reading their completions.
+
+Example:
+
+    # Queue up commands on a logged in EmailListener's connection
+    pipeline = IMAPPipeline(listener.server)
+    pipeline.fetch([1, 2, 3], ['RFC822'])
+    pipeline.fetch([4, 5, 6], ['RFC822'])
+    pipeline.remove_flags([7, 8], [SEEN])
+    pipeline.move([9, 10], "email_listener")
+    pipeline.status("INBOX", ['UIDNEXT', 'UNSEEN'])
+
+    # Send the commands, then wait for all of their completions, which costs
+    # a single round trip to the server instead of one per command. At most
+    # depth commands are in flight at once.
+    results = pipeline.execute()
+
+"""
+
+# Imports from other packages
+from imapclient import IMAPClient
+from imapclient.imapclient import (
+    join_message_ids,
+    seq_to_parenstr,
+    seq_to_parenstr_upper,
+)
+from imapclient.response_parser import parse_fetch_response, parse_response
+# Imports from this package
+from .imap_adapter import folder_key, IMAPInternals, parse_statuses
+
+
+class IMAPPipeline:
+    """IMAPPipeline object for pipelining independent commands on a connection.
+
+    Only UID commands are supported, so that EXPUNGE responses from earlier
+    commands can't change which messages later commands refer to. STATUS is
+    the exception, as it refers to a folder rather than messages. Per RFC 3501
+    section 5.5, the server executes pipelined commands that depend on each
+    other in the order they were sent.
+
+    At most depth commands are sent ahead of the completions read. A server
+    stops reading commands while its output buffer is full, so sending every
+    command of a large pipeline before reading any responses could leave both
+    sides blocked on writes.
+
+    Pipelining needs IMAPClient's internals, through IMAPInternals. If they
+    can't be used, the commands are sent one at a time through IMAPClient's
+    public methods instead, with the same results, apart from conditional
+    STOREs, which IMAPClient has no public method for.
+
+    Attributes:
+        server (IMAPClient): The logged in connection to send commands over.
+        depth (int): The most commands in flight at once.
+        internals (IMAPInternals): The connection's internals, or None if the
+            commands are sent one at a time.
+        commands (list): The queued commands, as tuples of the command name,
+            its arguments, the message IDs it applies to, or for STATUS, the
+            folder, and a function sending it through IMAPClient's public
+            methods instead.
+
+    """
+
+    def __init__(self, server, depth=16):
+        """Initialize an IMAPPipeline instance.
+
+        Args:
+            server (IMAPClient): The logged in connection to send commands over.
+            depth (int): The most commands in flight at once. Defaults to 16.
+
+        Returns:
+            None
+
+        """
+
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.server = server
+        self.depth = depth
+        try:
+            self.internals = IMAPInternals(server)
+        except AttributeError:
+            self.internals = None
+        self.commands = []
+
+
+    def fetch(self, messages, data):
+        """Queue a FETCH command.
+
+        Args:
+            messages (list): The UIDs of the messages to fetch.
+            data (list): The data items to fetch, for example ['RFC822'].
+
+        Returns:
+            The index of the command's result in the list returned by execute().
+
+        """
+
+        return self.__queue("FETCH", messages, (seq_to_parenstr_upper(data),),
+                lambda uids: self.server.fetch(uids, data))
+
+
+    def add_flags(self, messages, flags, unchanged_since=None):
+        """Queue a silent STORE command adding flags to messages.
+
+        Args:
+            messages (list): The UIDs of the messages to change.
+            flags (list): The flags to add.
+            unchanged_since (int): Only change the messages whose mod-sequence
+                is no higher than this (RFC 7162). The UIDs of the others are
+                listed in a MODIFIED response code. Defaults to None, which
+                changes every message.
+
+        Returns:
+            The index of the command's result in the list returned by execute().
+
+        """
+
+        modifiers = ()
+        if unchanged_since is not None:
+            if self.internals is None:
+                raise ValueError("a conditional STORE needs IMAPClient's "
+                        "internals, which can't be used")
+            modifiers = ("(UNCHANGEDSINCE {})".format(unchanged_since).encode(),)
+        return self.__queue("STORE", messages,
+                modifiers + (b"+FLAGS.SILENT", seq_to_parenstr(flags)),
+                lambda uids: _completion(self.server.add_flags, uids, flags,
+                silent=True))
+
+
+    def remove_flags(self, messages, flags):
+        """Queue a silent STORE command removing flags from messages.
+
+        Args:
+            messages (list): The UIDs of the messages to change.
+            flags (list): The flags to remove.
+
+        Returns:
+            The index of the command's result in the list returned by execute().
+
+        """
+
+        return self.__queue("STORE", messages,
+                (b"-FLAGS.SILENT", seq_to_parenstr(flags)),
+                lambda uids: _completion(self.server.remove_flags, uids, flags,
+                silent=True))
+
+
+    def set_gmail_labels(self, messages, labels):
+        """Queue a silent STORE command setting the Gmail labels of messages.
+
+        Args:
+            messages (list): The UIDs of the messages to change.
+            labels (list): The labels to set.
+
+        Returns:
+            The index of the command's result in the list returned by execute().
+
+        """
+
+        args = None
+        if self.internals is not None:
+            args = (b"X-GM-LABELS.SILENT",
+                    seq_to_parenstr(self.internals.normalise_labels(labels)))
+        return self.__queue("STORE", messages, args,
+                lambda uids: _completion(self.server.set_gmail_labels, uids,
+                labels, silent=True))
+
+
+    def move(self, messages, folder):
+        """Queue a MOVE command.
+
+        Args:
+            messages (list): The UIDs of the messages to move.
+            folder (str): The folder to move the messages to.
+
+        Returns:
+            The index of the command's result in the list returned by execute().
+
+        """
+
+        args = None
+        if self.internals is not None:
+            args = (self.internals.normalise_folder(folder),)
+        return self.__queue("MOVE", messages, args,
+                lambda uids: _completion(self.server.move, uids, folder))
+
+
+    def status(self, folder, what):
+        """Queue a STATUS command.
+
+        Args:
+            folder (str): The folder to get the status of.
+            what (list): The status items to get, for example ['UIDNEXT'].
+
+        Returns:
+            The index of the command's result in the list returned by execute().
+
+        """
+
+        args = None
+        if self.internals is not None:
+            args = (self.internals.normalise_folder(folder),
+                    seq_to_parenstr_upper(what))
+        self.commands.append(("STATUS", args, folder,
+                lambda folder: self.server.folder_status(folder, what)))
+        return len(self.commands) - 1
+
+
+    def execute(self):
+        """Send the queued commands, reading their completions as the depth allows.
+
+        Args:
+            None
+
+        Returns:
+            A list with a result for each queued command, in the order they
+            were queued. The result of a FETCH command is a dictionary in the
+            same format as IMAPClient.fetch(), and the result of a STATUS
+            command is a dictionary in the same format as
+            IMAPClient.folder_status(). The result of any other command
+            is a tuple of its completion status ('OK' or 'NO') and the text
+            sent with it.
+
+        """
+
+        commands, self.commands = self.commands, []
+        internals = self.internals
+        if internals is None:
+            # Send each command through IMAPClient's public methods
+            return [fallback(messages) for _, _, messages, fallback in commands]
+
+        # Send the commands, reading the oldest completion whenever depth
+        # commands are in flight. Any response for a later command is kept by
+        # imaplib until its tag is asked for.
+        tags = []
+        completions = []
+        for name, args, _, _ in commands:
+            if len(tags) - len(completions) >= self.depth:
+                completions.append(self.__complete(commands, tags, completions))
+            if name == "STATUS":
+                tags.append(internals.send(name, *args))
+            else:
+                tags.append(internals.send("UID", name, *args))
+        while len(completions) < len(tags):
+            completions.append(self.__complete(commands, tags, completions))
+
+        # Collect the untagged FETCH responses for every FETCH command at once.
+        # They are taken even without a FETCH command, as a conditional STORE
+        # reports mod-sequences in them, which imaplib would otherwise keep
+        # for the next command that asks for FETCH responses.
+        fetched = {}
+        data = internals.untagged("FETCH")
+        if data and any(command[0] == "FETCH" for command in commands):
+            fetched = parse_fetch_response(data, self.server.normalise_times,
+                    True)
+
+        # Likewise for the untagged STATUS responses, which are matched to
+        # their commands by folder name
+        statuses = {}
+        if any(command[0] == "STATUS" for command in commands):
+            statuses = parse_statuses(internals.untagged("STATUS"))
+
+        results = []
+        for (name, args, messages, _), (typ, data) in zip(commands, completions):
+            if name == "FETCH":
+                internals.check_ok("fetch", typ, data)
+                results.append({uid: fetched[uid] for uid in messages
+                        if uid in fetched})
+            elif name == "STATUS":
+                internals.check_ok("status", typ, data)
+                results.append(statuses.get(folder_key(parse_response(
+                        [args[0]])[0]), {}))
+            else:
+                results.append((typ, data[0]))
+        return results
+
+
+    def __complete(self, commands, tags, completions):
+        """Helper function, reads the completion of the oldest command in flight.
+
+        Args:
+            commands (list): The commands being executed.
+            tags (list): The tags of the commands sent so far.
+            completions (list): The completions read so far.
+
+        Returns:
+            The completion, as a tuple of its status and data.
+
+        """
+
+        i = len(completions)
+        return self.internals.complete(commands[i][0], tags[i])
+
+
+    def __queue(self, name, messages, args, fallback):
+        """Helper function, queues a UID command.
+
+        Args:
+            name (str): The name of the UID command.
+            messages (list): The UIDs the command applies to.
+            args (tuple): The rest of the command's arguments, as bytes, or
+                None if the commands are sent one at a time.
+            fallback (function): A function sending the command through
+                IMAPClient's public methods, called with the list of UIDs.
+
+        Returns:
+            The index of the command's result in the list returned by execute().
+
+        """
+
+        if isinstance(messages, int):
+            messages = [messages]
+        messages = [int(uid) for uid in messages]
+        if args is not None:
+            args = (join_message_ids(messages),) + args
+        self.commands.append((name, args, messages, fallback))
+        return len(self.commands) - 1
+
+
+def _completion(method, *args, **kwargs):
+    """Helper function, calls an IMAPClient method, giving its completion like execute().
+
+    Args:
+        method (function): The IMAPClient method.
+        *args (list): The method's arguments.
+        **kwargs (dict): The method's keyword arguments.
+
+    Returns:
+        A tuple of 'OK' and an empty text, or 'NO' and the error if the server
+        refused the command.
+
+    """
+
+    try:
+        method(*args, **kwargs)
+    except IMAPClient.AbortError:
+        raise
+    except IMAPClient.Error as error:
+        return ("NO", str(error).encode())
+    return ("OK", b"")
@@ -0,0 +1,205 @@
+"""profiling: Profile the next few cycles of a running listener.
+
+Example:
+
+    # Profile the next 3 scrape or IDLE cycles, dumping the stats to ./profiles/
+    listener.profile(3, "./profiles/")
+
+    # Or profile the next 3 cycles whenever the process gets SIGUSR2, such as
+    # from `kill -USR2 <pid>`
+    listener.profile_on_signal(signal.SIGUSR2, 3, "./profiles/")
+
+    # Each cycle leaves three files, named after the folder and cycle number:
+    #   Inbox-cycle1.prof        cProfile stats, for pstats or snakeviz
+    #   Inbox-cycle1.tracemalloc a tracemalloc snapshot, for Snapshot.load()
+    #   Inbox-cycle1.json        the time, peak memory and memory growth of
+    #                            each stage of the cycle
+    stats = pstats.Stats("./profiles/Inbox-cycle1.prof")
+    stats.sort_stats("cumulative").print_stats(20)
+
+"""
+
+# Imports from other packages
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+
+class CycleProfiler:
+    """CycleProfiler object for profiling pipeline cycles with cProfile and tracemalloc.
+
+    The profiler is driven by a PipelineStats object, which starts it at the
+    beginning of each cycle and tells it when each stage finishes. Memory is
+    attributed to a stage as the peak, and growth, of traced memory since the
+    previous stage finished. Before Python 3.9, tracemalloc's peak can't be
+    reset, so a stage's peak is the peak since tracing started, an upper bound.
+
+    Attributes:
+        output_dir (str): The folder the stats files are written to.
+        cycles_left (int): The number of cycles still to profile.
+        cycle (int): The number of cycles profiled so far.
+        frames (int): The number of frames tracemalloc keeps for each
+            allocation.
+        dumps (list): The base paths of each cycle's stats files.
+
+    """
+
+    def __init__(self, output_dir, frames=10):
+        """Initialize a CycleProfiler instance, with no cycles to profile.
+
+        Args:
+            output_dir (str): The folder to write the stats files to. It is
+                created if it doesn't exist.
+            frames (int): The number of frames tracemalloc keeps for each
+                allocation. Defaults to 10.
+
+        Returns:
+            None
+
+        """
+
+        self.output_dir = output_dir
+        self.cycles_left = 0
+        self.cycle = 0
+        self.frames = frames
+        self.dumps = []
+        self.__profile = None
+        self.__started_tracing = False
+        self.__stages = None
+        self.__cycle = None
+        self.__last_memory = 0
+        self.__start = None
+        self.__lock = threading.Lock()
+
+
+    def arm(self, cycles):
+        """Profile the next cycles. Safe to call from a signal handler.
+
+        Args:
+            cycles (int): The number of cycles to profile.
+
+        Returns:
+            None
+
+        """
+
+        self.cycles_left = cycles
+
+
+    def start(self, kind, folder):
+        """Start profiling a cycle, if there are cycles left to profile.
+
+        Args:
+            kind (str): What the cycle is, such as "scrape" or "idle".
+            folder (str): The folder the cycle is for.
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            if self.cycles_left <= 0 or self.__profile is not None:
+                return
+            self.__started_tracing = not tracemalloc.is_tracing()
+            if self.__started_tracing:
+                tracemalloc.start(self.frames)
+            _reset_peak()
+            self.__last_memory = tracemalloc.get_traced_memory()[0]
+            self.__stages = {}
+            self.__cycle = {"kind": kind, "folder": folder}
+            self.__start = time.perf_counter()
+            self.__profile = cProfile.Profile()
+            self.__profile.enable()
+
+
+    def stage(self, stage, seconds):
+        """Attribute the memory used since the last stage to a finished stage.
+
+        Args:
+            stage (str): The stage which finished.
+            seconds (float): How long the stage took.
+
+        Returns:
+            None
+
+        """
+
+        if self.__profile is None:
+            return
+        with self.__lock:
+            if self.__stages is None:
+                return
+            current, peak = tracemalloc.get_traced_memory()
+            totals = self.__stages.setdefault(stage, {"calls": 0, "seconds": 0.0,
+                    "peak_bytes": 0, "growth_bytes": 0})
+            totals["calls"] += 1
+            totals["seconds"] += seconds
+            totals["peak_bytes"] = max(totals["peak_bytes"], peak)
+            totals["growth_bytes"] += current - self.__last_memory
+            self.__last_memory = current
+            _reset_peak()
+
+
+    def stop(self):
+        """Stop profiling the current cycle, and write its stats files.
+
+        Args:
+            None
+
+        Returns:
+            The base path of the stats files written, or None if the cycle
+            wasn't being profiled.
+
+        """
+
+        with self.__lock:
+            profile, self.__profile = self.__profile, None
+            if profile is None:
+                return None
+            profile.disable()
+            seconds = time.perf_counter() - self.__start
+            snapshot = tracemalloc.take_snapshot()
+            if self.__started_tracing:
+                tracemalloc.stop()
+            stages, self.__stages = self.__stages, None
+            self.cycles_left -= 1
+            self.cycle += 1
+            cycle = dict(self.__cycle, cycle=self.cycle, seconds=seconds,
+                    stages=stages)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        folder = re.sub(r"[^\w.-]+", "_", str(cycle["folder"]))
+        base = os.path.join(self.output_dir, "{}-cycle{}".format(folder,
+                cycle["cycle"]))
+        profile.dump_stats(base + ".prof")
+        snapshot.dump(base + ".tracemalloc")
+        cycle["top_allocations"] = [{"line": str(stat.traceback[0]),
+                "bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:20]]
+        with open(base + ".json", "w") as file:
+            json.dump(cycle, file, indent=4)
+        self.dumps.append(base)
+        return base
+
+
+def _reset_peak():
+    """Reset tracemalloc's peak to the current traced memory, where supported.
+
+    tracemalloc.reset_peak() was added in Python 3.9. On earlier versions the
+    peak is left alone.
+
+    Args:
+        None
+
+    Returns:
+        None
+
+    """
+
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
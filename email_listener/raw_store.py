@@ -0,0 +1,458 @@
+"""raw_store: Keep the raw RFC822 source of scraped emails for replay without IMAP.
+
+The source of each email is appended to the current segment file, and its
+location is appended to a compact binary index file, keyed by the folder, its
+UIDVALIDITY and the email's UID, and by its Message-ID. The index file is read
+into memory once, when the store is opened. Segments are read through mmap,
+so looking up an email gives a slice of the mapped file without copying it.
+
+Example:
+
+    # Keep the source of every email the listener scrapes
+    store = RawStore("./files/raw/")
+    listener.raw_store = store
+    listener.scrape()
+
+    # Parse one email again, without fetching it
+    key, val_dict = store.parse("Inbox", uidvalidity, 12, "./files/")
+
+    # Or replay a range of UIDs through a process function
+    msg_dict = dict(store.parse("Inbox", uidvalidity, uid, "./files/")
+            for uid in store.uids("Inbox", uidvalidity, start=10, stop=20))
+    process_func(listener, msg_dict)
+    store.close()
+
+"""
+
+# Imports from other packages
+import email.parser
+import mmap
+import os
+import re
+import struct
+import threading
+# Imports from this package
+from .parsing import parse_message
+
+
+# Each index record is this header, followed by the email's folder and
+# Message-ID. The header holds the UIDVALIDITY, UID, segment number, offset,
+# length, and the lengths of the folder and Message-ID.
+RECORD = struct.Struct("<IIIQIHH")
+
+
+class RawStore:
+    """RawStore object for appending raw emails to segments, and reading them back.
+
+    Segments are named <prefix>-<number>.eml, and hold the source of each
+    email back to back. The index file, <prefix>.index, holds a record per
+    email, and is only appended to once it has been loaded into dictionaries.
+    Segments are mapped when first read, and mapped again when they have grown.
+    An email already in the store is not written again. UIDVALIDITY is
+    only unique within a folder, so emails are keyed by their folder as well,
+    and one store can be shared by every folder a listener scrapes.
+
+    Attributes:
+        directory (str): The folder the segments and index are written to.
+        prefix (str): The start of each segment's file name.
+        max_bytes (int): The size a segment is rotated at.
+        fsync (bool): Whether flush() syncs the segment and index to disk.
+
+    """
+
+    def __init__(self, directory, prefix="raw", max_bytes=256 * 2**20, fsync=True):
+        """Initialize a RawStore instance, loading any index in the directory.
+
+        Args:
+            directory (str): The folder to write to. It is created if it
+                doesn't exist.
+            prefix (str): The start of each segment's file name. Defaults to
+                "raw".
+            max_bytes (int): The size to rotate segments at. Defaults to
+                256 MiB.
+            fsync (bool): Whether flush() syncs to disk. Defaults to True.
+
+        Returns:
+            None
+
+        """
+
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.__lock = threading.RLock()
+        self.__index = {}
+        self.__message_ids = {}
+        self.__maps = {}
+        # Maps replaced while memoryviews of them were still in use
+        self.__stale = []
+
+        os.makedirs(directory, exist_ok=True)
+        self.__index_path = os.path.join(directory, prefix + ".index")
+        self.__segment = self.__load()
+        self.__file = open(self.segment_path(self.__segment), "ab")
+        self.__size = self.__file.tell()
+        self.__index_file = open(self.__index_path, "ab")
+
+
+    def __len__(self):
+        """Get the number of emails in the store.
+
+        Args:
+            None
+
+        Returns:
+            The number of emails.
+
+        """
+
+        return len(self.__index)
+
+
+    def write(self, folder, uidvalidity, uid, raw):
+        """Append the source of an email, unless it is already in the store.
+
+        Args:
+            folder (str): The folder the email is in.
+            uidvalidity (int): The UIDVALIDITY of the email's folder.
+            uid (int): The UID of the email.
+            raw (bytes): The RFC822 source of the email.
+
+        Returns:
+            True if the email was written, or False if it was already stored.
+
+        """
+
+        folder_name = folder.encode("utf-8")
+        if len(folder_name) > 0xffff:
+            raise ValueError("folder name is too long to store")
+        message_id = message_id_of(raw).encode("utf-8")[:0xffff]
+        with self.__lock:
+            if (folder, uidvalidity, uid) in self.__index:
+                return False
+            if self.__size >= self.max_bytes:
+                self.rotate()
+            offset = self.__size
+            self.__file.write(raw)
+            self.__size += len(raw)
+            self.__index_file.write(RECORD.pack(uidvalidity, uid, self.__segment,
+                    offset, len(raw), len(folder_name), len(message_id))
+                    + folder_name + message_id)
+            self.__add(folder, uidvalidity, uid, self.__segment, offset,
+                    len(raw), message_id.decode("utf-8", "replace"))
+        return True
+
+
+    def get(self, folder, uidvalidity, uid):
+        """Get the source of an email by its folder, UIDVALIDITY and UID.
+
+        Args:
+            folder (str): The folder the email is in.
+            uidvalidity (int): The UIDVALIDITY of the email's folder.
+            uid (int): The UID of the email.
+
+        Returns:
+            A memoryview of the email's source in the mapped segment, or None
+            if the email isn't stored.
+
+        """
+
+        with self.__lock:
+            location = self.__index.get((folder, uidvalidity, uid))
+            if location is None:
+                return None
+            return self.__view(*location)
+
+
+    def get_message_id(self, message_id):
+        """Get the source of an email by its Message-ID.
+
+        Args:
+            message_id (str): The Message-ID of the email, with its angle
+                brackets.
+
+        Returns:
+            A memoryview of the source of the last email stored with the
+            Message-ID, or None if there is none.
+
+        """
+
+        with self.__lock:
+            key = self.__message_ids.get(message_id)
+            return None if key is None else self.get(*key)
+
+
+    def uids(self, folder, uidvalidity, start=1, stop=None):
+        """Get the UIDs stored for a folder and UIDVALIDITY, in a range.
+
+        Args:
+            folder (str): The folder the emails are in.
+            uidvalidity (int): The UIDVALIDITY of the folder.
+            start (int): The lowest UID to include. Defaults to 1.
+            stop (int): The highest UID to include. Defaults to None, which has
+                no limit.
+
+        Returns:
+            A sorted list of the UIDs.
+
+        """
+
+        with self.__lock:
+            return sorted(uid for (name, validity, uid) in self.__index
+                    if name == folder and validity == uidvalidity
+                    and uid >= start and (stop is None or uid <= stop))
+
+
+    def replay(self, folder, uidvalidity, start=1, stop=None):
+        """Read back the source of a range of emails, in UID order.
+
+        Args:
+            folder (str): The folder the emails are in.
+            uidvalidity (int): The UIDVALIDITY of the folder.
+            start (int): The lowest UID to include. Defaults to 1.
+            stop (int): The highest UID to include. Defaults to None, which has
+                no limit.
+
+        Yields:
+            A tuple of each email's UID and a memoryview of its source.
+
+        """
+
+        for uid in self.uids(folder, uidvalidity, start, stop):
+            yield uid, self.get(folder, uidvalidity, uid)
+
+
+    def parse(self, folder, uidvalidity, uid, attachment_dir):
+        """Parse a stored email again, as scrape() would have.
+
+        Args:
+            folder (str): The folder the email is in.
+            uidvalidity (int): The UIDVALIDITY of the email's folder.
+            uid (int): The UID of the email.
+            attachment_dir (str): The folder to save the email's attachments
+                to.
+
+        Returns:
+            A tuple of the dict key for the email and its value dictionary.
+
+        """
+
+        raw = self.get(folder, uidvalidity, uid)
+        if raw is None:
+            raise ValueError("email {} of {} with UIDVALIDITY {} is not "
+                    "stored".format(uid, folder, uidvalidity))
+        return parse_message(uid, bytes(raw), attachment_dir)
+
+
+    def segment_path(self, segment):
+        """Get the file path of a segment.
+
+        Args:
+            segment (int): The segment number.
+
+        Returns:
+            The file path.
+
+        """
+
+        return os.path.join(self.directory, "{}-{:06d}.eml".format(self.prefix,
+                segment))
+
+
+    def flush(self):
+        """Flush the current segment, then the index, syncing them if fsync is set.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            # The segment goes first, so the index never points past it
+            for file in (self.__file, self.__index_file):
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+
+
+    def rotate(self):
+        """Close the current segment, and start a new one.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.flush()
+            self.__file.close()
+            self.__segment += 1
+            self.__file = open(self.segment_path(self.__segment), "ab")
+            self.__size = 0
+
+
+    def close(self):
+        """Flush and close the store, and unmap its segments.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.flush()
+            self.__file.close()
+            self.__index_file.close()
+            self.__stale = [mapped for mapped in
+                    self.__stale + list(self.__maps.values())
+                    if not release(mapped)]
+            self.__maps = {}
+
+
+    def __add(self, folder, uidvalidity, uid, segment, offset, length,
+            message_id):
+        """Helper function, adds an email's location to the in-memory indexes.
+
+        Args:
+            folder (str): The folder the email is in.
+            uidvalidity (int): The UIDVALIDITY of the email's folder.
+            uid (int): The UID of the email.
+            segment (int): The segment number the email is in.
+            offset (int): The email's offset in the segment.
+            length (int): The email's length.
+            message_id (str): The email's Message-ID, or an empty string.
+
+        Returns:
+            None
+
+        """
+
+        self.__index[(folder, uidvalidity, uid)] = (segment, offset, length)
+        if message_id:
+            self.__message_ids[message_id] = (folder, uidvalidity, uid)
+
+
+    def __view(self, segment, offset, length):
+        """Helper function, slices an email out of its mapped segment.
+
+        Args:
+            segment (int): The segment number the email is in.
+            offset (int): The email's offset in the segment.
+            length (int): The email's length.
+
+        Returns:
+            A memoryview of the email's source.
+
+        """
+
+        if length == 0:
+            return memoryview(b"")
+        mapped = self.__maps.get(segment)
+        if mapped is None or len(mapped) < offset + length:
+            # Map the segment, or map it again now that it has grown
+            if segment == self.__segment:
+                self.__file.flush()
+            with open(self.segment_path(segment), "rb") as file:
+                remapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            # Unmap the old map, or keep it until its memoryviews are released
+            self.__stale = [old for old in self.__stale if not release(old)]
+            if mapped is not None and not release(mapped):
+                self.__stale.append(mapped)
+            mapped = self.__maps[segment] = remapped
+        return memoryview(mapped)[offset:offset + length]
+
+
+    def __load(self):
+        """Helper function, loads the index, and recovers from a crash.
+
+        A partly written last index record is discarded, as is any source
+        written to the last segment after its last indexed email.
+
+        Args:
+            None
+
+        Returns:
+            The number of the segment to append to.
+
+        """
+
+        pattern = re.compile(re.escape(self.prefix) + r"-(\d+)\.eml$")
+        segments = sorted(int(match.group(1)) for match in
+                (pattern.match(name) for name in os.listdir(self.directory)) if match)
+        last = segments[-1] if segments else 0
+
+        indexed_end = 0
+        if os.path.exists(self.__index_path):
+            with open(self.__index_path, "rb+") as file:
+                data = file.read()
+                end = 0
+                while end + RECORD.size <= len(data):
+                    (uidvalidity, uid, segment, offset, length, folder_length,
+                            id_length) = RECORD.unpack_from(data, end)
+                    start = end + RECORD.size
+                    id_start = start + folder_length
+                    if id_start + id_length > len(data):
+                        break
+                    self.__add(data[start:id_start].decode("utf-8"), uidvalidity,
+                            uid, segment, offset, length,
+                            data[id_start:id_start + id_length].decode("utf-8",
+                            "replace"))
+                    if segment == last:
+                        indexed_end = max(indexed_end, offset + length)
+                    end = id_start + id_length
+                if end != len(data):
+                    file.truncate(end)
+
+        path = self.segment_path(last)
+        if os.path.exists(path) and os.path.getsize(path) > indexed_end:
+            with open(path, "rb+") as file:
+                file.truncate(indexed_end)
+        return last
+
+
+def release(mapped):
+    """Close a mapped segment, unless a memoryview of it is still in use.
+
+    Args:
+        mapped (mmap): The mapped segment.
+
+    Returns:
+        True if it was closed, or False if it is still in use.
+
+    """
+
+    try:
+        mapped.close()
+    except BufferError:
+        return False
+    return True
+
+
+def message_id_of(raw):
+    """Get the Message-ID of an email from its headers.
+
+    Args:
+        raw (bytes): The RFC822 source of the email.
+
+    Returns:
+        The Message-ID, or an empty string if it has none.
+
+    """
+
+    # Only the headers are parsed
+    end = raw.find(b"\r\n\r\n")
+    if end == -1:
+        end = raw.find(b"\n\n")
+    headers = email.parser.BytesHeaderParser().parsebytes(
+            raw if end == -1 else raw[:end])
+    return str(headers.get("Message-ID", "")).strip()
@@ -0,0 +1,186 @@
+"""replay: Feed emails from mbox files, Maildir directories and .eml files through the parser.
+
+The emails are parsed by the same code as scrape(), so each one produces the
+same dictionary it would have if it had been scraped from a folder. Since no
+server is involved, each email's position in the source, starting at 1, is
+used as its UID.
+
+Example:
+
+    # Parse an mbox file in batches of 100 over 4 processes, without an
+    # EmailListener
+    for msg_dict in replay_batches("./archive.mbox", "./files/", workers=4):
+        print(len(msg_dict))
+
+    # Or run a listener's process function over a Maildir directory
+    listener = EmailListener("example@email.com", None, "Inbox", "./files/")
+    listener.replay("./Maildir/", process_func=write_json_file, workers=4)
+
+"""
+
+# Imports from other packages
+from collections import deque
+import mailbox
+import os
+# Imports from this package
+from .parsing import parse_message
+
+
+def read_source(path):
+    """Read the raw emails of a source, in order.
+
+    Args:
+        path (str): An mbox file, a Maildir directory (holding cur, new and
+            tmp directories), a directory of .eml files, or a single .eml file.
+
+    Returns:
+        A generator of the RFC822 source of each email, as bytes.
+
+    """
+
+    if os.path.isdir(path):
+        if all(os.path.isdir(os.path.join(path, sub)) for sub in ("cur", "new", "tmp")):
+            return read_maildir(path)
+        return read_eml_dir(path)
+    if path.lower().endswith(".eml"):
+        return read_eml_dir(os.path.dirname(path) or ".", [os.path.basename(path)])
+    return read_mbox(path)
+
+
+def read_mbox(path):
+    """Read the raw emails of an mbox file, in order.
+
+    Args:
+        path (str): The mbox file.
+
+    Returns:
+        A generator of the RFC822 source of each email, without its From_ line.
+
+    """
+
+    box = mailbox.mbox(path, create=False)
+    try:
+        for key in box.iterkeys():
+            yield box.get_bytes(key)
+    finally:
+        box.close()
+
+
+def read_maildir(path):
+    """Read the raw emails of a Maildir directory, ordered by file name.
+
+    Maildir file names start with their delivery time, so this is roughly
+    the order the emails were delivered in.
+
+    Args:
+        path (str): The Maildir directory.
+
+    Returns:
+        A generator of the RFC822 source of each email.
+
+    """
+
+    box = mailbox.Maildir(path, factory=None, create=False)
+    for key in sorted(box.keys()):
+        try:
+            yield box.get_bytes(key)
+        except KeyError:
+            # Removed since the directory was listed
+            continue
+
+
+def read_eml_dir(path, file_names=None):
+    """Read the raw emails of a directory of .eml files, ordered by file name.
+
+    Args:
+        path (str): The directory.
+        file_names (list): The file names to read. Defaults to None, which
+            reads every file ending in .eml.
+
+    Returns:
+        A generator of the RFC822 source of each email.
+
+    """
+
+    if file_names is None:
+        file_names = sorted(name for name in os.listdir(path)
+                if name.lower().endswith(".eml"))
+    for name in file_names:
+        with open(os.path.join(path, name), "rb") as file:
+            yield file.read()
+
+
+def parse_batch(batch, attachment_dir):
+    """Parse a batch of emails, as done by each replay worker.
+
+    Args:
+        batch (list): A list of (UID, RFC822 source) tuples.
+        attachment_dir (str): The file path to the folder to save attachments
+            to.
+
+    Returns:
+        A list of (key, val_dict) tuples, in the same order as the batch.
+
+    """
+
+    return [parse_message(uid, raw, attachment_dir) for uid, raw in batch]
+
+
+def replay_batches(source, attachment_dir, workers=1, batch_size=100):
+    """Parse the emails of a source in batches, in order.
+
+    Only a few batches per worker are read ahead, so sources of any size can
+    be replayed without holding them in memory.
+
+    Args:
+        source (str): The path of the source, as accepted by read_source().
+        attachment_dir (str): The file path to the folder to save attachments
+            to.
+        workers (int): The number of processes to parse in. Defaults to 1,
+            which parses in this process.
+        batch_size (int): The number of emails per batch. Defaults to 100.
+
+    Returns:
+        A generator of dictionaries of the parsed emails of each batch, in the
+        same format as scrape().
+
+    """
+
+    batches = __batch(read_source(source), batch_size)
+    if workers <= 1:
+        for batch in batches:
+            yield dict(parse_batch(batch, attachment_dir))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(parse_batch, batch, attachment_dir))
+            # Keep the workers busy, without reading the whole source ahead
+            if len(pending) >= workers * 2:
+                yield dict(pending.popleft().result())
+        while pending:
+            yield dict(pending.popleft().result())
+
+
+def __batch(raws, batch_size):
+    """Helper function, numbers raw emails from 1 and groups them into batches.
+
+    Args:
+        raws (iterable): The RFC822 source of each email.
+        batch_size (int): The number of emails per batch.
+
+    Returns:
+        A generator of lists of (UID, RFC822 source) tuples.
+
+    """
+
+    batch = []
+    for uid, raw in enumerate(raws, 1):
+        batch.append((uid, raw))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,303 @@
+"""sqlite_sink: Write scraped emails into an SQLite database with a full-text index.
+
+Example:
+
+    # Use a sink as the process function. Each batch of emails is written in
+    # one transaction.
+    sink = SQLiteSink("./files/emails.db")
+    listener.listen(60, process_func=sink)
+
+    # Search the subjects and bodies of the emails
+    for folder, key, subject in sink.search("invoice OR receipt"):
+        print(folder, key, subject)
+
+    # Read an email back by its key and folder
+    msg = sink.get("12_somebody@gmail.com", "Inbox")
+    sink.close()
+
+    # Or use the sink kept for the listener's attachment_dir, which can be
+    # named on the command line as email_listener.sqlite_sink:write_sqlite_file
+    listener.listen(60, process_func=write_sqlite_file)
+
+"""
+
+# Imports from other packages
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# The sinks used by write_sqlite_file(), keyed by database path
+_sinks = {}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    folder TEXT NOT NULL,
+    key TEXT NOT NULL,
+    subject TEXT,
+    plain_text TEXT,
+    plain_html TEXT,
+    html TEXT,
+    internal_date TEXT,
+    attachments TEXT,
+    updated_at REAL,
+    PRIMARY KEY (folder, key)
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+    subject, plain_text, plain_html, content='emails', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS emails_fts_insert AFTER INSERT ON emails BEGIN
+    INSERT INTO emails_fts(rowid, subject, plain_text, plain_html)
+    VALUES (new.rowid, new.subject, new.plain_text, new.plain_html);
+END;
+CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN
+    INSERT INTO emails_fts(emails_fts, rowid, subject, plain_text, plain_html)
+    VALUES ('delete', old.rowid, old.subject, old.plain_text, old.plain_html);
+END;
+CREATE TRIGGER IF NOT EXISTS emails_fts_update AFTER UPDATE ON emails BEGIN
+    INSERT INTO emails_fts(emails_fts, rowid, subject, plain_text, plain_html)
+    VALUES ('delete', old.rowid, old.subject, old.plain_text, old.plain_html);
+    INSERT INTO emails_fts(rowid, subject, plain_text, plain_html)
+    VALUES (new.rowid, new.subject, new.plain_text, new.plain_html);
+END;
+"""
+
+INSERT = """
+INSERT INTO emails (folder, key, subject, plain_text, plain_html, html,
+    internal_date, attachments, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT = INSERT.rstrip() + """
+ON CONFLICT(folder, key) DO UPDATE SET
+    subject = excluded.subject,
+    plain_text = excluded.plain_text,
+    plain_html = excluded.plain_html,
+    html = excluded.html,
+    internal_date = excluded.internal_date,
+    attachments = excluded.attachments,
+    updated_at = excluded.updated_at
+"""
+
+DELETE = "DELETE FROM emails WHERE folder = ? AND key = ?"
+
+# UPSERT was added in SQLite 3.24.0
+HAS_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+
+class SQLiteSink:
+    """SQLiteSink object for writing emails into an SQLite database.
+
+    Each email is a row of the emails table, keyed by its folder and key, as
+    keys are only unique within a folder. There is a column for each field of
+    its value dictionary, and the attachments are stored as a JSON list.
+    Writing an email with a folder and key already in the table replaces it.
+    The database uses write-ahead logging, so it can be searched while
+    emails are being written.
+
+    Attributes:
+        path (str): The file path of the database.
+        fts (bool): Whether the Subject, Plain_Text and Plain_HTML fields are
+            indexed for full-text search. False if the SQLite library wasn't
+            built with FTS5.
+
+    """
+
+    def __init__(self, path, fts=True):
+        """Initialize an SQLiteSink instance, creating the database if needed.
+
+        Args:
+            path (str): The file path of the database.
+            fts (bool): Whether to keep a full-text index. Defaults to True.
+
+        Returns:
+            None
+
+        """
+
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        # Each transaction is still atomic, but only the WAL checkpoints wait
+        # on fsync
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        with self.__conn:
+            self.__conn.executescript(SCHEMA)
+        self.fts = False
+        if fts:
+            try:
+                with self.__conn:
+                    self.__conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite was built without FTS5
+                pass
+
+
+    def __call__(self, email_listener, msg_dict):
+        """Write a batch of scraped emails, so the sink can be a process function.
+
+        Args:
+            email_listener (EmailListener): The EmailListener object this
+                function is used with.
+            msg_dict (dict): The dictionary of email message data returned by
+                the scraping function.
+
+        Returns:
+            A list of the keys written.
+
+        """
+
+        return self.write(msg_dict, getattr(email_listener, "folder", None))
+
+
+    def write(self, msg_dict, folder=None):
+        """Write a batch of emails in one transaction, replacing any with the same keys.
+
+        Args:
+            msg_dict (dict): The emails, keyed by key, as returned by scrape().
+            folder (str): The folder the emails came from. Defaults to None,
+                which is stored as an empty string.
+
+        Returns:
+            A list of the keys written.
+
+        """
+
+        now = time.time()
+        folder = folder or ""
+        rows = [(folder, key, val_dict.get("Subject"), val_dict.get("Plain_Text"),
+                val_dict.get("Plain_HTML"), val_dict.get("HTML"),
+                val_dict.get("Internal_Date"),
+                json.dumps(val_dict["attachments"]) if "attachments" in val_dict
+                        else None,
+                now) for key, val_dict in msg_dict.items()]
+        with self.__lock, self.__conn:
+            if HAS_UPSERT:
+                self.__conn.executemany(UPSERT, rows)
+            else:
+                # INSERT OR REPLACE wouldn't fire the full-text index's delete
+                # trigger, so the old rows are deleted first
+                self.__conn.executemany(DELETE, [(folder, key) for key in msg_dict])
+                self.__conn.executemany(INSERT, rows)
+        return list(msg_dict)
+
+
+    def get(self, key, folder=None):
+        """Read an email back by its key.
+
+        Args:
+            key (str): The email's key.
+            folder (str): The folder the email came from. Defaults to None,
+                which reads the email most recently written with the key, from
+                any folder.
+
+        Returns:
+            The email's value dictionary, in the format scrape() returns, with
+            its folder added as "Folder", or None if there is no such email.
+
+        """
+
+        query = ("SELECT folder, subject, plain_text, plain_html, html, "
+                "internal_date, attachments FROM emails WHERE key = ?")
+        if folder is None:
+            query = query + " ORDER BY updated_at DESC, rowid DESC LIMIT 1"
+            args = (key,)
+        else:
+            query, args = query + " AND folder = ?", (key, folder)
+        with self.__lock:
+            row = self.__conn.execute(query, args).fetchone()
+        if row is None:
+            return None
+        val_dict = {"Folder": row[0] or None, "Subject": row[1]}
+        for name, value in zip(("Plain_Text", "Plain_HTML", "HTML", "Internal_Date"),
+                row[2:6]):
+            if value is not None:
+                val_dict[name] = value
+        if row[6] is not None:
+            val_dict["attachments"] = json.loads(row[6])
+        return val_dict
+
+
+    def search(self, query, limit=20):
+        """Search the full-text index of the emails.
+
+        Args:
+            query (str): An FTS5 query, such as "invoice OR receipt" or
+                "subject:meeting".
+            limit (int): The most results to return. Defaults to 20.
+
+        Returns:
+            A list of (folder, key, subject) tuples, best match first. The
+            folder is None for emails written without one.
+
+        """
+
+        if not self.fts:
+            raise ValueError("the database has no full-text index")
+        with self.__lock:
+            rows = self.__conn.execute("SELECT emails.folder, emails.key, "
+                    "emails.subject FROM emails_fts "
+                    "JOIN emails ON emails.rowid = emails_fts.rowid "
+                    "WHERE emails_fts MATCH ? ORDER BY bm25(emails_fts) LIMIT ?",
+                    (query, limit)).fetchall()
+        return [(folder or None, key, subject) for folder, key, subject in rows]
+
+
+    def count(self):
+        """Get the number of emails in the database.
+
+        Args:
+            None
+
+        Returns:
+            The number of emails.
+
+        """
+
+        with self.__lock:
+            return self.__conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+
+
+    def close(self):
+        """Close the database.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        with self.__lock:
+            self.__conn.close()
+
+
+def write_sqlite_file(email_listener, msg_dict):
+    """Write the email message data returned from scrape into an SQLite database.
+
+    An SQLiteSink is kept for the emails.db database in each attachment_dir.
+
+    Args:
+        email_listener (EmailListener): The EmailListener object this function
+            is used with.
+        msg_dict (dict): The dictionary of email message data returned by the
+            scraping function.
+
+    Returns:
+        A list of the keys written.
+
+    """
+
+    path = os.path.join(email_listener.attachment_dir, "emails.db")
+    sink = _sinks.get(path)
+    if sink is None:
+        sink = _sinks[path] = SQLiteSink(path)
+    return sink(email_listener, msg_dict)
@@ -0,0 +1,673 @@
+"""supervisor: Run listeners for several accounts and folders in worker processes.
+
+The supervisor reads a JSON config, forks worker processes, and gives each
+worker a share of the listeners. Each listener in a worker runs in its own
+thread. Workers that crash are restarted, and the transfer and processing
+counters and listener metrics of every worker are added up into one metrics
+file. Set "cpu_affinity" to pin each worker to one of the host's cores.
+
+Example config:
+
+    {
+        "workers": 4,
+        "attachment_dir": "/var/lib/email_listener/attachments",
+        "journal_dir": "/var/lib/email_listener/journals",
+        "metrics_path": "/var/lib/email_listener/metrics.json",
+        "cpu_affinity": false,
+        "listeners": [
+            {"email": "example@gmail.com", "app_password_env": "EL_APW",
+             "folder": "Inbox", "options": {"move": "email_listener"}},
+            {"email": "example@gmail.com", "app_password_env": "EL_APW",
+             "folder": "Support", "process_func": "mypackage.replies:send_reply"}
+        ]
+    }
+
+Example:
+
+    # Run the supervisor until it is sent SIGTERM or SIGINT
+    supervisor = Supervisor(load_config("./email_listener.json"))
+    supervisor.run()
+
+    # Or, from the shell
+    $ python -m email_listener.supervisor ./email_listener.json
+
+"""
+
+# Imports from other packages
+import argparse
+import importlib
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import time
+# Imports from this package
+from .listener import EmailListener
+from .helpers import calc_backoff
+from .journal import CheckpointJournal
+from .metrics import Histogram, ListenerMetrics
+
+
+logger = logging.getLogger(__name__)
+
+# Listener settings copied straight from the config to EmailListener.login()
+LOGIN_KEYS = ("host", "port", "use_ssl", "compress")
+
+# The open lock files of the journals locked by this process
+_journal_locks = []
+
+
+def load_config(path):
+    """Load and check a supervisor config file.
+
+    Args:
+        path (str): The file path of the JSON config.
+
+    Returns:
+        The config dictionary, with defaults filled in.
+
+    """
+
+    with open(path, "r") as file:
+        config = json.load(file)
+    return check_config(config)
+
+
+def check_config(config):
+    """Check a supervisor config, and fill in its defaults.
+
+    Args:
+        config (dict): The config, in the format shown in the module docstring.
+
+    Returns:
+        The config dictionary, with defaults filled in.
+
+    """
+
+    listeners = config.get("listeners")
+    if not listeners:
+        raise ValueError("config must list at least one listener")
+    if not config.get("attachment_dir"):
+        raise ValueError("config must set attachment_dir")
+
+    names = set()
+    for spec in listeners:
+        for key in ("email", "folder"):
+            if not spec.get(key):
+                raise ValueError("every listener must set {}".format(key))
+        if not spec.get("app_password") and not spec.get("app_password_env"):
+            raise ValueError("every listener must set app_password or app_password_env")
+        # Two listeners on one folder would share a journal and attachments
+        name = listener_name(spec)
+        if name in names:
+            raise ValueError("listener {} is configured twice".format(name))
+        names.add(name)
+
+    config.setdefault("workers", min(os.cpu_count() or 1, len(listeners)))
+    config["workers"] = max(1, min(int(config["workers"]), len(listeners)))
+    config.setdefault("journal_dir", None)
+    config.setdefault("metrics_path", None)
+    config.setdefault("metrics_interval", 10)
+    config.setdefault("cpu_affinity", False)
+    return config
+
+
+def listener_name(spec):
+    """Get the name of a listener, which is safe to use in file names.
+
+    Args:
+        spec (dict): The listener's config.
+
+    Returns:
+        A string combining the listener's email and folder.
+
+    """
+
+    return re.sub(r"[^A-Za-z0-9@._-]", "_",
+            "{}_{}".format(spec["email"], spec["folder"]))
+
+
+def listener_paths(config, spec):
+    """Get where a listener keeps its attachments and journal.
+
+    Every listener gets its own attachment directory and journal, so workers
+    never write to the same files.
+
+    Args:
+        config (dict): The supervisor config.
+        spec (dict): The listener's config.
+
+    Returns:
+        A tuple of the attachment directory, and the journal file path or None
+        if journaling isn't configured.
+
+    """
+
+    name = listener_name(spec)
+    attachment_dir = os.path.join(config["attachment_dir"], name)
+    journal_path = None
+    if config["journal_dir"]:
+        journal_path = os.path.join(config["journal_dir"], name + ".journal")
+    return attachment_dir, journal_path
+
+
+def listener_counters(metrics):
+    """Flatten the metrics of a listener into counters that can be added up.
+
+    Counters and gauges keep their names. Histograms give their sum and count,
+    as name_sum and name_count, but not their buckets.
+
+    Args:
+        metrics (ListenerMetrics): The listener's metrics.
+
+    Returns:
+        A dictionary of the counters.
+
+    """
+
+    counters = {}
+    for name, metric in vars(metrics).items():
+        if isinstance(metric, Histogram):
+            counters[name + "_sum"] = metric.sum
+            counters[name + "_count"] = metric.count
+        elif hasattr(metric, "value"):
+            counters[name] = metric.value
+    return counters
+
+
+def merge_metrics(worker_metrics):
+    """Add up the metrics written by each worker.
+
+    Args:
+        worker_metrics (list): The metrics dictionaries of each worker, each
+            holding a dictionary of counters per listener name, including
+            those from listener_counters().
+
+    Returns:
+        A dictionary with the counters of each listener, and their totals.
+        Ratios are worked out again from the totals.
+
+    """
+
+    listeners = {}
+    for metrics in worker_metrics:
+        listeners.update(metrics.get("listeners", {}))
+
+    total = {}
+    for counters in listeners.values():
+        for key, value in counters.items():
+            if key.endswith("_ratio"):
+                continue
+            total[key] = total.get(key, 0) + value
+    for ratio, size, wire in (("receive_ratio", "bytes_received", "wire_bytes_received"),
+            ("send_ratio", "bytes_sent", "wire_bytes_sent")):
+        if total.get(wire):
+            total[ratio] = total[size] / total[wire]
+    return {"listeners": listeners, "total": total}
+
+
+class Supervisor:
+    """Supervisor object for running listeners in forked worker processes.
+
+    Attributes:
+        config (dict): The supervisor config, as returned by check_config().
+        workers (dict): The process ID of each running worker, keyed by the
+            worker's index.
+        restarts (int): The number of times a worker has been restarted.
+        metrics_dir (str): The directory each worker writes its metrics to.
+        poll_interval (float): The number of seconds between checks on the
+            workers.
+        stable_time (float): The number of seconds a worker must run for
+            before its restart backoff is reset.
+
+    """
+
+    poll_interval = 0.5
+    stable_time = 60
+
+    def __init__(self, config):
+        """Initialize a Supervisor instance, creating the shared directories.
+
+        Args:
+            config (dict): The supervisor config.
+
+        Returns:
+            None
+
+        """
+
+        self.config = check_config(config)
+        self.workers = {}
+        self.restarts = 0
+        self.__stopping = False
+        self.__crashes = {}
+        self.__started = {}
+
+        # Create every directory before forking, so workers don't race to
+        for spec in self.config["listeners"]:
+            attachment_dir, journal_path = listener_paths(self.config, spec)
+            os.makedirs(attachment_dir, exist_ok=True)
+            if journal_path is not None:
+                os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        metrics_path = self.config["metrics_path"]
+        if metrics_path:
+            self.metrics_dir = metrics_path + ".d"
+        else:
+            self.metrics_dir = os.path.join(self.config["attachment_dir"], ".metrics")
+        os.makedirs(self.metrics_dir, exist_ok=True)
+
+
+    def share(self, index):
+        """Get the listeners a worker runs.
+
+        Args:
+            index (int): The worker's index.
+
+        Returns:
+            A list of the listener configs for the worker.
+
+        """
+
+        return self.config["listeners"][index::self.config["workers"]]
+
+
+    def run(self):
+        """Start the workers, and restart any that exit until told to stop.
+
+        SIGTERM and SIGINT stop the supervisor, which sends SIGTERM to every
+        worker and waits for them to exit.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        previous = {sig: signal.signal(sig, self.__on_signal)
+                for sig in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for index in range(self.config["workers"]):
+                self.__spawn(index)
+
+            restart_at = {}
+            last_metrics = 0
+            while not self.__stopping:
+                # Find any worker that has exited, and schedule its restart
+                for index in self.__reap():
+                    if time.monotonic() - self.__started[index] >= self.stable_time:
+                        self.__crashes[index] = 0
+                    crashes = self.__crashes.get(index, 0) + 1
+                    self.__crashes[index] = crashes
+                    restart_at[index] = time.monotonic() + calc_backoff(crashes)
+                for index, when in list(restart_at.items()):
+                    if time.monotonic() >= when and not self.__stopping:
+                        del restart_at[index]
+                        self.restarts += 1
+                        self.__spawn(index)
+
+                if time.monotonic() - last_metrics >= self.config["metrics_interval"]:
+                    last_metrics = time.monotonic()
+                    self.write_metrics()
+                time.sleep(self.poll_interval)
+        finally:
+            self.stop()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            self.write_metrics()
+
+
+    def stop(self):
+        """Send SIGTERM to every worker, and wait for them to exit.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        self.__stopping = True
+        for pid in self.workers.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.workers.values():
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.workers = {}
+
+
+    def metrics(self):
+        """Add up the latest metrics written by every worker.
+
+        Args:
+            None
+
+        Returns:
+            The dictionary returned by merge_metrics(), along with the number
+            of workers and restarts.
+
+        """
+
+        worker_metrics = []
+        for file_name in sorted(os.listdir(self.metrics_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, file_name), "r") as file:
+                    worker_metrics.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        metrics = merge_metrics(worker_metrics)
+        metrics["workers"] = len(self.workers)
+        metrics["restarts"] = self.restarts
+        return metrics
+
+
+    def write_metrics(self):
+        """Write the added up metrics to the configured metrics path, if any.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        if self.config["metrics_path"]:
+            write_json_atomic(self.config["metrics_path"], self.metrics())
+
+
+    def __spawn(self, index):
+        """Helper function, forks a worker process.
+
+        Args:
+            index (int): The worker's index.
+
+        Returns:
+            None
+
+        """
+
+        pid = os.fork()
+        if pid == 0:
+            # Child: run the worker, and never return into the supervisor
+            code = 1
+            try:
+                for sig in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(sig, signal.SIG_DFL)
+                code = Worker(self.config, index, self.share(index),
+                        self.metrics_dir).run()
+            finally:
+                os._exit(code)
+        self.workers[index] = pid
+        self.__started[index] = time.monotonic()
+        logger.info("Started worker %s (pid %s).", index, pid)
+
+
+    def __reap(self):
+        """Helper function, collects the workers that have exited.
+
+        Args:
+            None
+
+        Returns:
+            A list of the indexes of the workers that exited.
+
+        """
+
+        exited = []
+        for index, pid in list(self.workers.items()):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if done:
+                del self.workers[index]
+                exited.append(index)
+                logger.warning("Worker %s (pid %s) exited with status %s.",
+                        index, pid, status)
+        return exited
+
+
+    def __on_signal(self, signum, frame):
+        """Helper function, stops the supervisor's loop on SIGTERM or SIGINT."""
+
+        self.__stopping = True
+
+
+class Worker:
+    """Worker object for running a share of the listeners in threads.
+
+    Attributes:
+        config (dict): The supervisor config.
+        index (int): The worker's index.
+        listeners (list): The listener configs this worker runs.
+        metrics_path (str): The file the worker writes its metrics to.
+
+    """
+
+    def __init__(self, config, index, listeners, metrics_dir):
+        """Initialize a Worker instance.
+
+        Args:
+            config (dict): The supervisor config.
+            index (int): The worker's index.
+            listeners (list): The listener configs this worker runs.
+            metrics_dir (str): The directory to write the worker's metrics to.
+
+        Returns:
+            None
+
+        """
+
+        self.config = config
+        self.index = index
+        self.listeners = listeners
+        self.metrics_path = os.path.join(metrics_dir, "worker-{}.json".format(index))
+        self.__running = []
+        self.__failed = threading.Event()
+
+
+    def run(self):
+        """Run every listener of the worker until one of them fails.
+
+        Args:
+            None
+
+        Returns:
+            The exit code for the worker process, which is always non-zero, so
+            the supervisor restarts the worker.
+
+        """
+
+        # Spread the workers over the host's cores, if asked to and supported
+        if (self.config["cpu_affinity"] and hasattr(os, "sched_setaffinity")
+                and hasattr(os, "sched_getaffinity")):
+            cores = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, {cores[self.index % len(cores)]})
+
+        for spec in self.listeners:
+            thread = threading.Thread(target=self.__run_listener, args=(spec,),
+                    daemon=True)
+            thread.start()
+
+        while not self.__failed.wait(self.config["metrics_interval"]):
+            self.write_metrics()
+        self.write_metrics()
+        return 1
+
+
+    def write_metrics(self):
+        """Write the counters of each of the worker's listeners to its metrics file.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+
+        listeners = {}
+        for name, listener, processed in list(self.__running):
+            counters = listener.transfer_stats.as_dict()
+            counters["emails_processed"] = processed[0]
+            counters.update(listener_counters(listener.metrics))
+            listeners[name] = counters
+        write_json_atomic(self.metrics_path, {"worker": self.index,
+                "pid": os.getpid(), "listeners": listeners})
+
+
+    def __run_listener(self, spec):
+        """Helper function, logs in a listener and keeps it listening.
+
+        Args:
+            spec (dict): The listener's config.
+
+        Returns:
+            None
+
+        """
+
+        try:
+            self.__listen(spec)
+        except BaseException as err:
+            logger.error("Listener %s failed: %r", listener_name(spec), err)
+        self.__failed.set()
+
+
+    def __listen(self, spec):
+        """Helper function, runs a listener until its connection can't be recovered.
+
+        Args:
+            spec (dict): The listener's config.
+
+        Returns:
+            None
+
+        """
+
+        attachment_dir, journal_path = listener_paths(self.config, spec)
+        password = spec.get("app_password") or os.environ[spec["app_password_env"]]
+        listener = EmailListener(spec["email"], password, spec["folder"],
+                attachment_dir)
+        listener.metrics = ListenerMetrics()
+        if journal_path is not None:
+            lock_journal(journal_path)
+            listener.journal = CheckpointJournal(journal_path)
+
+        # Count the emails processed, around the configured process function
+        process_func = load_process_func(spec.get("process_func"))
+        processed = [0]
+
+        def process(email_listener, msgs):
+            result = process_func(email_listener, msgs)
+            processed[0] += len(msgs)
+            return result
+
+        listener.login(**{key: spec[key] for key in LOGIN_KEYS if key in spec})
+        self.__running.append((listener_name(spec), listener, processed))
+        options = dict(spec.get("options") or {})
+        options.setdefault("reconnect", True)
+        # Listen in cycles, so the timeout never needs to be unbounded
+        while True:
+            listener.listen(spec.get("timeout", 60), process_func=process,
+                    **options)
+
+
+def load_process_func(path):
+    """Import a process function from a "module:function" path.
+
+    Args:
+        path (str): The path of the function, or None for the default
+            write_txt_file().
+
+    Returns:
+        The function.
+
+    """
+
+    if not path:
+        from .email_processing import write_txt_file
+        return write_txt_file
+    module_name, _, attr = path.partition(":")
+    if not attr:
+        raise ValueError("process_func must be formatted as module:function")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def lock_journal(journal_path):
+    """Take an exclusive lock on a journal, held until the process exits.
+
+    This keeps two processes from ever writing to the same journal, such as a
+    restarted worker and one that hasn't quite exited. The lock is a separate
+    file, since compacting the journal replaces it. Does nothing where fcntl
+    isn't available.
+
+    Args:
+        journal_path (str): The file path of the journal.
+
+    Returns:
+        None
+
+    """
+
+    try:
+        import fcntl
+    except ImportError:
+        return
+    lock_file = open(journal_path + ".lock", "a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    # Keep the file open, and so the lock held, for the life of the process
+    _journal_locks.append(lock_file)
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a file, replacing it atomically so readers never see half.
+
+    Args:
+        path (str): The file path to write.
+        data (dict): The data to write.
+
+    Returns:
+        None
+
+    """
+
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def main(argv=None):
+    """Run the supervisor from the command line.
+
+    Args:
+        argv (list): The command line arguments. Defaults to None, which uses
+            sys.argv.
+
+    Returns:
+        None
+
+    """
+
+    parser = argparse.ArgumentParser(description="Run email listeners in "
+            "supervised worker processes.")
+    parser.add_argument("config", help="the JSON config file")
+    args = parser.parse_args(argv)
+    Supervisor(load_config(args.config)).run()
+
+
+if __name__ == "__main__":
+    main()
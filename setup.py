@@ -12,7 +12,6 @@ setup(
     classifiers=[
         'Development Status :: 4 - Beta',
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: Communications :: Email',
@@ -22,11 +21,20 @@ setup(
     author_email='ndreikosen@gmail.com',
     license='GNU GPLv3',
     packages=['email_listener'],
+    python_requires='>=3.7',
+    entry_points={
+        'console_scripts': [
+            'email-listener=email_listener.cli:main',
+        ],
+    },
     install_requires=[
         'datetime',
         'html2text',
-        'imapclient',
+        'imapclient>=2.1,<5',
         'pytest',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     zip_safe=False)
 
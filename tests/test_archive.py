@@ -0,0 +1,176 @@
+"""Test suite for the archive module."""
+
+# Imports from other packages
+import gzip
+import os
+import pytest
+# Imports from this package
+from email_listener import EmailListener
+from email_listener.archive import ArchiveWriter, read_archive, write_archive_file
+
+
+def test_records(tmp_path):
+    """Test that parsed emails are read back from a gzip archive."""
+
+    path = str(tmp_path / "emails.jsonl.gz")
+    archive = ArchiveWriter(path)
+    msgs = {"1_a@email.com": {"Subject": "One"}, "2_b@email.com": {"Subject": "Two"}}
+    keys = archive.write_records(msgs, "Inbox")
+    archive.close()
+
+    assert ((keys == list(msgs))
+            and (list(read_archive(path)) == [
+                {"key": "1_a@email.com", "folder": "Inbox", "data": {"Subject": "One"}},
+                {"key": "2_b@email.com", "folder": "Inbox", "data": {"Subject": "Two"}}]))
+
+
+def test_raw(tmp_path):
+    """Test that raw source, including newlines, is read back whole."""
+
+    path = str(tmp_path / "raw.gz")
+    archive = ArchiveWriter(path)
+    raw = b"From: a@email.com\r\nSubject: One\r\n\r\nLine 1\r\n\nLine 2\r\n"
+    archive.write_raw("1_a@email.com", raw, uid=1)
+    archive.write_raw("2_b@email.com", b"", uid=2)
+    archive.close()
+    entries = list(read_archive(path))
+
+    assert ((len(entries) == 2) and (entries[0]["raw"] == raw)
+            and (entries[0]["uid"] == 1) and (entries[1]["raw"] == b""))
+
+
+def test_batches(tmp_path):
+    """Test that each batch is a gzip member, and a torn last batch ends the archive."""
+
+    path = str(tmp_path / "emails.jsonl.gz")
+    archive = ArchiveWriter(path)
+    archive.write_records({"1_a@email.com": {"Subject": "One"}})
+    archive.flush()
+    archive.close()
+    # Reopening appends another batch
+    archive = ArchiveWriter(path)
+    archive.write_records({"2_b@email.com": {"Subject": "Two"}})
+    archive.flush()
+    archive.close()
+    with gzip.open(path, "rb") as file:
+        lines = file.read().count(b"\n")
+    # A crash part way through a third batch
+    with open(path, "ab") as file:
+        file.write(gzip.compress(b'{"key":"3_c@email.com"}\n' * 100)[:40])
+
+    keys = [entry["key"] for entry in read_archive(path)]
+    # The whole entries of the torn batch are still read
+    assert ((lines == 2) and (keys[:2] == ["1_a@email.com", "2_b@email.com"])
+            and (set(keys[2:]) == {"3_c@email.com"}))
+
+
+@pytest.mark.parametrize("name", ["emails.jsonl.gz", "emails.jsonl.zst"])
+def test_torn_batch_reopened(tmp_path, name):
+    """Test that reopening an archive cuts off a torn batch, so later batches are read."""
+
+    if name.endswith(".zst"):
+        zstandard = pytest.importorskip("zstandard")
+        compress = zstandard.ZstdCompressor().compress
+    else:
+        compress = gzip.compress
+    path = str(tmp_path / name)
+    archive = ArchiveWriter(path)
+    archive.write_records({"1_a@email.com": {"Subject": "One"}})
+    archive.close()
+    # A crash part way through a second batch
+    with open(path, "ab") as file:
+        file.write(compress(b'{"key":"2_b@email.com"}\n' * 100)[:40])
+    archive = ArchiveWriter(path)
+    archive.write_records({"3_c@email.com": {"Subject": "Three"}})
+    archive.close()
+
+    assert [entry["key"] for entry in read_archive(path)] == ["1_a@email.com",
+            "3_c@email.com"]
+
+
+def test_reopen_from_flushed_end(tmp_path):
+    """Test that reopening an archive only checks what was written after its last flushed batch."""
+
+    path = str(tmp_path / "emails.jsonl.gz")
+    archive = ArchiveWriter(path)
+    archive.write_records({"1_a@email.com": {"Subject": "One"}})
+    archive.close()
+    with open(path + ".end") as file:
+        end = int(file.read())
+    # Damage the flushed batch, which a scan of the whole archive would stop at
+    with open(path, "rb+") as file:
+        file.seek(2)
+        file.write(b"\x00")
+    archive = ArchiveWriter(path)
+    archive.close()
+
+    assert (end == os.path.getsize(path)) and (end > 0)
+
+
+def test_reopen_replaced(tmp_path):
+    """Test that a torn batch is still cut off an archive replaced since its end was recorded."""
+
+    path = str(tmp_path / "emails.jsonl.gz")
+    archive = ArchiveWriter(path)
+    archive.write_records({"1_a@email.com": {"Subject": "One"}})
+    archive.flush()
+    archive.write_records({"2_b@email.com": {"Subject": "Two"}})
+    archive.close()
+    # Replaced by an archive of one batch, and a torn second batch
+    with open(path, "wb") as file:
+        file.write(gzip.compress(b'{"key":"3_c@email.com"}\n'))
+        file.write(gzip.compress(b'{"key":"4_d@email.com"}\n' * 100)[:40])
+    archive = ArchiveWriter(path)
+    archive.write_records({"5_e@email.com": {"Subject": "Five"}})
+    archive.close()
+
+    assert [entry["key"] for entry in read_archive(path)] == ["3_c@email.com",
+            "5_e@email.com"]
+
+
+@pytest.mark.parametrize("codec, name", [("gzip", "emails.jsonl.gz"),
+        ("zstd", "emails.jsonl.zst")])
+def test_write_archive_file(tmp_path, codec, name):
+    """Test that write_archive_file() writes the archive of the codec it is given."""
+
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    listener = EmailListener("example@email.com", "badpassword", "email_listener",
+            str(tmp_path))
+    keys = write_archive_file(listener, {"1_a@email.com": {"Subject": "One"}},
+            codec=codec)
+
+    assert ((keys == ["1_a@email.com"])
+            and ([entry["key"] for entry in read_archive(str(tmp_path / name))]
+                == ["1_a@email.com"]))
+
+
+def test_write_archive_file_bad_codec(tmp_path):
+    """Test that write_archive_file() rejects an unknown codec."""
+
+    listener = EmailListener("example@email.com", "badpassword", "email_listener",
+            str(tmp_path))
+    with pytest.raises(ValueError):
+        write_archive_file(listener, {}, codec="lzma")
+
+
+def test_damaged_batch(tmp_path):
+    """Test that a damaged batch in the middle of an archive ends it, without raising."""
+
+    path = str(tmp_path / "emails.jsonl.gz")
+    damaged = bytearray(gzip.compress(b'{"key":"2_b@email.com"}\n'))
+    # An unknown compression method in the member header
+    damaged[2] = 0
+    with open(path, "wb") as file:
+        file.write(gzip.compress(b'{"key":"1_a@email.com"}\n'))
+        file.write(damaged)
+        file.write(gzip.compress(b'{"key":"3_c@email.com"}\n'))
+
+    assert [entry["key"] for entry in read_archive(path)] == ["1_a@email.com"]
+
+
+def test_bad_extension(tmp_path):
+    """Test that an archive path without a known extension is rejected."""
+
+    with pytest.raises(ValueError):
+        ArchiveWriter(str(tmp_path / "emails.jsonl"))
@@ -0,0 +1,25 @@
+"""Test suite for the claims module."""
+
+# Imports from this package
+from email_listener.claims import claim_keyword, claim_time, parse_modified
+
+
+def test_claim_keyword():
+    """Test that a claim keyword holds the time of the claim."""
+
+    keyword = claim_keyword(1700000000.5)
+    assert (keyword == "ELClaim_1700000000") and (claim_time(keyword) == 1700000000)
+
+
+def test_claim_time_other_flags():
+    """Test that flags which aren't claims have no claim time."""
+
+    assert ((claim_time(b"\\Seen") is None) and (claim_time("ELClaim_soon") is None)
+            and (claim_time(b"ELClaim_5") == 5))
+
+
+def test_parse_modified():
+    """Test that the UIDs of a MODIFIED response code are read, including ranges."""
+
+    assert ((parse_modified(b"[MODIFIED 7,9:11] Conditional STORE failed")
+            == {7, 9, 10, 11}) and (parse_modified(b"STORE completed") == set()))
@@ -0,0 +1,49 @@
+"""Test suite for the cli module."""
+
+# Imports from other packages
+import json
+import subprocess
+import sys
+# Imports from this package
+from email_listener.cli import build_parser, main
+
+
+def test_parser_defaults():
+    """Test that option defaults, such as from a config file, are overridden by arguments."""
+
+    parser = build_parser({"email": "example@gmail.com", "folder": "Support",
+            "use_ssl": False})
+    args = parser.parse_args(["listen", "5", "--folder", "Inbox", "--move", "done"])
+
+    assert ((args.email == "example@gmail.com") and (args.folder == "Inbox")
+            and (args.use_ssl is False) and (args.timeout == 5)
+            and (args.move == "done"))
+
+
+def test_main_config_file(tmp_path, monkeypatch):
+    """Test that main() reads the config file, and needs an app password."""
+
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"email": "example@gmail.com",
+            "app_password_env": "EL_TEST_MISSING_PASSWORD"}))
+    monkeypatch.delenv("EL_TEST_MISSING_PASSWORD", raising=False)
+
+    try:
+        main(["--config", str(config), "scrape"])
+        message = None
+    except SystemExit as err:
+        message = str(err)
+
+    assert "EL_TEST_MISSING_PASSWORD" in message
+
+
+def test_lazy_imports():
+    """Test that importing the package and its command line skips the heavy modules."""
+
+    code = ("import sys, email_listener, email_listener.cli\n"
+            "print(sorted(m for m in ('imapclient', 'html2text', 'smtplib', 'ssl')"
+            " if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+            capture_output=True, text=True).stdout
+
+    assert output.strip() == "[]"
@@ -0,0 +1,109 @@
+"""Test suite for the compression module."""
+
+# Imports from other packages
+import pytest
+import socket
+import threading
+import zlib
+# Imports from this package
+from email_listener.compression import DeflateSocket, TransferStats
+
+
+def test_transfer_stats_empty():
+    """Test that new TransferStats start at zero, with no ratios."""
+
+    stats = TransferStats().as_dict()
+    assert (stats["bytes_received"] == 0) and (stats["receive_ratio"] is None)
+
+
+def test_transfer_stats_threads():
+    """Test that counters shared by connections in several threads add up."""
+
+    stats = TransferStats()
+    def send():
+        for _ in range(10000):
+            stats.add(bytes_sent=1, wire_bytes_sent=2)
+    threads = [threading.Thread(target=send) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert (stats.bytes_sent == 80000) and (stats.as_dict()["send_ratio"] == 0.5)
+
+
+def test_deflate_socket_round_trip():
+    """Test that a DeflateSocket compresses sends and decompresses receives."""
+
+    client, server = socket.socketpair()
+    stats = TransferStats()
+    sock = DeflateSocket(client, stats)
+
+    # Send a compressible command from the wrapped side
+    line = b"A001 FETCH 1:* (RFC822)" + b" " * 500 + b"\r\n"
+    sock.sendall(line)
+    received = zlib.decompressobj(-15).decompress(server.recv(65536))
+
+    # Reply from the other side with two compressed lines
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    reply = b"* 1 EXISTS\r\nA001 OK FETCH completed\r\n"
+    server.sendall(compressor.compress(reply) + compressor.flush(zlib.Z_SYNC_FLUSH))
+    file = sock.makefile()
+    lines = [file.readline(), file.readline()]
+
+    client.close()
+    server.close()
+
+    assert ((received == line) and (b"".join(lines) == reply)
+            and (stats.bytes_sent == len(line)) and (stats.wire_bytes_sent < len(line))
+            and (stats.bytes_received == len(reply)))
+
+
+def test_deflate_file_keeps_partial_line():
+    """Test that a non-blocking read keeps a partial line buffered."""
+
+    client, server = socket.socketpair()
+    sock = DeflateSocket(client, TransferStats(), compress=False)
+    file = sock.makefile()
+
+    # Send half a line, and try to read it without blocking
+    server.sendall(b"* 1 EXI")
+    client.setblocking(False)
+    with pytest.raises(BlockingIOError):
+        file.readline()
+
+    # Send the rest of the line, and read it blocking
+    client.setblocking(True)
+    server.sendall(b"STS\r\n")
+    line = file.readline()
+
+    client.close()
+    server.close()
+
+    assert line == b"* 1 EXISTS\r\n"
+
+
+def test_deflate_file_large_literal():
+    """Test that a large literal is read whole, between the lines around it."""
+
+    client, server = socket.socketpair()
+    sock = DeflateSocket(client, TransferStats())
+    file = sock.makefile()
+
+    # Send a FETCH response with a literal larger than a single recv(), from
+    # a thread so the socket buffers don't fill up
+    literal = bytes(range(256)) * 40000
+    reply = (b"* 1 FETCH (BODY[] {" + str(len(literal)).encode() + b"}\r\n"
+            + literal + b")\r\nA001 OK FETCH completed\r\n")
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    sender = threading.Thread(target=server.sendall, args=(compressor.compress(reply)
+            + compressor.flush(zlib.Z_SYNC_FLUSH),))
+    sender.start()
+    received = [file.readline(), file.read(len(literal)), file.readline(),
+            file.readline()]
+    sender.join()
+
+    client.close()
+    server.close()
+
+    assert b"".join(received) == reply and received[1] == literal
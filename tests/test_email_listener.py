@@ -10,6 +10,7 @@ import smtplib, ssl
 from email_listener import EmailListener
 from email_listener.email_responder import EmailResponder
 from email_listener.helpers import get_time
+from email_listener.journal import CheckpointJournal
 
 
 @pytest.fixture
@@ -467,6 +468,122 @@ def test_scrape_options(email_listener, singlepart_email, cleanup):
     assert (len(messages) == 1) and (len(messages2) == 1) and (len(messages3) == 0) and folder_check
 
 
+def test_scrape_journal(email_listener, singlepart_email, cleanup, tmp_path):
+    """Test that a journaled scrape defers the options until acknowledged."""
+
+    # Login, with a journal
+    email_listener.login()
+    email_listener.journal = CheckpointJournal(str(tmp_path / "checkpoint.journal"))
+
+    # Scrape the email, which should leave it unseen until it is acknowledged
+    messages = email_listener.scrape()
+    unseen = email_listener.server.search("UNSEEN")
+    # Scrape again without acknowledging, which should return the email again
+    messages2 = email_listener.scrape()
+    email_listener.acknowledge()
+    # Scrape after acknowledging, which should find nothing
+    messages3 = email_listener.scrape()
+    seen = email_listener.server.search("SEEN")
+
+    # Logout
+    email_listener.journal.close()
+    email_listener.logout()
+
+    # Check that the email was only marked as seen once acknowledged
+    assert ((len(messages) == 1) and (len(unseen) == 1) and (messages2 == messages)
+            and (len(messages3) == 0) and (seen == unseen))
+
+
+def test_scrape_claim(email_listener, singlepart_email, cleanup):
+    """Test that claimed emails are scraped once, and claims from others are skipped."""
+
+    # Login
+    email_listener.login()
+
+    # Claim the email as another listener would, then try to scrape it
+    uids = email_listener.server.search("UNSEEN")
+    claim = "ELClaim_{}".format(int(get_time()))
+    email_listener.server.add_flags(uids, [claim])
+    messages = email_listener.scrape(claim=True)
+
+    # Remove the other claim, then scrape the email, claiming it
+    email_listener.server.remove_flags(uids, [claim])
+    messages2 = email_listener.scrape(claim=True)
+    flags = email_listener.server.get_flags(uids)
+
+    # Logout
+    email_listener.logout()
+
+    # Check that the email was only scraped once claimable, and that the claim
+    # was removed afterwards.
+    assert ((len(messages) == 0) and (len(messages2) == 1)
+            and not any(flag.startswith(b"ELClaim_")
+                    for flag_list in flags.values() for flag in flag_list))
+
+
+def test_drain_backlog_invalid_server(email_listener):
+    """Check that drain_backlog() raises a ValueError when EmailListener isn't logged in."""
+
+    # Check that the error is raised
+    with pytest.raises(ValueError) as err:
+        email_listener.drain_backlog()
+
+
+def test_drain_backlog(email_listener, singlepart_email, multipart_email, cleanup):
+    """Test that drain_backlog() scrapes every email over multiple connections."""
+
+    # Login
+    email_listener.login()
+
+    # Drain the emails one per chunk over two extra connections, leaving them unread
+    messages = email_listener.drain_backlog(connections=2, chunk_size=1, unread=True)
+
+    # Check that both emails are still unread
+    unseen = email_listener.server.search("UNSEEN")
+
+    # Logout
+    email_listener.logout()
+
+    # Delete the downloaded attachments
+    for key in messages.keys():
+        for attachment in messages[key].get("attachments") or []:
+            if os.path.exists(attachment):
+                os.remove(attachment)
+
+    # Check that both emails were scraped, with the expected subjects, and that
+    # they are still unread.
+    subjects = [messages[key].get("Subject") for key in messages.keys()]
+    assert (len(messages) == 2) and (subjects == ["EmailListener Test"]*2) and (len(unseen) == 2)
+
+
+def test_scrape_folders_invalid_server(email_listener):
+    """Check that scrape_folders() raises a ValueError when EmailListener isn't logged in."""
+
+    # Check that the error is raised
+    with pytest.raises(ValueError) as err:
+        email_listener.scrape_folders(["email_listener"])
+
+
+def test_scrape_folders(email_listener, singlepart_email, cleanup):
+    """Test that scrape_folders() scrapes changed folders and skips unchanged ones."""
+
+    # Login
+    email_listener.login()
+
+    # Scrape the folder, leaving the email unread so the folder doesn't change
+    first = email_listener.scrape_folders(["email_listener"], unread=True)
+    # Scrape again, which should skip the folder
+    second = email_listener.scrape_folders(["email_listener"], unread=True)
+
+    # Logout
+    email_listener.logout()
+
+    # Check that the email was only scraped the first time, and that the results
+    # are keyed by folder.
+    assert ((list(first.keys()) == ["email_listener"]) and (len(first["email_listener"]) == 1)
+            and (second == {"email_listener": {}}))
+
+
 def test_listen_invalid_server(email_listener):
     """Check that listen() raises a ValueError when EmailListener isn't logged in."""
 
@@ -10,7 +10,9 @@ from email_listener import EmailListener
 from email_listener.email_processing import (
     write_txt_file,
     send_basic_reply,
-    write_json_file
+    write_json_file,
+    load_key_index,
+    WriteError
 )
 
 
@@ -561,3 +563,121 @@ def test_write_json_file_file_exists(email_listener, capsys):
     # the original contents.
     assert (test_out == "File has already been created.") and subject_check and plain_text_check
 
+
+def test_key_index(tmp_path, capsys):
+    """Test that the key index skips written keys, including ones written by others."""
+
+    # Doesn't need a login, so the listener isn't the fixture
+    listener = EmailListener("example@email.com", "badpassword", "email_listener",
+            str(tmp_path))
+    (tmp_path / "old.json").write_text("{}")
+    write_json_file(listener, {'old': {'Subject': 'Do not write'},
+            'new': {'Subject': 'Write'}})
+    # Written by something else after the index was loaded
+    (tmp_path / "other.json").write_text("{}")
+    capsys.readouterr()
+    file_list = write_json_file(listener, {'new': {'Subject': 'Do not write'},
+            'other': {'Subject': 'Do not write'}})
+    test_out = capsys.readouterr().out.split("\n")
+
+    with open(os.path.join(str(tmp_path), "new.json"), 'r') as file:
+        subject = json.load(file)["Subject"]
+
+    assert ((file_list == []) and (test_out.count("File has already been created.") == 2)
+            and (subject == "Write") and ((tmp_path / "other.json").read_text() == "{}"))
+
+
+def test_key_index_manifest(tmp_path):
+    """Test that a manifest is created from a scan, kept up to date, and loaded."""
+
+    listener = EmailListener("example@email.com", "badpassword", "email_listener",
+            str(tmp_path / "files"))
+    os.makedirs(listener.attachment_dir)
+    open(os.path.join(listener.attachment_dir, "old.txt"), 'w').close()
+    manifest = str(tmp_path / "txt.manifest")
+    load_key_index(listener.attachment_dir, ".txt", manifest=manifest)
+    write_txt_file(listener, {'new': {'Subject': 'Write'}})
+    # The manifest is loaded rather than the directory scanned
+    os.remove(os.path.join(listener.attachment_dir, "old.txt"))
+    index = load_key_index(listener.attachment_dir, ".txt", manifest=manifest)
+    index.close()
+
+    with open(manifest, 'r') as file:
+        lines = file.read().split()
+
+    assert (lines == ['old', 'new']) and (index.keys == {'old', 'new'})
+
+
+def test_key_index_manifest_failed(tmp_path):
+    """Test that an email which failed to be written isn't added to the manifest."""
+
+    listener = EmailListener("example@email.com", "badpassword", "email_listener",
+            str(tmp_path / "files"))
+    os.makedirs(listener.attachment_dir)
+    manifest = str(tmp_path / "txt.manifest")
+    load_key_index(listener.attachment_dir, ".txt", manifest=manifest)
+    # A lone surrogate can't be encoded, so the file fails part way through
+    with pytest.raises(UnicodeEncodeError):
+        write_txt_file(listener, {'new': {'Subject': '\ud800'}})
+    # After a restart, the email is written once fixed
+    index = load_key_index(listener.attachment_dir, ".txt", manifest=manifest)
+    file_list = write_txt_file(listener, {'new': {'Subject': 'Write'}})
+    index.close()
+
+    with open(manifest, 'r') as file:
+        lines = file.read().split()
+
+    assert (file_list == [os.path.join(listener.attachment_dir, "new.txt")]
+            and (lines == ['new']))
+
+
+def test_key_index_deleted(tmp_path, capsys):
+    """Test that a file deleted by something else is written again, but only converted then."""
+
+    listener = EmailListener("example@email.com", "badpassword", "email_listener",
+            str(tmp_path))
+    write_json_file(listener, {'deleted': {'Subject': 'Write'},
+            'kept': {'Subject': 'Write'}})
+    os.remove(os.path.join(str(tmp_path), "deleted.json"))
+    capsys.readouterr()
+
+    # Neither message can be converted to JSON, so only a duplicate is skipped
+    unconvertible = object()
+    with pytest.raises(TypeError):
+        write_json_file(listener, {'kept': {'Subject': unconvertible},
+                'deleted': {'Subject': unconvertible}})
+    test_out = capsys.readouterr().out
+    file_list = write_json_file(listener, {'kept': {'Subject': 'Do not write'},
+            'deleted': {'Subject': 'Write again'}})
+
+    with open(os.path.join(str(tmp_path), "deleted.json"), 'r') as file:
+        subject = json.load(file)["Subject"]
+
+    assert ((test_out == "File has already been created.\n")
+            and (file_list == [os.path.join(str(tmp_path), "deleted.json")])
+            and (subject == "Write again"))
+
+
+def test_write_json_file_concurrent(tmp_path):
+    """Test concurrent writes return the files in order, and collect each error."""
+
+    listener = EmailListener("example@email.com", "badpassword", "email_listener",
+            str(tmp_path))
+    msgs = {'{}_sender@email.com'.format(i): {'Subject': 'Test {}'.format(i)}
+            for i in range(20)}
+    # Sets can't be converted to json
+    msgs['5_sender@email.com']['attachments'] = {'a.txt'}
+    msgs['9_sender@email.com']['attachments'] = {'b.txt'}
+
+    with pytest.raises(WriteError) as error:
+        write_json_file(listener, msgs, workers=4)
+    # The failed emails can be written again once fixed
+    msgs['5_sender@email.com']['attachments'] = ['a.txt']
+    retried = write_json_file(listener, {'5_sender@email.com': msgs['5_sender@email.com']})
+
+    expected = [os.path.join(str(tmp_path), '{}_sender@email.com.json'.format(i))
+            for i in range(20) if i not in (5, 9)]
+    assert ((error.value.file_list == expected)
+            and (sorted(error.value.errors) == ['5_sender@email.com', '9_sender@email.com'])
+            and isinstance(error.value.errors['9_sender@email.com'], TypeError)
+            and (retried == [os.path.join(str(tmp_path), '5_sender@email.com.json')]))
@@ -0,0 +1,666 @@
+"""Test suite for EmailListener and EmailResponder against the fake servers."""
+
+# Imports from other packages
+import datetime
+import pytest
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+# Imports from this package
+from email_listener import EmailListener
+from email_listener.archive import ArchiveWriter, read_archive
+from email_listener.compression import DeflateFile
+from email_listener.email_responder import EmailResponder
+from email_listener.fake_server import (FakeIMAPServer, FakeSMTPServer,
+        IMAP_CAPABILITIES)
+from email_listener.imap_adapter import server_socket
+from email_listener.instrumentation import PipelineStats
+from email_listener.metrics import ListenerMetrics, ResponderMetrics
+from email_listener.journal import CheckpointJournal, PROCESSED
+from email_listener.latency import LatencyTracker
+from email_listener.raw_store import RawStore
+
+
+EMAIL = "example@email.com"
+PASSWORD = "badpassword"
+
+
+@pytest.fixture
+def imap_server():
+    """Returns a running FakeIMAPServer with an email_listener folder."""
+
+    server = FakeIMAPServer()
+    server.add_account(EMAIL, PASSWORD)
+    server.create_folder(EMAIL, "email_listener")
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def smtp_server(imap_server):
+    """Returns a running FakeSMTPServer, which delivers to the IMAP server."""
+
+    server = FakeSMTPServer(imap_server=imap_server)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def email_listener(imap_server, tmp_path):
+    """Returns an EmailListener logged into the fake IMAP server."""
+
+    listener = EmailListener(EMAIL, PASSWORD, "email_listener", str(tmp_path))
+    listener.login(host=imap_server.host, port=imap_server.port, use_ssl=False)
+    yield listener
+    if listener.server is not None:
+        listener.logout()
+
+
+@pytest.fixture(scope="module")
+def tls_cert(tmp_path_factory):
+    """Returns the paths of a self-signed certificate for 127.0.0.1, and its key."""
+
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed to create a certificate")
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = str(directory / "cert.pem"), str(directory / "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-days", "1", "-subj", "/CN=127.0.0.1", "-addext",
+            "subjectAltName=IP:127.0.0.1", "-keyout", key, "-out", cert],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def deliver(imap_server, count):
+    """Deliver numbered plain text emails into the email_listener folder."""
+
+    for i in range(count):
+        imap_server.deliver(EMAIL, "email_listener", "From: sender{0}@email.com\r\n"
+                "Subject: Test {0}\r\n\r\nBody {0}\r\n".format(i))
+
+
+def test_send_and_scrape(email_listener, smtp_server, imap_server):
+    """Test that an email sent by EmailResponder is scraped by EmailListener."""
+
+    # Send the email to the email_listener folder
+    responder = EmailResponder(EMAIL, PASSWORD)
+    responder.login(host=smtp_server.host, port=smtp_server.port, use_ssl=False)
+    responder.send_singlepart_msg("example+email_listener@email.com",
+            "EmailListener Test", "This is the plain text message.\n")
+    responder.logout()
+
+    messages = email_listener.scrape(move="done")
+
+    assert ((len(smtp_server.messages) == 1) and (len(messages) == 1)
+            and (list(messages.values())[0]["Subject"] == "EmailListener Test")
+            and (len(imap_server.messages(EMAIL, "done")) == 1)
+            and (len(imap_server.messages(EMAIL, "email_listener")) == 0))
+
+
+def test_scrape_options(email_listener, imap_server):
+    """Test that the unread and delete options are applied on the server."""
+
+    deliver(imap_server, 3)
+    messages = email_listener.scrape(unread=True)
+    unseen = email_listener.server.search("UNSEEN")
+    messages2 = email_listener.scrape(delete=True)
+
+    assert ((len(messages) == 3) and (len(unseen) == 3) and (len(messages2) == 3)
+            and (len(imap_server.messages(EMAIL, "Trash")) == 3))
+
+
+def test_reconnect(email_listener, imap_server):
+    """Test that a dropped connection can be replaced, and used to scrape."""
+
+    imap_server.drop_connections()
+    email_listener.reconnect()
+    deliver(imap_server, 1)
+
+    assert len(email_listener.scrape()) == 1
+
+
+def test_reconnect_tls(tls_cert, tmp_path):
+    """Test that reconnecting over TLS resumes the session saved by the first connection."""
+
+    cert, key = tls_cert
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert, key)
+    imap_server = FakeIMAPServer(ssl_context=server_context)
+    imap_server.add_account(EMAIL, PASSWORD)
+    imap_server.create_folder(EMAIL, "email_listener")
+    imap_server.start()
+    try:
+        listener = EmailListener(EMAIL, PASSWORD, "email_listener", str(tmp_path))
+        listener.metrics = ListenerMetrics()
+        listener.login(host=imap_server.host, port=imap_server.port,
+                ssl_context=ssl.create_default_context(cafile=cert))
+        first = server_socket(listener.server).session_reused
+        imap_server.drop_connections()
+        listener.reconnect()
+        resumed = server_socket(listener.server).session_reused
+        deliver(imap_server, 1)
+        messages = listener.scrape()
+        listener.logout()
+    finally:
+        imap_server.stop()
+
+    assert ((first is False) and (resumed is True) and (len(messages) == 1)
+            and (listener.metrics.tls_connections_total.value == 2)
+            and (listener.metrics.tls_resumed_total.value == 1))
+
+
+def test_inbox_name(imap_server, tmp_path):
+    """Test that INBOX is found whatever its case, in every entry point."""
+
+    listener = EmailListener(EMAIL, PASSWORD, "Inbox", str(tmp_path))
+    listener.login(host=imap_server.host, port=imap_server.port, use_ssl=False)
+    inbox = imap_server.create_folder(EMAIL, "inbox")
+    # A delivery while idling is reported to the session with INBOX selected
+    listener.server.idle()
+    imap_server.deliver(EMAIL, "Inbox", "Subject: Inbox\r\n\r\nBody\r\n")
+    responses = listener.server.idle_check(timeout=5)
+    listener.server.idle_done()
+    messages = listener.scrape(move="done")
+    listener.logout()
+
+    assert ((inbox.name == "INBOX") and (len(messages) == 1)
+            and any(response[1] == b'EXISTS' for response in responses)
+            and (imap_server.messages(EMAIL, "Inbox") == []))
+
+
+def test_compression(email_listener, imap_server):
+    """Test that a compressed connection scrapes, and counts its transfers."""
+
+    deliver(imap_server, 2)
+    scraped = email_listener.scrape()
+
+    assert ((len(scraped) == 2) and (email_listener.transfer_stats.bytes_received
+            > email_listener.transfer_stats.wire_bytes_received > 0))
+
+
+def test_compression_unsupported(tmp_path):
+    """Test that a connection is left alone if the server can't compress it."""
+
+    server = FakeIMAPServer(capabilities=[capability for capability
+            in IMAP_CAPABILITIES if capability != "COMPRESS=DEFLATE"])
+    server.add_account(EMAIL, PASSWORD)
+    server.create_folder(EMAIL, "email_listener")
+    server.start()
+    listener = EmailListener(EMAIL, PASSWORD, "email_listener", str(tmp_path))
+    listener.login(host=server.host, port=server.port, use_ssl=False)
+    deliver(server, 1)
+    file = listener.server._imap.file
+    scraped = listener.scrape()
+    listener.logout()
+    server.stop()
+
+    assert ((len(scraped) == 1) and (type(file) is not DeflateFile)
+            and (listener.transfer_stats.bytes_received == 0))
+
+
+def test_standby_failover(email_listener, imap_server):
+    """Test that listen() switches to the standby when the connection drops.
+
+    Emails delivered while the connection is down are scraped through the
+    standby connection once it is switched to.
+    """
+
+    class Stop(Exception):
+        pass
+
+    scraped = {}
+
+    def process(listener, msg_dict):
+        scraped.update(msg_dict)
+        if len(scraped) == 2:
+            raise Stop
+
+    def outage():
+        # Wait for the standby to be built, then drop only the main connection
+        while email_listener.standby is None:
+            time.sleep(0.01)
+        standbys.append(email_listener.standby)
+        time.sleep(0.2)
+        imap_server.drop_connections(
+                server_socket(email_listener.server).getsockname())
+        deliver(imap_server, 2)
+
+    standbys = []
+    thread = threading.Thread(target=outage, daemon=True)
+    thread.start()
+    with pytest.raises(Stop):
+        email_listener.listen(1, process_func=process, standby=True)
+    thread.join()
+
+    assert (email_listener.server is standbys[0]) and (len(scraped) == 2)
+
+
+def test_poll(email_listener, imap_server):
+    """Test that poll() only scrapes when the folder's counters change.
+
+    Emails are delivered between two polls, and are scraped once. Polls with
+    unchanged counters, including the one after the scrape itself, scrape
+    nothing.
+    """
+
+    class Stop(Exception):
+        pass
+
+    folder_status = email_listener.server.folder_status
+    statuses = []
+
+    def status(folder, what=None):
+        # Deliver after the first poll, and stop after the poll that follows
+        # the scrape
+        if len(statuses) == 5:
+            raise Stop
+        statuses.append(folder_status(folder, what))
+        if len(statuses) == 2:
+            deliver(imap_server, 2)
+        return statuses[-1]
+
+    scrape = email_listener.scrape
+    scrapes = []
+
+    def counted_scrape(*args, **kwargs):
+        scrapes.append(scrape(*args, **kwargs))
+        return scrapes[-1]
+
+    email_listener.server.folder_status = status
+    email_listener.scrape = counted_scrape
+    with pytest.raises(Stop):
+        email_listener.poll(1, process_func=lambda listener, msgs: None,
+                min_interval=0.01, max_interval=0.01)
+
+    # The statuses are the initial one, an unchanged poll, the poll after the
+    # delivery, the one after the scrape, and an unchanged poll
+    assert ((len(scrapes) == 1) and (len(scrapes[0]) == 2)
+            and (statuses[0] == statuses[1]) and (statuses[1] != statuses[2])
+            and (statuses[3] == statuses[4]))
+
+
+def test_watch_notify(email_listener, imap_server):
+    """Test that watch() scrapes an email delivered to another folder over NOTIFY."""
+
+    class Stop(Exception):
+        pass
+
+    imap_server.create_folder(EMAIL, "other")
+    scraped = []
+
+    def process(listener, msg_dict):
+        scraped.append((listener.folder, msg_dict))
+        raise Stop
+
+    def arrive():
+        # Give the listener time to set up NOTIFY and start idling
+        time.sleep(0.5)
+        imap_server.deliver(EMAIL, "other", "From: sender@email.com\r\n"
+                "Subject: Other\r\n\r\nBody\r\n")
+
+    thread = threading.Thread(target=arrive, daemon=True)
+    thread.start()
+    with pytest.raises(Stop):
+        email_listener.watch(["other"], 1, process_func=process)
+    thread.join()
+
+    assert ((len(scraped) == 1) and (scraped[0][0] == "other")
+            and (list(scraped[0][1].values())[0]["Subject"] == "Other")
+            and (email_listener.folder == "email_listener"))
+
+
+@pytest.mark.parametrize("status", ["NO", "BAD"])
+def test_watch_notify_refused(email_listener, imap_server, monkeypatch, status):
+    """Test that watch() sweeps with STATUS if the server refuses NOTIFY."""
+
+    from email_listener import fake_server
+
+    class Stop(Exception):
+        pass
+
+    def cmd_notify(session, tag, args, uid, arrived):
+        raise fake_server._CommandError(status, "NOTIFY refused")
+    monkeypatch.setattr(fake_server._IMAPSession, "cmd_notify", cmd_notify)
+    imap_server.create_folder(EMAIL, "other")
+    scraped = []
+
+    def process(listener, msg_dict):
+        scraped.append((listener.folder, msg_dict))
+        raise Stop
+
+    def arrive():
+        # Give the listener time to record where the folders start
+        time.sleep(0.5)
+        imap_server.deliver(EMAIL, "other", "From: sender@email.com\r\n"
+                "Subject: Other\r\n\r\nBody\r\n")
+
+    thread = threading.Thread(target=arrive, daemon=True)
+    thread.start()
+    with pytest.raises(Stop):
+        email_listener.watch(["other"], 1, process_func=process, min_interval=0.1)
+    thread.join()
+
+    assert ((len(scraped) == 1) and (scraped[0][0] == "other")
+            and (list(scraped[0][1].values())[0]["Subject"] == "Other"))
+
+
+def test_scrape_folders(email_listener, imap_server):
+    """Test that scrape_folders() only scrapes changed folders.
+
+    Checking an unchanged set of folders pipelines their STATUS commands, so
+    takes one round trip rather than one per folder.
+    """
+
+    folders = ["folder{}".format(i) for i in range(6)]
+    for folder in folders:
+        imap_server.create_folder(EMAIL, folder)
+    imap_server.deliver(EMAIL, "folder1", "Subject: First\r\n\r\nBody\r\n")
+    first = email_listener.scrape_folders(folders)
+    imap_server.deliver(EMAIL, "folder4", "Subject: Second\r\n\r\nBody\r\n")
+    second = email_listener.scrape_folders(folders)
+
+    # Time a check of the unchanged folders, with a noticeable round trip
+    imap_server.latency = 0.1
+    start = time.perf_counter()
+    third = email_listener.scrape_folders(folders)
+    elapsed = time.perf_counter() - start
+
+    assert ([folder for folder in folders if first[folder]] == ["folder1"]
+            and [folder for folder in folders if second[folder]] == ["folder4"]
+            and not any(third.values()) and (elapsed < 0.3))
+
+
+def test_drain_backlog(email_listener, imap_server):
+    """Test that a drained backlog is processed a chunk at a time, before its options."""
+
+    deliver(imap_server, 7)
+    batches = []
+    def process(listener, msgs):
+        # The chunk's emails haven't been moved yet
+        batches.append((len(msgs), len(imap_server.messages(EMAIL, "email_listener"))))
+    count = email_listener.drain_backlog(connections=2, chunk_size=2, move="done",
+            process_func=process)
+
+    assert ((count == 7) and (sum(size for size, _ in batches) == 7)
+            and (len(batches) == 4)
+            and all(left >= size for size, left in batches)
+            and (len(imap_server.messages(EMAIL, "done")) == 7)
+            and (len(imap_server.messages(EMAIL, "email_listener")) == 0))
+
+
+def test_drain_backlog_threads(email_listener, imap_server, monkeypatch):
+    """Test that a drain parses and records its emails in the calling thread.
+
+    Only the fetches run on the extra connections' threads, and their
+    transfers are added to the listener's counters.
+    """
+
+    import email_listener.listener as listener_module
+
+    deliver(imap_server, 6)
+    threads = []
+    parse_message = listener_module.parse_message
+    def parse(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return parse_message(*args, **kwargs)
+    monkeypatch.setattr(listener_module, "parse_message", parse)
+    email_listener.stats = PipelineStats()
+    email_listener.latency = LatencyTracker()
+    received = email_listener.transfer_stats.bytes_received
+    email_listener.drain_backlog(connections=3, chunk_size=2,
+            process_func=lambda listener, msgs: None)
+
+    assert ((len(threads) == 6)
+            and all(thread is threading.current_thread() for thread in threads)
+            and (email_listener.stats.totals["fetch"]["emails"] == 6)
+            and (email_listener.latency.summary()["detect_to_processed"]["count"]
+                    == 6)
+            and (email_listener.transfer_stats.bytes_received - received
+                    > sum(len(message.raw) for message in imap_server.messages(EMAIL,
+                    "email_listener"))))
+
+
+def test_drain_backlog_unread(email_listener, imap_server):
+    """Test that a drained backlog is returned without a process function."""
+
+    deliver(imap_server, 5)
+    messages = email_listener.drain_backlog(connections=3, chunk_size=1, unread=True)
+
+    assert ((len(messages) == 5)
+            and (len(email_listener.server.search("UNSEEN")) == 5))
+
+
+def test_journal_resume(email_listener, imap_server, tmp_path):
+    """Test that emails scraped but not acknowledged before a crash are scraped again."""
+
+    deliver(imap_server, 2)
+    journal_path = str(tmp_path / "checkpoint.journal")
+    email_listener.journal = CheckpointJournal(journal_path)
+    messages = email_listener.scrape(move="done")
+    # Crash before acknowledging, by dropping the listener
+    email_listener.journal.close()
+    email_listener.logout()
+
+    # Start again, with the same journal
+    email_listener.login(host=imap_server.host, port=imap_server.port, use_ssl=False)
+    email_listener.journal = CheckpointJournal(journal_path)
+    messages2 = email_listener.scrape(move="done")
+    email_listener.acknowledge()
+    email_listener.journal.close()
+
+    assert ((messages2 == messages) and (len(messages) == 2)
+            and (len(imap_server.messages(EMAIL, "done")) == 2))
+
+
+def test_claim_shared_folder(email_listener, imap_server, tmp_path):
+    """Test that two listeners claiming from one folder never scrape the same email."""
+
+    deliver(imap_server, 20)
+    other = EmailListener(EMAIL, PASSWORD, "email_listener", str(tmp_path))
+    other.login(host=imap_server.host, port=imap_server.port, use_ssl=False)
+    email_listener.claim_batch_size = other.claim_batch_size = 5
+
+    scraped = []
+    while imap_server.messages(EMAIL, "email_listener"):
+        for listener in (email_listener, other):
+            scraped.extend(listener.scrape(move="done", claim=True))
+    other.logout()
+
+    assert (len(scraped) == 20) and (len(set(scraped)) == 20)
+
+
+def test_claim_unread_invalid(email_listener, imap_server):
+    """Test that claiming with unread is refused unless the emails leave the folder.
+
+    Otherwise the emails would be left unseen and unclaimed, and be claimed
+    again by every scrape.
+    """
+
+    deliver(imap_server, 2)
+    with pytest.raises(ValueError):
+        email_listener.scrape(unread=True, claim=True)
+    with pytest.raises(ValueError):
+        email_listener.listen(1, unread=True, claim=True)
+    messages = email_listener.scrape(move="done", unread=True, claim=True)
+
+    assert ((len(messages) == 2) and all("\\Seen" not in message.flags
+            for message in imap_server.messages(EMAIL, "done")))
+
+
+def test_claim_stale(email_listener, imap_server, tmp_path):
+    """Test that emails claimed by a listener which stops are left unseen.
+
+    Once the claims are stale, another listener claims and scrapes them.
+    """
+
+    deliver(imap_server, 3)
+    # Stop before executing the options, as if the listener had crashed
+    def crash(*args, **kwargs):
+        raise OSError("crashed")
+    email_listener._EmailListener__execute_options = crash
+    with pytest.raises(OSError):
+        email_listener.scrape(move="done", claim=True)
+    unseen = email_listener.server.search("UNSEEN")
+
+    other = EmailListener(EMAIL, PASSWORD, "email_listener", str(tmp_path))
+    other.login(host=imap_server.host, port=imap_server.port, use_ssl=False)
+    other.claim_timeout = 0
+    messages = other.scrape(move="done", claim=True)
+    other.logout()
+
+    assert ((len(unseen) == 3) and (len(messages) == 3)
+            and not any(flag.startswith("ELClaim_") for message
+                    in imap_server.messages(EMAIL, "done") for flag in message.flags))
+
+
+def test_claim_journal_resume(email_listener, imap_server, tmp_path):
+    """Test that claims are released from emails processed before a crash."""
+
+    deliver(imap_server, 2)
+    journal_path = str(tmp_path / "checkpoint.journal")
+    email_listener.journal = CheckpointJournal(journal_path)
+    messages = email_listener.scrape(claim=True)
+    # Crash after processing, but before acknowledging
+    uids = email_listener.server.search("ALL")
+    uidvalidity = email_listener.server.folder_status("email_listener",
+            ['UIDVALIDITY'])[b'UIDVALIDITY']
+    email_listener.journal.record("email_listener", uidvalidity, uids, PROCESSED)
+    email_listener.journal.close()
+    email_listener.logout()
+
+    # Start again, with the same journal
+    email_listener.login(host=imap_server.host, port=imap_server.port, use_ssl=False)
+    email_listener.journal = CheckpointJournal(journal_path)
+    messages2 = email_listener.scrape(claim=True)
+    email_listener.journal.close()
+    flags = [message.flags for message in imap_server.messages(EMAIL,
+            "email_listener")]
+
+    assert ((len(messages) == 2) and (messages2 == {})
+            and all("\\Seen" in message_flags for message_flags in flags)
+            and not any(flag.startswith("ELClaim_")
+                    for message_flags in flags for flag in message_flags))
+
+
+def test_scrape_stats(email_listener, imap_server):
+    """Test that a scrape with stats records its cycle and the stages in it."""
+
+    deliver(imap_server, 3)
+    email_listener.stats = PipelineStats()
+    cycles = []
+    email_listener.stats.callbacks.append(cycles.append)
+    email_listener.scrape(move="done")
+    stages = email_listener.stats.last_cycle["stages"]
+
+    assert ((len(cycles) == 1) and (cycles[0]["kind"] == "scrape")
+            and (stages["search"]["emails"] == 3)
+            and (stages["fetch"]["emails"] == 3) and (stages["fetch"]["bytes"] > 0)
+            and (stages["parse"]["calls"] == 3)
+            and (stages["execute_options"]["emails"] == 3))
+
+
+def test_metrics(email_listener, smtp_server, imap_server, tmp_path):
+    """Test that sending, scraping and processing emails are counted."""
+
+    responder = EmailResponder(EMAIL, PASSWORD)
+    responder.metrics = ResponderMetrics()
+    responder.login(host=smtp_server.host, port=smtp_server.port, use_ssl=False)
+    responder.send_singlepart_msg("example+email_listener@email.com",
+            "EmailListener Test", "This is the plain text message.\n")
+    responder.logout()
+    deliver(imap_server, 1)
+
+    # Poll through a journal, which scrapes and processes the emails first
+    email_listener.metrics = metrics = ListenerMetrics()
+    email_listener.journal = CheckpointJournal(str(tmp_path / "checkpoint.journal"))
+    email_listener.poll(0, process_func=lambda listener, msgs: None)
+    email_listener.journal.close()
+
+    assert ((responder.metrics.sent_total.value == 1)
+            and (metrics.emails_total.value == 2)
+            and (metrics.processed_total.value == 2)
+            and (metrics.delivery_delay_seconds.count == 2)
+            and (metrics.queue_depth.value == 0)
+            and (metrics.fetched_bytes_total.value > 0))
+
+
+def test_latency(email_listener, imap_server, tmp_path):
+    """Test that INTERNALDATE is attached to each email and its latency tracked."""
+
+    delivered = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            seconds=30)
+    imap_server.deliver(EMAIL, "email_listener", "From: sender@email.com\r\n"
+            "Subject: Test\r\n\r\nBody\r\n", internal_date=delivered)
+
+    # Poll through a journal, which scrapes and processes the emails first
+    email_listener.latency = LatencyTracker()
+    email_listener.journal = CheckpointJournal(str(tmp_path / "checkpoint.journal"))
+    scraped = []
+    email_listener.poll(0, process_func=lambda listener, msgs: scraped.append(msgs))
+    email_listener.journal.close()
+
+    internal_date = datetime.datetime.fromisoformat(
+            list(scraped[0].values())[0]["Internal_Date"])
+    summary = email_listener.latency.summary()
+    assert ((abs((internal_date - delivered).total_seconds()) < 1)
+            and (29 <= summary["delivery_to_detect"]["p50"] < 60)
+            and (summary["detect_to_processed"]["count"] == 1)
+            and (summary["delivery_to_processed"]["p99"]
+                    >= summary["delivery_to_detect"]["p99"]))
+
+
+def test_raw_archive(email_listener, imap_server, tmp_path):
+    """Test that the raw source of each scraped email is archived."""
+
+    deliver(imap_server, 2)
+    path = str(tmp_path / "raw.gz")
+    email_listener.raw_archive = ArchiveWriter(path)
+    msgs = email_listener.scrape()
+    # The archive can be read before it is closed, as each scrape is flushed
+    entries = list(read_archive(path))
+    email_listener.raw_archive.close()
+
+    assert (([entry["key"] for entry in entries] == list(msgs))
+            and (entries[0]["folder"] == "email_listener")
+            and (entries[0]["raw"].startswith(b"From: sender0@email.com"))
+            and (entries[1]["internal_date"] == msgs[entries[1]["key"]]["Internal_Date"]))
+
+
+def test_raw_store(email_listener, imap_server, tmp_path):
+    """Test that scraped emails are stored, and parsed again the same."""
+
+    deliver(imap_server, 2)
+    email_listener.raw_store = store = RawStore(str(tmp_path / "raw"))
+    msgs = email_listener.scrape()
+    uidvalidity = email_listener.server.folder_status("email_listener",
+            ["UIDVALIDITY"])[b"UIDVALIDITY"]
+    reparsed = dict(store.parse("email_listener", uidvalidity, uid, str(tmp_path))
+            for uid in store.uids("email_listener", uidvalidity))
+    store.close()
+
+    # INTERNALDATE comes from the server, so it isn't in the stored source
+    for val_dict in msgs.values():
+        del val_dict["Internal_Date"]
+    assert (len(reparsed) == 2) and (reparsed == msgs)
+
+
+def test_raw_store_folders(email_listener, imap_server, tmp_path):
+    """Test that one raw store keeps emails apart in folders sharing a UIDVALIDITY."""
+
+    folders = ["folder0", "folder1"]
+    for i, folder in enumerate(folders):
+        # Some servers give every folder the same UIDVALIDITY
+        imap_server.create_folder(EMAIL, folder).uidvalidity = 7
+        imap_server.deliver(EMAIL, folder,
+                "Subject: Folder {}\r\n\r\nBody\r\n".format(i))
+    email_listener.raw_store = store = RawStore(str(tmp_path / "raw"))
+    email_listener.scrape_folders(folders)
+    subjects = [store.parse(folder, 7, 1, str(tmp_path))[1]["Subject"]
+            for folder in folders]
+    store.close()
+
+    assert subjects == ["Folder 0", "Folder 1"]
@@ -6,6 +6,8 @@ import pytest
 import time
 # Import from this package
 from email_listener.helpers import (
+    calc_backoff,
+    calc_poll_interval,
     calc_timeout,
     get_time
 )
@@ -83,3 +85,23 @@ def test_get_time():
     # and rounding errors
     assert abs(now - test) <= 1
 
+
+def test_calc_backoff():
+    """Test that retry delays start at zero, then double up to the maximum."""
+
+    delays = [calc_backoff(attempt, base=1, maximum=5) for attempt in range(5)]
+    assert delays == [0, 1, 2, 4, 5]
+
+
+def test_calc_poll_interval():
+    """Test that polling tightens on changes and backs off when quiet, within bounds."""
+
+    # Changes halve the interval, down to the minimum
+    tighter = calc_poll_interval(60, True, 5, 300)
+    shortest = calc_poll_interval(6, True, 5, 300)
+    # No changes grow the interval by half, up to the maximum
+    looser = calc_poll_interval(60, False, 5, 300)
+    longest = calc_poll_interval(250, False, 5, 300)
+
+    assert (tighter == 30) and (shortest == 5) and (looser == 90) and (longest == 300)
+
@@ -0,0 +1,36 @@
+"""Test suite for the imap_adapter module."""
+
+# Imports from other packages
+import imapclient
+# Imports from this package
+from email_listener import imap_adapter
+from email_listener.imap_adapter import folder_key, folder_name, supported_version
+
+
+def test_supported_version(monkeypatch):
+    """Test that only IMAPClient versions in the tested range are used."""
+
+    results = []
+    for version in [(2, 0, 0), (2, 1, 0), (4, 1, 0), (5, 0, 0)]:
+        monkeypatch.setattr(imapclient, "version_info", version + ("final",))
+        results.append(supported_version())
+
+    assert results == [False, True, True, False]
+
+
+def test_folder_names():
+    """Test that folder names parsed from responses are decoded and matched."""
+
+    assert ((folder_name(b"&AOk-t&AOk-") == "été")
+            and (folder_name(2024) == "2024")
+            and (folder_key(b"Inbox") == b"INBOX") and (folder_key(2024) == b"2024"))
+
+
+def test_parse_statuses():
+    """Test that untagged STATUS responses are keyed by folder."""
+
+    statuses = imap_adapter.parse_statuses([b'"Sent Items" (MESSAGES 3 UIDNEXT 7)',
+            b'inbox (UNSEEN 1)'])
+
+    assert statuses == {b"Sent Items": {b"MESSAGES": 3, b"UIDNEXT": 7},
+            b"INBOX": {b"UNSEEN": 1}}
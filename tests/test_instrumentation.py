@@ -0,0 +1,55 @@
+"""Test suite for the instrumentation module."""
+
+# Imports from this package
+from email_listener.instrumentation import PipelineStats
+
+
+def test_nested_cycles():
+    """Test that a cycle begun inside another is counted as part of it."""
+
+    stats = PipelineStats()
+    stats.begin("idle", "Inbox")
+    stats.add("idle_wait", 2.0)
+    stats.begin("scrape", "Inbox")
+    stats.add("fetch", 0.5, 100, 2)
+    stats.end()
+    stats.add("process_func", 0.25, emails=2)
+    stats.end()
+
+    cycle = stats.last_cycle
+    assert ((stats.cycles == 1) and (cycle["kind"] == "idle")
+            and (sorted(cycle["stages"]) == ["fetch", "idle_wait", "process_func"])
+            and (cycle["stages"]["fetch"]["bytes"] == 100))
+
+
+def test_totals_outside_cycle():
+    """Test that stages added outside a cycle still count towards the totals."""
+
+    stats = PipelineStats()
+    stats.add("parse", 0.1, 50, 1)
+    stats.add("parse", 0.2, 70, 1)
+
+    totals = stats.as_dict()
+    assert ((totals["cycles"] == 0) and (stats.last_cycle is None)
+            and (totals["stages"]["parse"]["calls"] == 2)
+            and (totals["stages"]["parse"]["bytes"] == 120))
+
+
+def test_html_stages(tmp_path):
+    """Test that parsing an HTML email with an attachment times both stages."""
+
+    from email_listener.parsing import parse_message
+
+    raw = (b"From: somebody@gmail.com\r\nSubject: Test\r\nMIME-Version: 1.0\r\n"
+            b"Content-Type: multipart/mixed; boundary=XX\r\n\r\n--XX\r\n"
+            b"Content-Type: text/html\r\n\r\n<p>Hello</p>\r\n--XX\r\n"
+            b"Content-Type: application/octet-stream\r\n"
+            b"Content-Disposition: attachment; filename=a.bin\r\n\r\n"
+            b"data\r\n--XX--\r\n")
+    stats = PipelineStats()
+    parse_message(1, raw, str(tmp_path), stats)
+
+    stages = stats.as_dict()["stages"]
+    assert ((stages["parse"]["bytes"] == len(raw))
+            and (stages["html2text"]["calls"] == 1)
+            and (stages["attachment_write"]["calls"] == 1))
@@ -0,0 +1,71 @@
+"""Test suite for the journal module."""
+
+# Imports from other packages
+import os
+# Imports from this package
+from email_listener.journal import (
+    ACKNOWLEDGED,
+    CheckpointJournal,
+    FETCHED,
+    PROCESSED,
+)
+
+
+def test_journal_record(tmp_path):
+    """Test that recorded states are kept, and the highest UID is tracked."""
+
+    journal = CheckpointJournal(str(tmp_path / "checkpoint.journal"))
+    journal.record("Inbox", 7, [1, 2, 3], FETCHED)
+    journal.record("Inbox", 7, [1, 2], PROCESSED)
+    journal.record("Inbox", 7, [1], ACKNOWLEDGED)
+    journal.close()
+
+    assert ((journal.uids("Inbox", 7, FETCHED) == [3])
+            and (journal.uids("Inbox", 7, PROCESSED) == [2])
+            and (journal.uids("Inbox", 7, ACKNOWLEDGED) == [1])
+            and (journal.last_uid("Inbox", 7) == 3)
+            and (journal.last_uid("Inbox", 8) is None))
+
+
+def test_journal_resume(tmp_path):
+    """Test that reopening a journal replays it, ignoring a partly written line."""
+
+    path = str(tmp_path / "checkpoint.journal")
+    journal = CheckpointJournal(path)
+    journal.record("Inbox", 7, [1, 2], FETCHED)
+    journal.record("Inbox", 7, [1], PROCESSED)
+    journal.close()
+
+    # Leave half a record at the end, as a crash would
+    with open(path, "a") as file:
+        file.write('{"folder": "Inbox", "uidval')
+
+    journal = CheckpointJournal(path)
+    journal.record("Inbox", 7, [1], ACKNOWLEDGED)
+    journal.close()
+    journal = CheckpointJournal(path)
+    journal.close()
+
+    assert ((journal.uids("Inbox", 7, FETCHED) == [2])
+            and (journal.uids("Inbox", 7, ACKNOWLEDGED) == [1]))
+
+
+def test_journal_compact(tmp_path):
+    """Test that compacting drops acknowledged emails but keeps the highest UID."""
+
+    path = str(tmp_path / "checkpoint.journal")
+    journal = CheckpointJournal(path)
+    journal.record("Inbox", 7, [1, 2, 3, 4], FETCHED)
+    journal.record("Inbox", 7, [1, 2, 4], ACKNOWLEDGED)
+    size = os.path.getsize(path)
+    journal.compact()
+    journal.close()
+
+    # Check that the compacted journal replays to the same state
+    journal = CheckpointJournal(path)
+    journal.close()
+
+    assert ((os.path.getsize(path) < size)
+            and (journal.uids("Inbox", 7, FETCHED) == [3])
+            and (journal.uids("Inbox", 7, ACKNOWLEDGED) == [4])
+            and (journal.last_uid("Inbox", 7) == 4))
@@ -0,0 +1,94 @@
+"""Test suite for the jsonl_sink module."""
+
+# Imports from other packages
+import os
+import pytest
+# Imports from this package
+from email_listener.jsonl_sink import JSONLSink
+
+
+def make_msgs(start, count):
+    """Returns a dictionary of simple emails, in the format scrape() returns."""
+
+    return {"{}_sender@email.com".format(i): {"Subject": "Test {}".format(i),
+            "Plain_Text": "Body {}\n".format(i)} for i in range(start, start + count)}
+
+
+def test_write_and_get(tmp_path):
+    """Test that written emails are compact lines that can be read back by key."""
+
+    sink = JSONLSink(str(tmp_path))
+    written = sink.write(make_msgs(0, 3), "Inbox")
+    sink.write({"1_sender@email.com": {"Subject": "Updated"}}, "Inbox")
+    record = sink.get("Inbox", "2_sender@email.com")
+    updated = sink.get("Inbox", "1_sender@email.com")
+    sink.close()
+    with open(sink.segment_path(0), "r") as file:
+        lines = file.read().splitlines()
+
+    assert ((len(written) == 3) and (len(lines) == 4) and (", " not in lines[0])
+            and (record == {"key": "2_sender@email.com", "folder": "Inbox",
+                    "data": {"Subject": "Test 2", "Plain_Text": "Body 2\n"}})
+            and (updated["data"] == {"Subject": "Updated"})
+            and (sink.get("Inbox", "9_sender@email.com") is None))
+
+
+def test_rotation(tmp_path):
+    """Test that segments are rotated by size, and every email stays readable."""
+
+    sink = JSONLSink(str(tmp_path), max_bytes=200, fsync="records", fsync_records=2)
+    sink.write(make_msgs(0, 10))
+    subjects = [sink.get(folder, key)["data"]["Subject"]
+            for folder, key in sink.keys()]
+    sink.close()
+    segments = [name for name in os.listdir(str(tmp_path)) if name.endswith(".jsonl")]
+
+    assert ((len(segments) > 1) and all(os.path.getsize(os.path.join(str(tmp_path),
+            name)) < 400 for name in segments)
+            and (subjects == ["Test {}".format(i) for i in range(10)]))
+
+
+def test_recovery(tmp_path):
+    """Test that reopening indexes unindexed lines and drops a torn last line."""
+
+    sink = JSONLSink(str(tmp_path))
+    sink.write(make_msgs(0, 2))
+    sink.close()
+    # Append an email the index never saw, then half of another
+    with open(sink.segment_path(0), "ab") as file:
+        file.write(b'{"key":"5_sender@email.com","folder":null,"data":{}}\n{"key":"6_')
+
+    sink = JSONLSink(str(tmp_path))
+    sink.write(make_msgs(7, 1))
+    keys = sink.keys()
+    record = sink.get(None, "7_sender@email.com")
+    sink.close()
+
+    assert (([key for folder, key in keys] == ["0_sender@email.com",
+            "1_sender@email.com", "5_sender@email.com", "7_sender@email.com"])
+            and (record["data"]["Subject"] == "Test 7"))
+
+
+def test_same_key_folders(tmp_path):
+    """Test that emails with the same key in two folders are both kept, after reopening."""
+
+    sink = JSONLSink(str(tmp_path))
+    sink.write({"1_sender@email.com": {"Subject": "Inbox"}}, "Inbox")
+    sink.write({"1_sender@email.com": {"Subject": "Archive"}}, "Archive")
+    sink.close()
+    sink = JSONLSink(str(tmp_path))
+    subjects = [sink.get(folder, "1_sender@email.com")["data"]["Subject"]
+            for folder in ("Inbox", "Archive")]
+    keys = sink.keys()
+    sink.close()
+
+    assert ((subjects == ["Inbox", "Archive"])
+            and (keys == [("Inbox", "1_sender@email.com"),
+                    ("Archive", "1_sender@email.com")]))
+
+
+def test_invalid_fsync(tmp_path):
+    """Test that an unknown fsync policy is rejected."""
+
+    with pytest.raises(ValueError):
+        JSONLSink(str(tmp_path), fsync="sometimes")
@@ -0,0 +1,38 @@
+"""Test suite for the latency module."""
+
+# Imports from this package
+from email_listener.latency import LatencyTracker, SlidingWindow
+
+
+def test_percentiles():
+    """Test that percentiles are taken by nearest rank."""
+
+    window = SlidingWindow(window=60)
+    for value in range(1, 101):
+        window.add(float(value), now=1000)
+
+    summary = window.percentiles((50, 90, 99), now=1000)
+    assert summary == {"count": 100, "max": 100.0, "p50": 50.0, "p90": 90.0,
+            "p99": 99.0}
+
+
+def test_window_expiry():
+    """Test that values older than the window, or past the sample limit, are dropped."""
+
+    window = SlidingWindow(window=60, max_samples=3)
+    window.add(1.0, now=1000)
+    window.add(2.0, now=1050)
+    window.add(3.0, now=1070)
+    window.add(4.0, now=1080)
+
+    assert ((window.values(now=1080) == [2.0, 3.0, 4.0])
+            and (window.values(now=1115) == [3.0, 4.0]))
+
+
+def test_empty_summary():
+    """Test that a tracker without values summarizes to empty windows."""
+
+    summary = LatencyTracker().summary()
+
+    assert all((window["count"] == 0) and (window["p99"] is None)
+            for window in summary.values())
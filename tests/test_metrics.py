@@ -0,0 +1,58 @@
+"""Test suite for the metrics module."""
+
+# Imports from other packages
+from urllib.request import urlopen
+# Imports from this package
+from email_listener.metrics import ListenerMetrics, MetricsRegistry
+
+
+def test_render():
+    """Test that counters and histograms are rendered in the Prometheus text format."""
+
+    registry = MetricsRegistry()
+    registry.counter("emails_total", "Emails.", {"folder": "Inbox"}).inc(3)
+    histogram = registry.histogram("delay_seconds", "Delay.", buckets=(1, 5))
+    for value in (0.5, 2, 2, 10):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert (('emails_total{folder="Inbox"} 3' in lines)
+            and ("# TYPE delay_seconds histogram" in lines)
+            and ('delay_seconds_bucket{le="1.0"} 1' in lines)
+            and ('delay_seconds_bucket{le="5.0"} 3' in lines)
+            and ('delay_seconds_bucket{le="+Inf"} 4' in lines)
+            and ("delay_seconds_sum 14.5" in lines)
+            and ("delay_seconds_count 4" in lines))
+
+
+def test_shared_registry():
+    """Test that listeners sharing a registry keep their metrics apart by label."""
+
+    registry = MetricsRegistry()
+    first = ListenerMetrics(registry, {"folder": "a"})
+    second = ListenerMetrics(registry, {"folder": "b"})
+    first.emails_total.inc(2)
+    second.emails_total.inc()
+    again = ListenerMetrics(registry, {"folder": "a"})
+
+    text = registry.render()
+    assert ((again.emails_total is first.emails_total)
+            and ('email_listener_emails_total{folder="a"} 2' in text)
+            and ('email_listener_emails_total{folder="b"} 1' in text))
+
+
+def test_serve():
+    """Test that the metrics are served over HTTP."""
+
+    registry = MetricsRegistry()
+    registry.gauge("queue_depth", "Queue depth.").set(7)
+    server = registry.serve(0)
+    try:
+        url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+        with urlopen(url, timeout=5) as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert "queue_depth 7" in body.splitlines()
@@ -0,0 +1,34 @@
+"""Test suite for the parsing module."""
+
+# Imports from this package
+from email_listener.parsing import parse_message
+
+
+def test_parse_singlepart(tmp_path):
+    """Test that a plain text email is parsed into its key, subject and text."""
+
+    raw = (b"From: Somebody <somebody@gmail.com>\r\nSubject: EmailListener Test \r\n"
+            b"\r\nThis is the plain text message.\r\n")
+    key, val_dict = parse_message(7, raw, str(tmp_path))
+
+    assert ((key == "7_somebody@gmail.com")
+            and (val_dict == {"Subject": "EmailListener Test",
+                    "Plain_Text": "This is the plain text message.\r\n"}))
+
+
+def test_parse_no_subject(tmp_path):
+    """Test that an email without a subject is given a placeholder subject."""
+
+    raw = b"From: somebody@gmail.com\r\n\r\nBody\r\n"
+    key, val_dict = parse_message(8, raw, str(tmp_path))
+
+    assert val_dict["Subject"] == "No Subject"
+
+
+def test_parse_no_from(tmp_path):
+    """Test that an email without a From header is keyed as from an unknown email."""
+
+    raw = b"Subject: Listen Test\r\n\r\nReceived during listen function.\r\n"
+    key, val_dict = parse_message(9, raw, str(tmp_path))
+
+    assert key == "9_UnknownEmail"
@@ -0,0 +1,156 @@
+"""Test suite for the IMAPPipeline class."""
+
+# Imports from other packages
+from imapclient import IMAPClient, SEEN
+import pytest
+# Imports from this package
+from email_listener import EmailListener
+from email_listener import imap_adapter
+from email_listener.fake_server import FakeIMAPServer
+from email_listener.pipeline import IMAPPipeline
+
+
+EMAIL = "example@email.com"
+PASSWORD = "badpassword"
+
+
+@pytest.fixture
+def imap_server():
+    """Returns a running FakeIMAPServer with an email_listener folder."""
+
+    server = FakeIMAPServer()
+    server.add_account(EMAIL, PASSWORD)
+    server.create_folder(EMAIL, "email_listener")
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def email_listener(imap_server, tmp_path):
+    """Returns an EmailListener logged into the fake IMAP server."""
+
+    el = EmailListener(EMAIL, PASSWORD, "email_listener", str(tmp_path))
+    el.login(host=imap_server.host, port=imap_server.port, use_ssl=False)
+    yield el
+    el.logout()
+
+
+def deliver(imap_server, count):
+    """Deliver numbered plain text emails into the email_listener folder."""
+
+    for i in range(count):
+        imap_server.deliver(EMAIL, "email_listener", "From: sender{0}@email.com\r\n"
+                "Subject: Pipeline Test {0}\r\n\r\nBody {0}\r\n".format(i))
+
+
+def test_execute_empty(email_listener):
+    """Test that executing an empty pipeline sends nothing and returns no results."""
+
+    pipeline = IMAPPipeline(email_listener.server)
+    assert pipeline.execute() == []
+
+
+def test_execute(email_listener, imap_server):
+    """Test pipelining a FETCH per email together with flag changes."""
+
+    deliver(imap_server, 2)
+    # Queue a FETCH for each email, then mark them both as unread
+    uids = email_listener.server.search("UNSEEN")
+    pipeline = IMAPPipeline(email_listener.server)
+    fetch_indexes = [pipeline.fetch([uid], ['RFC822']) for uid in uids]
+    store_index = pipeline.remove_flags(uids, [SEEN])
+    results = pipeline.execute()
+
+    # Each FETCH should only contain its own email
+    fetch_check = all(list(results[i].keys()) == [uid]
+            for i, uid in zip(fetch_indexes, uids))
+    # The STORE should succeed, leaving both emails unread
+    store_check = (results[store_index][0] == 'OK')
+    unseen = email_listener.server.search("UNSEEN")
+
+    assert (len(uids) == 2) and fetch_check and store_check and (unseen == uids)
+
+
+def test_status(email_listener, imap_server):
+    """Test pipelining STATUS commands for several folders, among a FETCH."""
+
+    deliver(imap_server, 2)
+    imap_server.create_folder(EMAIL, "other")
+    imap_server.deliver(EMAIL, "other", "Subject: Other\r\n\r\nBody\r\n")
+    uids = email_listener.server.search("ALL")
+
+    pipeline = IMAPPipeline(email_listener.server)
+    pipeline.status("email_listener", ['MESSAGES', 'UIDNEXT'])
+    pipeline.fetch(uids, ['BODY.PEEK[]'])
+    pipeline.status("other", ['MESSAGES', 'UIDNEXT'])
+    results = pipeline.execute()
+
+    assert ((results[0] == email_listener.server.folder_status("email_listener",
+                ['MESSAGES', 'UIDNEXT']))
+            and (results[0][b'MESSAGES'] == 2) and (list(results[1]) == uids)
+            and (results[2] == {b'MESSAGES': 1, b'UIDNEXT': 2}))
+
+
+def test_execute_depth(email_listener, imap_server):
+    """Test that no more than depth commands are in flight, and every result is kept."""
+
+    deliver(imap_server, 30)
+    uids = email_listener.server.search("ALL")
+
+    # Count the commands in flight
+    imap = email_listener.server._imap
+    command, command_complete = imap._command, imap._command_complete
+    in_flight = [0, 0]
+    def counting_command(*args):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        return command(*args)
+    def counting_complete(*args):
+        in_flight[0] -= 1
+        return command_complete(*args)
+    imap._command, imap._command_complete = counting_command, counting_complete
+
+    pipeline = IMAPPipeline(email_listener.server, depth=4)
+    for uid in uids:
+        pipeline.fetch([uid], ['BODY.PEEK[]'])
+    results = pipeline.execute()
+    del imap._command, imap._command_complete
+
+    assert ((len(uids) == 30) and (in_flight == [0, 4])
+            and ([list(result) for result in results] == [[uid] for uid in uids])
+            and all(result[uid][b'BODY[]'].startswith(b"From: sender")
+                    for uid, result in zip(uids, results)))
+
+
+@pytest.mark.parametrize("unsupported", ["version", "internals"])
+def test_sequential_fallback(email_listener, imap_server, monkeypatch, unsupported):
+    """Test that commands are sent one at a time if IMAPClient's internals can't be used."""
+
+    deliver(imap_server, 2)
+    uids = email_listener.server.search("ALL")
+    if unsupported == "version":
+        monkeypatch.setattr(imap_adapter, "MAX_VERSION", imap_adapter.MIN_VERSION)
+    else:
+        # A private method renamed in an IMAPClient release
+        monkeypatch.delattr(IMAPClient, "_normalise_labels")
+
+    pipeline = IMAPPipeline(email_listener.server)
+    pipeline.fetch(uids, ['BODY.PEEK[]'])
+    pipeline.add_flags(uids, [SEEN])
+    pipeline.move(uids[:1], "missing")
+    pipeline.status("email_listener", ['MESSAGES', 'UNSEEN'])
+    results = pipeline.execute()
+    with pytest.raises(ValueError):
+        pipeline.add_flags(uids, [SEEN], unchanged_since=1)
+
+    assert ((pipeline.internals is None) and (list(results[0]) == uids)
+            and (results[1] == ('OK', b'')) and (results[2][0] == 'NO')
+            and (results[3] == {b'MESSAGES': 2, b'UNSEEN': 0}))
+
+
+def test_depth_invalid(email_listener):
+    """Test that a pipeline needs a depth of at least 1."""
+
+    with pytest.raises(ValueError):
+        IMAPPipeline(email_listener.server, depth=0)
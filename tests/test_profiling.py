@@ -0,0 +1,55 @@
+"""Test suite for the profiling module."""
+
+# Imports from other packages
+import json
+import os
+import pstats
+import tracemalloc
+# Imports from this package
+from email_listener.instrumentation import PipelineStats
+from email_listener.profiling import CycleProfiler
+
+
+def run_cycle(stats, folder):
+    """Run a cycle with a fetch and parse stage, allocating some memory."""
+
+    stats.begin("scrape", folder)
+    data = [bytes(1000) for _ in range(100)]
+    stats.add("fetch", 0.1, len(data) * 1000, 100)
+    stats.add("parse", 0.2, emails=100)
+    stats.end()
+
+
+def test_profile_cycles(tmp_path):
+    """Test that only the armed number of cycles are profiled and dumped."""
+
+    stats = PipelineStats()
+    stats.profiler = profiler = CycleProfiler(str(tmp_path))
+    run_cycle(stats, "Inbox")
+    profiler.arm(2)
+    for _ in range(3):
+        run_cycle(stats, "[Gmail]/All Mail")
+
+    assert ((sorted(os.listdir(str(tmp_path))) == sorted(
+            "_Gmail_All_Mail-cycle{}.{}".format(cycle, ext) for cycle in (1, 2)
+            for ext in ("json", "prof", "tracemalloc")))
+            and (profiler.cycles_left == 0) and not tracemalloc.is_tracing())
+
+
+def test_profile_dump(tmp_path):
+    """Test that the dumped stats can be loaded, and attribute memory to stages."""
+
+    stats = PipelineStats()
+    stats.profiler = profiler = CycleProfiler(str(tmp_path))
+    profiler.arm(1)
+    run_cycle(stats, "Inbox")
+    base = profiler.dumps[0]
+    with open(base + ".json") as file:
+        cycle = json.load(file)
+    snapshot = tracemalloc.Snapshot.load(base + ".tracemalloc")
+
+    assert ((cycle["cycle"] == 1) and (cycle["folder"] == "Inbox")
+            and (cycle["stages"]["fetch"]["growth_bytes"] >= 100000)
+            and (sorted(cycle["stages"]) == ["fetch", "parse"])
+            and (pstats.Stats(base + ".prof").total_calls > 0)
+            and (len(snapshot.traces) > 0))
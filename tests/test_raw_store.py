@@ -0,0 +1,112 @@
+"""Test suite for the raw_store module."""
+
+# Imports from other packages
+import mmap
+import os
+# Imports from this package
+from email_listener import raw_store
+from email_listener.raw_store import RawStore
+
+
+def make_email(i):
+    """Returns the source of a numbered plain text email."""
+
+    return ("From: sender{0}@email.com\r\nSubject: Test {0}\r\n"
+            "Message-ID: <{0}@email.com>\r\n\r\nBody {0}\r\n".format(i)).encode()
+
+
+def test_write_and_get(tmp_path):
+    """Test that emails are read back by UID and Message-ID, and parsed again."""
+
+    store = RawStore(str(tmp_path), max_bytes=100)
+    for uid in range(1, 5):
+        store.write("Inbox", 7, uid, make_email(uid))
+    rewritten = store.write("Inbox", 7, 2, b"Subject: Different\r\n\r\n")
+    key, val_dict = store.parse("Inbox", 7, 3, str(tmp_path))
+
+    results = (len(store), rewritten, bytes(store.get("Inbox", 7, 1)),
+            bytes(store.get_message_id("<4@email.com>")), store.get("Inbox", 8, 1),
+            store.segment_path(1) != store.segment_path(0),
+            os.path.exists(store.segment_path(1)))
+    store.close()
+    assert ((results == (4, False, make_email(1), make_email(4), None, True, True))
+            and (key == "3_sender3@email.com") and (val_dict["Subject"] == "Test 3"))
+
+
+def test_replay(tmp_path):
+    """Test that a range of UIDs is replayed in order, from a reopened store."""
+
+    store = RawStore(str(tmp_path))
+    for uid in (5, 1, 3, 9):
+        store.write("Inbox", 7, uid, make_email(uid))
+    store.write("Inbox", 8, 2, make_email(2))
+    store.close()
+    store = RawStore(str(tmp_path))
+    replayed = [(uid, bytes(raw))
+            for uid, raw in store.replay("Inbox", 7, start=2, stop=5)]
+    store.close()
+
+    assert replayed == [(3, make_email(3)), (5, make_email(5))]
+
+
+def test_crash_recovery(tmp_path):
+    """Test that source written after the last whole index record is discarded."""
+
+    store = RawStore(str(tmp_path))
+    store.write("Inbox", 7, 1, make_email(1))
+    store.write("Inbox", 7, 2, make_email(2))
+    store.close()
+    # A crash part way through writing the second email's index record, after
+    # its source was written
+    index_path = str(tmp_path / "raw.index")
+    with open(index_path, "rb+") as file:
+        file.truncate(os.path.getsize(index_path) - 3)
+
+    store = RawStore(str(tmp_path))
+    store.write("Inbox", 7, 3, make_email(3))
+    results = (len(store), store.get("Inbox", 7, 2), bytes(store.get("Inbox", 7, 3)),
+            os.path.getsize(store.segment_path(0)))
+    store.close()
+    assert results == (2, None, make_email(3), len(make_email(1)) + len(make_email(3)))
+
+
+def test_folders(tmp_path):
+    """Test that emails with the same UIDVALIDITY and UID in two folders are kept apart."""
+
+    store = RawStore(str(tmp_path))
+    store.write("Inbox", 7, 1, make_email(1))
+    written = store.write("Archive", 7, 1, make_email(2))
+    store.close()
+    store = RawStore(str(tmp_path))
+    results = (written, len(store), bytes(store.get("Inbox", 7, 1)),
+            bytes(store.get("Archive", 7, 1)), store.uids("Archive", 7),
+            store.get("Sent", 7, 1))
+    store.close()
+    assert results == (True, 2, make_email(1), make_email(2), [1], None)
+
+
+def test_remap(tmp_path, monkeypatch):
+    """Test that a segment mapped again as it grows unmaps the old map once it is free."""
+
+    maps = []
+    def tracked_mmap(*args, **kwargs):
+        maps.append(mmap.mmap(*args, **kwargs))
+        return maps[-1]
+    monkeypatch.setattr(raw_store, "mmap", type("mmap_module", (),
+            {"mmap": staticmethod(tracked_mmap), "ACCESS_READ": mmap.ACCESS_READ}))
+    store = RawStore(str(tmp_path))
+    store.write("Inbox", 7, 1, make_email(1))
+    held = store.get("Inbox", 7, 1)
+    # Held by a memoryview, so the first map is kept when the segment grows
+    store.write("Inbox", 7, 2, make_email(2))
+    second = bytes(store.get("Inbox", 7, 2))
+    kept = (not maps[0].closed) and (bytes(held) == make_email(1))
+    held.release()
+    # Released, so the first map is closed on the next map, and the second straight away
+    store.write("Inbox", 7, 3, make_email(3))
+    third = bytes(store.get("Inbox", 7, 3))
+    closed = [mapped.closed for mapped in maps]
+    store.close()
+
+    assert ((second == make_email(2)) and (third == make_email(3)) and kept
+            and (closed == [True, True, False]) and maps[2].closed)
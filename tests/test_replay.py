@@ -0,0 +1,96 @@
+"""Test suite for the replay module."""
+
+# Imports from other packages
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import mailbox
+import os
+import pytest
+# Imports from this package
+from email_listener import EmailListener
+from email_listener.parsing import parse_message
+from email_listener.replay import read_source, replay_batches
+
+
+@pytest.fixture
+def raw_emails():
+    """Returns the RFC822 source of five multipart emails, with attachments."""
+
+    raws = []
+    for i in range(5):
+        msg = MIMEMultipart("mixed")
+        msg["From"] = "sender{}@gmail.com".format(i)
+        msg["Subject"] = "EmailListener Test {}".format(i)
+        msg.attach(MIMEText("This is the plain text message.\n"))
+        msg.attach(MIMEText("<p>This is the HTML message.</p>", "html"))
+        attachment = MIMEApplication("Attachment {}".format(i).encode())
+        attachment.add_header("Content-Disposition", "attachment",
+                filename="EmailListener_replay_{}.txt".format(i))
+        msg.attach(attachment)
+        raws.append(msg.as_bytes())
+    return raws
+
+
+def test_read_source(tmp_path, raw_emails):
+    """Test that mbox files, Maildir directories and .eml files are read in order."""
+
+    # Write the emails to an mbox file
+    mbox_path = str(tmp_path / "archive.mbox")
+    box = mailbox.mbox(mbox_path)
+    for raw in raw_emails:
+        box.add(raw)
+    box.close()
+
+    # Write the emails to a Maildir directory
+    maildir = mailbox.Maildir(str(tmp_path / "Maildir"))
+    for raw in raw_emails:
+        maildir.add(raw)
+
+    # Write the emails to .eml files
+    eml_dir = tmp_path / "eml"
+    eml_dir.mkdir()
+    for i, raw in enumerate(raw_emails):
+        (eml_dir / "{}.eml".format(i)).write_bytes(raw)
+
+    subjects = [[parse_message(0, raw, str(tmp_path))[1]["Subject"]
+            for raw in read_source(path)]
+            for path in (mbox_path, str(tmp_path / "Maildir"), str(eml_dir))]
+
+    assert (all(len(read) == 5 for read in subjects)
+            and (subjects[0] == subjects[2])
+            and (sorted(subjects[1]) == subjects[0]))
+
+
+def test_replay_matches_parser(tmp_path, raw_emails):
+    """Test that replaying over several workers gives the same output as parsing."""
+
+    eml_dir = tmp_path / "eml"
+    eml_dir.mkdir()
+    for i, raw in enumerate(raw_emails):
+        (eml_dir / "{}.eml".format(i)).write_bytes(raw)
+
+    expected = dict(parse_message(uid, raw, str(tmp_path))
+            for uid, raw in enumerate(raw_emails, 1))
+    batches = list(replay_batches(str(eml_dir), str(tmp_path), workers=2,
+            batch_size=2))
+    replayed = {}
+    for batch in batches:
+        replayed.update(batch)
+
+    assert ([len(batch) for batch in batches] == [2, 2, 1]) and (replayed == expected)
+
+
+def test_listener_replay(tmp_path, raw_emails):
+    """Test that EmailListener.replay() calls the process function with each batch."""
+
+    eml_path = tmp_path / "single.eml"
+    eml_path.write_bytes(raw_emails[0])
+    listener = EmailListener("example@gmail.com", None, "Inbox", str(tmp_path))
+
+    processed = []
+    count = listener.replay(str(eml_path),
+            process_func=lambda email_listener, msgs: processed.append(msgs))
+
+    assert ((count == 1) and (list(processed[0]) == ["1_sender0@gmail.com"])
+            and os.path.exists(processed[0]["1_sender0@gmail.com"]["attachments"][0]))
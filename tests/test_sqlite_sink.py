@@ -0,0 +1,74 @@
+"""Test suite for the sqlite_sink module."""
+
+# Imports from other packages
+import pytest
+# Imports from this package
+from email_listener import sqlite_sink
+from email_listener.sqlite_sink import SQLiteSink
+
+
+def test_write_and_get(tmp_path):
+    """Test that emails are written, and read back in the format scrape() returns."""
+
+    sink = SQLiteSink(str(tmp_path / "emails.db"))
+    msgs = {"1_sender@email.com": {"Subject": "Test", "Plain_Text": "Body\n",
+            "attachments": ["./files/a.txt"]}}
+    sink.write(msgs, "Inbox")
+    val_dict = sink.get("1_sender@email.com")
+    missing = sink.get("2_sender@email.com")
+    sink.close()
+
+    assert ((val_dict == {"Folder": "Inbox", "Subject": "Test",
+            "Plain_Text": "Body\n", "attachments": ["./files/a.txt"]})
+            and (missing is None))
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_upsert_and_search(tmp_path, monkeypatch, upsert):
+    """Test that a rewritten email replaces the old one, in the table and the index.
+
+    Runs with UPSERT, and with the delete and insert used before SQLite 3.24.
+    """
+
+    monkeypatch.setattr(sqlite_sink, "HAS_UPSERT", upsert and sqlite_sink.HAS_UPSERT)
+    sink = SQLiteSink(str(tmp_path / "emails.db"))
+    sink.write({"1_a@email.com": {"Subject": "Invoice", "Plain_Text": "Pay soon"},
+            "2_b@email.com": {"Subject": "Lunch", "Plain_HTML": "Pizza today"}})
+    sink.write({"1_a@email.com": {"Subject": "Receipt", "Plain_Text": "Paid"}})
+
+    results = (sink.count(), sink.search("invoice"), sink.search("receipt"),
+            sink.search("pizza"))
+    sink.close()
+
+    assert results == (2, [], [(None, "1_a@email.com", "Receipt")],
+            [(None, "2_b@email.com", "Lunch")])
+
+
+def test_same_key_folders(tmp_path):
+    """Test that emails with the same key in different folders are kept apart."""
+
+    sink = SQLiteSink(str(tmp_path / "emails.db"))
+    sink.write({"1_a@email.com": {"Subject": "Inbox invoice"}}, "Inbox")
+    sink.write({"1_a@email.com": {"Subject": "Archived invoice"}}, "Archive")
+
+    results = (sink.count(), sink.get("1_a@email.com", "Inbox")["Subject"],
+            sink.get("1_a@email.com", "Archive")["Subject"],
+            sink.get("1_a@email.com")["Folder"], sorted(sink.search("invoice")))
+    sink.close()
+
+    assert results == (2, "Inbox invoice", "Archived invoice", "Archive",
+            [("Archive", "1_a@email.com", "Archived invoice"),
+             ("Inbox", "1_a@email.com", "Inbox invoice")])
+
+
+def test_reopen(tmp_path):
+    """Test that a reopened database keeps its emails and full-text index."""
+
+    path = str(tmp_path / "emails.db")
+    sink = SQLiteSink(path)
+    sink.write({"1_a@email.com": {"Subject": "Quarterly report"}})
+    sink.close()
+    sink = SQLiteSink(path)
+
+    assert sink.search("quarterly") == [(None, "1_a@email.com", "Quarterly report")]
+    sink.close()
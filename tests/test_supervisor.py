@@ -0,0 +1,230 @@
+"""Test suite for the supervisor module."""
+
+# Imports from other packages
+import json
+import os
+import pytest
+import signal
+import threading
+import time
+# Imports from this package
+from email_listener import supervisor as supervisor_module
+from email_listener.fake_server import FakeIMAPServer
+from email_listener.helpers import calc_backoff
+from email_listener.supervisor import (
+    check_config,
+    listener_counters,
+    listener_paths,
+    load_config,
+    merge_metrics,
+    Supervisor,
+    Worker,
+)
+from email_listener.metrics import ListenerMetrics
+
+
+EMAIL = "example@email.com"
+PASSWORD = "badpassword"
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Returns a supervisor config with three listeners."""
+
+    return {
+        "workers": 2,
+        "attachment_dir": str(tmp_path / "attachments"),
+        "journal_dir": str(tmp_path / "journals"),
+        "listeners": [{"email": "example@gmail.com", "app_password": "badpassword",
+                "folder": folder} for folder in ("Inbox", "Support", "Sales/EU")],
+    }
+
+
+@pytest.fixture
+def imap_server():
+    """Returns a running FakeIMAPServer with an email_listener folder."""
+
+    server = FakeIMAPServer()
+    server.add_account(EMAIL, PASSWORD)
+    server.create_folder(EMAIL, "email_listener")
+    server.start()
+    yield server
+    server.stop()
+
+
+def fake_config(imap_server, tmp_path, password):
+    """Returns a supervisor config with one listener on the fake IMAP server."""
+
+    return {
+        "workers": 1,
+        "attachment_dir": str(tmp_path / "attachments"),
+        "journal_dir": str(tmp_path / "journals"),
+        "metrics_path": str(tmp_path / "metrics.json"),
+        "metrics_interval": 0.1,
+        "listeners": [{"email": EMAIL, "app_password": password,
+                "folder": "email_listener", "host": imap_server.host,
+                "port": imap_server.port, "use_ssl": False}],
+    }
+
+
+def stop_when(condition):
+    """Sends SIGTERM to this process from a thread once a condition holds."""
+
+    def wait():
+        deadline = time.monotonic() + 30
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    thread = threading.Thread(target=wait, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_check_config_duplicate(config):
+    """Test that a listener configured twice is rejected."""
+
+    config["listeners"].append(dict(config["listeners"][0]))
+    with pytest.raises(ValueError):
+        check_config(config)
+
+
+def test_load_config_workers(config, tmp_path):
+    """Test that loading a config limits the workers to the number of listeners."""
+
+    config["workers"] = 16
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    assert load_config(str(path))["workers"] == 3
+
+
+def test_supervisor_shares(config):
+    """Test that every listener is given to exactly one worker, with its own files."""
+
+    supervisor = Supervisor(config)
+    shares = [supervisor.share(index) for index in range(2)]
+    paths = [listener_paths(supervisor.config, spec)
+            for share in shares for spec in share]
+
+    assert ((sorted(len(share) for share in shares) == [1, 2])
+            and (len(set(paths)) == 3)
+            and all(os.path.isdir(attachment_dir) for attachment_dir, _ in paths)
+            and all(os.path.basename(journal_path) != "example@gmail.com_Sales/EU.journal"
+                    for _, journal_path in paths))
+
+
+def test_merge_metrics():
+    """Test that the metrics of each worker are added up, and ratios worked out again."""
+
+    metrics = merge_metrics([
+        {"listeners": {"a": {"emails_processed": 2, "bytes_received": 100,
+                "wire_bytes_received": 50, "receive_ratio": 2.0}}},
+        {"listeners": {"b": {"emails_processed": 3, "bytes_received": 300,
+                "wire_bytes_received": 50, "receive_ratio": 6.0}}},
+    ])
+
+    assert ((metrics["total"]["emails_processed"] == 5)
+            and (metrics["total"]["receive_ratio"] == 4.0)
+            and (sorted(metrics["listeners"]) == ["a", "b"]))
+
+
+def test_listener_counters():
+    """Test that listener metrics are flattened, with histograms as sum and count."""
+
+    metrics = ListenerMetrics()
+    metrics.emails_total.inc(2)
+    metrics.queue_depth.set(3)
+    metrics.scrape_seconds.observe(0.5)
+    metrics.scrape_seconds.observe(1.5)
+    counters = listener_counters(metrics)
+
+    assert ((counters["emails_total"] == 2) and (counters["queue_depth"] == 3)
+            and (counters["scrape_seconds_sum"] == 2.0)
+            and (counters["scrape_seconds_count"] == 2)
+            and ("registry" not in counters) and ("scrape_seconds" not in counters))
+
+
+@pytest.mark.parametrize("cpu_affinity", [False, True])
+def test_worker_affinity(config, tmp_path, monkeypatch, caplog, cpu_affinity):
+    """Test that workers are only pinned to a core if the config asks for it."""
+
+    config["cpu_affinity"] = cpu_affinity
+    config = check_config(config)
+    pinned = []
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: {0, 1}, raising=False)
+    monkeypatch.setattr(os, "sched_setaffinity",
+            lambda pid, cores: pinned.append(cores), raising=False)
+    # A missing password makes the listener fail straight away
+    spec = dict(config["listeners"][0], app_password=None,
+            app_password_env="EL_TEST_MISSING")
+    monkeypatch.delenv("EL_TEST_MISSING", raising=False)
+
+    with caplog.at_level("ERROR", logger="email_listener.supervisor"):
+        code = Worker(config, 1, [spec], str(tmp_path)).run()
+
+    assert ((code == 1) and (pinned == ([{1}] if cpu_affinity else []))
+            and ("failed" in caplog.text))
+
+
+def test_supervisor_restarts(imap_server, tmp_path, monkeypatch):
+    """Test that a worker whose listener fails is restarted, backing off each time."""
+
+    # The wrong password makes the listener fail as soon as it logs in
+    supervisor = Supervisor(fake_config(imap_server, tmp_path, "wrongpassword"))
+    supervisor.poll_interval = 0.02
+    attempts = []
+    def backoff(attempt):
+        attempts.append(attempt)
+        return calc_backoff(attempt)
+    monkeypatch.setattr(supervisor_module, "calc_backoff", backoff)
+    spawn = supervisor._Supervisor__spawn
+    spawned = []
+    def timed_spawn(index):
+        spawned.append(time.monotonic())
+        spawn(index)
+    supervisor._Supervisor__spawn = timed_spawn
+
+    thread = stop_when(lambda: supervisor.restarts >= 3)
+    supervisor.run()
+    thread.join()
+
+    # Each restart waits at least the backoff for the crashes so far
+    gaps = [later - earlier for earlier, later in zip(spawned, spawned[1:])]
+    assert ((supervisor.restarts == 3) and (attempts[:3] == [1, 2, 3])
+            and all(gap >= calc_backoff(attempt)
+                    for gap, attempt in zip(gaps, attempts)))
+
+
+def test_supervisor_shutdown(imap_server, tmp_path):
+    """Test that SIGTERM stops the workers, and the supervisor exits cleanly."""
+
+    imap_server.deliver(EMAIL, "email_listener", "Subject: Test\r\n\r\nBody\r\n")
+    config = fake_config(imap_server, tmp_path, PASSWORD)
+    supervisor = Supervisor(config)
+    supervisor.poll_interval = 0.02
+    pids = []
+    def processed():
+        pids.extend(supervisor.workers.values())
+        return supervisor.metrics()["total"].get("emails_processed") == 1
+
+    # Stop once the worker has scraped the email, which the journal catches
+    # up on when the listener starts
+    thread = stop_when(processed)
+    supervisor.run()
+    thread.join()
+    with open(config["metrics_path"], "r") as file:
+        metrics = json.load(file)
+
+    # Every worker has been reaped
+    reaped = []
+    for pid in set(pids):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            reaped.append(pid)
+
+    assert ((supervisor.workers == {}) and (supervisor.restarts == 0)
+            and (metrics["total"]["emails_processed"] == 1)
+            and (metrics["total"]["emails_total"] == 1)
+            and (metrics["total"]["processed_total"] == 1)
+            and pids and (len(reaped) == len(set(pids))))